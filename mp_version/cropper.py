@@ -1,6 +1,7 @@
 import numpy as np
 import sys
 from detector import Detector
+from ringbuffer import RingBuffer
         
 class Cropper():
     """
@@ -15,78 +16,180 @@ class Cropper():
         при отсутствии срабатывания Detector)
         в) Гарантии отступа от начала воздействия.
     """
-    def __init__(self, indent_time=500, cooling_time=1000, max_time=10000, verbose=False, detector=Detector):
+    def __init__(self, indent_time=500, cooling_time=1000, max_time=10000, verbose=False, detector=Detector,
+                 provisional_interval=None):
         self.indent_time = indent_time # кол-во отсчетов для отступа
         self.max_cooling_time = cooling_time # кол-во отсчетов охлаждения
         self.max_time = max_time # максимальное кол-во отсчетов
         self.detector = detector # Детектор, описанный в классе Detector()
         
-        self.cached_frames = np.array([]) # массив для хранения фреймов
+        # заранее выделенный буфер для набора сигнала тревоги (тип данных как у
+        # входных фреймов), набранный сигнал - это buffer[:cached_len]
+        self.buffer = None
+        self.cached_len = 0
+        # pre-roll: последние indent_time отсчетов перед текущим фреймом
+        # (для отступа, даже если фреймы короче indent_time)
+        self.history = None
         self.alarm_flag = False # флажок сигнализирующий о том что произошла тревога
         self.curr_cooling_time = 0 # текущее время охлаждения
         self.verbose = verbose
-        
-    def indent_first_frame(self, frame_current, frame_previous):
+        # каждые provisional_interval отсчетов еще не закончившейся тревоги
+        # в provisional_signal кладется копия набранного сигнала
+        # (для предварительной классификации), None - выключено
+        self.provisional_interval = provisional_interval
+        self.provisional_signal = None
+        self.next_provisional = provisional_interval
+        self.alarms = 0 # сколько тревог отдано на классификацию
+        # тревоги, которые были бы с шумом детектора из fit (см. track_static_alarm)
+        self.static_alarms = 0
+        self.static_alarm_flag = False
+        self.static_cooling_time = 0
+        self.static_len = 0
+
+    @property
+    def cached_frames(self) -> np.ndarray:
+        """
+        Набранный сигнал тревоги (view на буфер, без копирования)
+        """
+        if self.buffer is None:
+            return np.array([])
+        return self.buffer[:self.cached_len]
+
+    def reserve(self, frame):
+        """
+        Выделение памяти под сигнал: набранный сигнал не может быть длиннее
+        max_time + длина фрейма + отступ. Буфер увеличивается, только если
+        пришел фрейм длиннее прежних (или другого типа данных)
+        """
+        capacity = self.max_time + len(frame) + self.indent_time
+        if self.buffer is None:
+            self.buffer = np.empty(capacity, dtype=frame.dtype)
+        elif len(self.buffer) < capacity or self.buffer.dtype != frame.dtype:
+            buffer = np.empty(max(capacity, len(self.buffer)), dtype=np.result_type(self.buffer, frame))
+            buffer[:self.cached_len] = self.buffer[:self.cached_len]
+            self.buffer = buffer
+
+    def append(self, samples):
+        """
+        Дописать отсчеты в конец набранного сигнала
+        """
+        self.buffer[self.cached_len:self.cached_len + len(samples)] = samples
+        self.cached_len += len(samples)
+
+    def pop(self) -> np.ndarray:
+        """
+        Набранный сигнал (одна копия буфера) с очисткой буфера
+        """
+        result = self.buffer[:self.cached_len].copy()
+        self.cached_len = 0
+        return result
+
+    def remember(self, frame):
+        """
+        Запись фрейма в pre-roll
+        """
+        if self.history is None or self.history.data.dtype != frame.dtype:
+            self.history = RingBuffer(capacity=max(self.indent_time, 1), width=1, dtype=frame.dtype)
+        self.history.append(frame[:, None])
+
+    def track_static_alarm(self, frame_len):
+        """
+        Подсчет тревог, которые выдал бы детектор без адаптации шума
+        (Detector.static_triggered): та же логика событий по длительности
+        тревоги и времени охлаждения, но без набора сигнала.
+        static_alarms - alarms = сколько классификаций сэкономил адаптивный шум
+        """
+        if self.static_len > self.max_time:
+            self.static_alarms += 1
+            self.static_alarm_flag = False
+            self.static_cooling_time = 0
+            self.static_len = 0
+        elif self.detector.static_triggered:
+            if not self.static_alarm_flag:
+                self.static_alarm_flag = True
+                self.static_len = self.indent_time
+            self.static_cooling_time = 0
+            self.static_len += frame_len
+        elif self.static_alarm_flag:
+            if self.static_cooling_time > self.max_cooling_time:
+                self.static_alarms += 1
+                self.static_alarm_flag = False
+                self.static_cooling_time = 0
+                self.static_len = 0
+            else:
+                self.static_cooling_time += frame_len
+                self.static_len += frame_len
+
+    def indent_first_frame(self, frame_current):
         """
         Метод, обеспечивающий отступ в self.indent_time 
         в записи сигнала перед началом воздействия
-        (это гаранирует что будет записано начало воздействия)
-        """
-        frame_max = np.max(frame_current)
-        frame_median = np.median(frame_current)
-        frame_min = np.min(frame_current)
-        # Определяем индекс пика
-        if (frame_max - frame_median) < (frame_median - frame_min):
-            peak_idx = frame_current.argmin()
+        (это гаранирует что будет записано начало воздействия).
+        Начало воздействия - Detector.onset (если детектор его нашел),
+        иначе пик фрейма
+        Returns:
+            tuple[np.ndarray, np.ndarray]: отсчеты из pre-roll перед текущим
+            фреймом и часть текущего фрейма (их склейка - начало сигнала тревоги)
+        """
+        if self.detector.onset is not None:
+            # детектор со скользящим окном сам нашел отсчет начала тревоги
+            peak_idx = self.detector.onset
         else:
-            peak_idx = frame_current.argmax()
+            frame_max = np.max(frame_current)
+            frame_median = np.median(frame_current)
+            frame_min = np.min(frame_current)
+            # Определяем индекс пика
+            if (frame_max - frame_median) < (frame_median - frame_min):
+                peak_idx = frame_current.argmin()
+            else:
+                peak_idx = frame_current.argmax()
         # Определяем логику склейки/обрезки
-        if peak_idx > self.indent_time:
-            return frame_current[peak_idx-self.indent_time:]
+        if peak_idx >= self.indent_time:
+            return frame_current[:0], frame_current[peak_idx-self.indent_time:]
         else:
-            concated_frames = np.concatenate([
-                frame_previous[-(self.indent_time - peak_idx):],
-                frame_current
-            ])
-            return concated_frames
+            previous = self.history.last(self.indent_time - peak_idx)[:, 0]
+            return previous, frame_current
     
     def __call__(self, frame):
         """
         При работе системы, классификатор вызывает в бесконечном цикле
         Каждые 500 мс этот метод. Ниже представлена логика событий, которые
         происходят в зависимости от того, срабатывает или нет детектор
+        Returns:
+            np.ndarray | None: обрезанный сигнал, если тревога закончилась
         """
+        result = None
+        self.provisional_signal = None
         if not self.detector.is_fitted:
             # в первую секунду запоминаем СКО в "спокойном" режиме системы
             self.detector.fit(frame)
         else:
-            if len(self.cached_frames) > self.max_time:
+            self.reserve(frame)
+            if self.cached_len > self.max_time:
                 # Событие: длительность тревоги превысила лимит!
+                # результат детектора не нужен, но фрейм он должен увидеть:
+                # иначе устареют хвост окна onset_window и адаптивный шум
+                self.detector.detect(frame)
                 self.alarm_flag = False
                 self.curr_cooling_time = 0
-                result = self.cached_frames.copy()
-                self.cached_frames = np.array([])
-                return result
+                result = self.pop()
+                self.alarms += 1
             else:
                 # Событие: длительность тревоги не превышена
                 if self.detector.detect(frame):
                     # Событие: детектор сработал
                     if self.alarm_flag == False:
                         # Событие: тревога произошла в первый раз
-                        indented_frame = self.indent_first_frame(frame, self.last_frame)
+                        previous, indented_frame = self.indent_first_frame(frame)
                         self.alarm_flag = True
                         self.curr_cooling_time = 0
-                        self.cached_frames = np.concatenate([
-                                self.cached_frames,
-                                indented_frame
-                            ])
+                        self.append(previous)
+                        self.append(indented_frame)
+                        self.next_provisional = self.provisional_interval
                     elif self.alarm_flag:
                         # Событие: тревога уже была раньше
                         self.curr_cooling_time = 0
-                        self.cached_frames = np.concatenate([
-                                self.cached_frames,
-                                frame
-                            ])
+                        self.append(frame)
                     if self.verbose:
                         self.send_message(message="analysis")
 
@@ -101,21 +204,24 @@ class Cropper():
                             # Событие: время охлаждения вышло
                             self.curr_cooling_time = 0
                             self.alarm_flag = False
-                            result = self.cached_frames.copy()
-                            self.cached_frames = np.array([])
-                            return result
+                            result = self.pop()
+                            self.alarms += 1
                         else:
                             # Событие: время охлаждения еще не закончилось
                             self.curr_cooling_time += len(frame)
-                            self.cached_frames = np.concatenate([
-                                self.cached_frames,
-                                frame
-                            ])
+                            self.append(frame)
                             if self.verbose:
                                 self.send_message(message="analysis")
+            if self.provisional_interval and self.alarm_flag and self.cached_len >= self.next_provisional:
+                # Событие: тревога еще идет, пора выдать предварительную классификацию
+                self.provisional_signal = self.buffer[:self.cached_len].copy()
+                while self.next_provisional <= self.cached_len:
+                    self.next_provisional += self.provisional_interval
+            if self.detector.adaptive_horizon:
+                self.track_static_alarm(len(frame))
         
-        self.last_frame = frame    
-        
+        self.remember(frame)
+        return result
     
     def send_message(self, message):
         print(message, end="")
@@ -1,19 +1,62 @@
 import numpy as np
 
+def rolling_std(x, window, axis=0):
+    """
+    СКО в скользящем окне длины window по каждому отсчету (окно заканчивается
+    на отсчете), через кумулятивные суммы x и x**2: O(n), без циклов по отсчетам
+    Args:
+        x (np.ndarray): сигнал (или матрица, отсчеты по оси axis)
+        window (int): длина окна, отсчетов
+    Returns:
+        np.ndarray: len(x) - window + 1 значений СКО (ddof=0, как np.std)
+    """
+    # сдвиг на среднее, чтобы разность больших кумулятивных сумм не теряла точность
+    x = np.asarray(x, dtype=np.float64)
+    x = x - x.mean(axis=axis, keepdims=True)
+    zero = np.zeros_like(np.take(x, [0], axis=axis))
+    s1 = np.concatenate([zero, np.cumsum(x, axis=axis)], axis=axis)
+    s2 = np.concatenate([zero, np.cumsum(x * x, axis=axis)], axis=axis)
+    n = x.shape[axis]
+    head = np.arange(n - window + 1)
+    sum1 = np.take(s1, head + window, axis=axis) - np.take(s1, head, axis=axis)
+    sum2 = np.take(s2, head + window, axis=axis) - np.take(s2, head, axis=axis)
+    var = (sum2 - sum1 * sum1 / window) / window
+    return np.sqrt(np.maximum(var, 0))
+
 class Detector():
     """
     Класс, описывающий детектор для определения наличия тревоги
     """
-    def __init__(self, threshold):
+    def __init__(self, threshold, adaptive_horizon=None, onset_window=None):
         """
         threshold (int): Порог тревоги. Допустимое отношение СКО
         внутри фрейма относительно шума устройства
-        is_fitted (bool): Настроен ли детектор? 
+        adaptive_horizon (int, optional): Горизонт переоценки шума, отсчетов.
+        Если задан, СКО шума отслеживается экспоненциальным скользящим средним
+        дисперсии "спокойных" фреймов (на которых детектор не сработал) с весом
+        len(frame) / adaptive_horizon, то есть шум примерно за последние
+        adaptive_horizon отсчетов. По умолчанию None (шум оценивается один раз в fit).
+        onset_window (int, optional): Длина скользящего окна СКО, отсчетов.
+        Если задана, СКО считается не по фрейму целиком, а в окне, которое
+        сдвигается на каждый отсчет (окна переходят через границу фреймов).
+        Тревога - если хоть одно окно превысило порог, а индекс отсчета,
+        на котором это случилось впервые, записывается в self.onset
+        (по нему Cropper делает отступ). Окно короче фрейма позволяет подавать
+        фреймы короче и раньше получать первую тревогу.
+        По умолчанию None (одно СКО на фрейм).
+        is_fitted (bool): Настроен ли детектор?
         (В первую секунду работы системы не настроен, потом находится
         шум устройства, настраивается)
         """
         self.threshold = threshold
+        self.adaptive_horizon = adaptive_horizon
+        self.onset_window = onset_window
         self.is_fitted = False
+        # сработал бы детектор на последнем фрейме с шумом из fit (без адаптации),
+        # по этому флагу Cropper считает, сколько классификаций сэкономил адаптивный шум
+        self.static_triggered = False
+        self.onset = None # индекс начала тревоги в последнем фрейме (onset_window)
+        self.tail = None # последние onset_window - 1 отсчетов предыдущего фрейма
     def fit(self, frames):
         """
         В рамках этого метода находится значение СКО шума устройства
@@ -21,7 +64,32 @@ class Detector():
         """
         self.noise_std = np.std(frames)
         self.noise_mean = np.mean(frames)
+        self.noise_var = self.noise_std ** 2
+        self.static_noise_std = self.noise_std # СКО шума из fit (без адаптации)
+        if self.onset_window:
+            self.tail = np.asarray(frames[max(0, len(frames) - self.onset_window + 1):], dtype=np.float64)
         self.is_fitted = True
+    def update(self, frame, frame_std):
+        """
+        Обновление оценки шума по спокойному фрейму (O(1) по уже
+        посчитанному СКО фрейма)
+        """
+        alpha = min(1.0, len(frame) / self.adaptive_horizon)
+        self.noise_var += alpha * (frame_std ** 2 - self.noise_var)
+        self.noise_std = np.sqrt(self.noise_var)
+    def window_std(self, frame) -> np.ndarray:
+        """
+        СКО в окне onset_window, заканчивающемся на каждом отсчете фрейма
+        (начало окна может быть в предыдущем фрейме)
+        Returns:
+            np.ndarray: СКО для отсчетов фрейма, начиная с
+            len(frame) - len(result) (раньше окно еще не набралось)
+        """
+        signal = np.concatenate([self.tail, frame])
+        self.tail = signal[max(0, len(signal) - self.onset_window + 1):]
+        if len(signal) < self.onset_window:
+            return np.zeros(0)
+        return rolling_std(signal, self.onset_window)
     def detect(self, frame) -> bool:
         """
         Метод проверки наличия тревоги
@@ -30,9 +98,21 @@ class Detector():
         Returns:
             bool: Есть ли тревога?
         """
-        assert self.is_fitted, "Detector is not fitted!" 
-        frame_std = np.std(frame)
-        if frame_std / self.noise_std  > self.threshold:
+        assert self.is_fitted, "Detector is not fitted!"
+        if self.onset_window:
+            stds = self.window_std(frame)
+            exceeded = np.flatnonzero(stds / self.noise_std > self.threshold)
+            triggered = len(exceeded) > 0
+            self.onset = int(exceeded[0]) + len(frame) - len(stds) if triggered else None
+            level = stds.max() if len(stds) else 0.0
+        else:
+            level = np.std(frame)
+            triggered = level / self.noise_std > self.threshold
+        if self.adaptive_horizon:
+            self.static_triggered = level / self.static_noise_std > self.threshold
+            if not triggered:
+                self.update(frame, np.std(frame) if self.onset_window else level)
+        if triggered:
             return True
         else:
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,153 @@
+import json
+import asyncio
+import numpy as np
+
+class DriverProtocol(asyncio.BufferedProtocol):
+    """
+    Разбор потока драйвера DAS из unix-сокета.
+
+    Формат одного пакета драйвера:
+    JSON-заголовок, b'\\0', данные uint16 (numTraces x traceSize), b'<<<EndOfData.>>>'
+
+    Данные из сокета читаются сразу в один переиспользуемый bytearray
+    (asyncio.BufferedProtocol), пакеты разбираются через memoryview без
+    копирования. Если байты заголовка совпадают с предыдущим пакетом,
+    json.loads не вызывается (используются сохраненные numTraces/traceSize).
+    Данные пакета передаются в on_frame в виде np.ndarray-view на буфер:
+    view действителен только внутри on_frame, если данные нужны дольше,
+    их нужно скопировать (например в RingBuffer).
+    """
+    def __init__(self, on_frame, delimiter=b'<<<EndOfData.>>>', buffer_size=1 << 20, on_lost=None):
+        """
+        Args:
+            on_frame (callable): функция on_frame(data, header), вызывается для
+            каждого пакета: data - матрица numTraces x traceSize, header - dict заголовка
+            delimiter (bytes, optional): разделитель конца пакета
+            buffer_size (int, optional): начальный размер буфера, байт
+            (увеличивается, если пакет в него не помещается)
+            on_lost (callable, optional): вызывается при разрыве соединения
+        """
+        self.on_frame = on_frame
+        self.on_lost = on_lost
+        self.delimiter = bytes(delimiter)
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0 # начало неразобранных данных в буфере
+        self.end = 0 # конец полученных данных в буфере
+        self.header_bytes = None # байты последнего разобранного заголовка
+        self.header = None
+        self.shape = None # (numTraces, traceSize) последнего заголовка
+        self.closed = False
+        self.packets = 0 # кол-во разобранных пакетов
+        self.received_bytes = 0
+        self.header_parses = 0 # сколько раз пришлось вызывать json.loads
+        self.errors = 0 # сколько раз поток рассинхронизировался
+        self.lost_sync = False # ищем разделитель: до него в буфере мусор
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.closed = True
+        if self.on_lost is not None:
+            self.on_lost()
+
+    def get_buffer(self, sizehint):
+        if self.end == len(self.buffer):
+            self.compact()
+        if self.end == len(self.buffer):
+            self.grow(2 * len(self.buffer))
+        return self.view[self.end:]
+
+    def buffer_updated(self, nbytes):
+        self.end += nbytes
+        self.received_bytes += nbytes
+        self.parse()
+
+    def compact(self):
+        """
+        Перенос неразобранного хвоста в начало буфера
+        """
+        tail = self.end - self.start
+        if self.start > 0:
+            self.buffer[:tail] = bytes(self.view[self.start:self.end])
+            self.start, self.end = 0, tail
+
+    def grow(self, size):
+        """
+        Увеличение буфера (нужно, только если пакет больше буфера)
+        """
+        self.compact()
+        buffer = bytearray(size)
+        buffer[:self.end] = self.view[:self.end]
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+
+    def resync(self, search_from) -> bool:
+        """
+        Поток рассинхронизировался (нет разделителя на ожидаемом месте или
+        испорчен заголовок): пропускаем все до ближайшего разделителя.
+        Если его еще нет, поиск продолжается со следующими данными (а не
+        разбор заголовка: иначе хвост испорченного пакета склеится
+        с заголовком следующего и пропадет и он)
+        Returns:
+            bool: False, если разделитель еще не получен
+        """
+        if not self.lost_sync:
+            self.errors += 1
+            self.lost_sync = True
+        delimiter_idx = self.buffer.find(self.delimiter, search_from, self.end)
+        if delimiter_idx < 0:
+            self.start = max(self.start, self.end - len(self.delimiter))
+            return False
+        self.start = delimiter_idx + len(self.delimiter)
+        self.lost_sync = False
+        return True
+
+    def parse(self):
+        """
+        Разбор всех полностью полученных пакетов в буфере
+        """
+        while True:
+            if self.lost_sync and not self.resync(self.start):
+                break
+            zero = self.buffer.find(b'\0', self.start, self.end)
+            if zero < 0:
+                break
+            header_bytes = self.view[self.start:zero]
+            if header_bytes != self.header_bytes:
+                try:
+                    header = json.loads(bytes(header_bytes))
+                    shape = (header['numTraces'], header['traceSize'])
+                except (ValueError, KeyError, TypeError):
+                    # вместо заголовка пришел мусор
+                    header_bytes.release()
+                    if not self.resync(zero + 1):
+                        break
+                    continue
+                self.header_bytes = bytes(header_bytes)
+                self.header = header
+                self.shape = shape
+                self.header_parses += 1
+            header_bytes.release()
+            num_traces, trace_size = self.shape
+            payload_start = zero + 1
+            payload_end = payload_start + num_traces * trace_size * 2
+            packet_end = payload_end + len(self.delimiter)
+            if packet_end > self.end:
+                if packet_end - self.start > len(self.buffer):
+                    self.grow(2 * (packet_end - self.start))
+                break
+            if self.view[payload_end:packet_end] != self.delimiter:
+                if not self.resync(payload_start):
+                    break
+                continue
+            data = np.frombuffer(self.buffer, dtype=np.uint16,
+                                 count=num_traces * trace_size,
+                                 offset=payload_start).reshape(num_traces, trace_size)
+            self.on_frame(data, self.header)
+            del data
+            self.packets += 1
+            self.start = packet_end
+        if self.start == self.end:
+            self.start = self.end = 0
@@ -0,0 +1,168 @@
+'''
+Имитатор драйвера DAS и замер скорости разбора пакетов без прибора.
+
+Имитатор поднимает unix-сокет и пишет в него пакеты в формате драйвера:
+JSON-заголовок, b'\\0', данные uint16 (numTraces x traceSize), b'<<<EndOfData.>>>'
+
+Замер скорости DriverProtocol (имитатор запускается в отдельном процессе):
+    python driver_simulator.py --packets 20000 --num-traces 16 --trace-size 4096
+С --varying-header в заголовок пишется номер пакета, заголовок меняется
+в каждом пакете и кэш заголовка не работает (json.loads на каждый пакет).
+
+Запуск только имитатора (для DataReceiver и starter_mp.py), 1024 рефлектограммы в секунду:
+    python driver_simulator.py --serve --socket /tmp/das_driver --rate 64
+
+make_stream - синтетический поток каналов зон (шум, всплески, воздействия
+около max_time) для замера скорости Cropper/MultiCropper/JitCropper
+(jit_cropper.py) и тестов их совпадения (tests/).
+'''
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing
+import numpy as np
+from driver_protocol import DriverProtocol
+
+DELIMITER = b'<<<EndOfData.>>>'
+
+def make_packet(data: np.ndarray, header_extra=None) -> bytes:
+    """
+    Пакет драйвера для матрицы рефлектограмм data (numTraces x traceSize)
+    """
+    header = {"numTraces": data.shape[0], "traceSize": data.shape[1]}
+    if header_extra:
+        header.update(header_extra)
+    return json.dumps(header).encode() + b'\0' + data.astype(np.uint16).tobytes() + DELIMITER
+
+def make_stream(n_samples, n_channels, seed=0):
+    """
+    Синтетический поток каналов (время x каналы): шум, короткие всплески на
+    случайных каналах и прерывистые воздействия длиной около max_time на
+    каждом втором (тревога переполняется, а следующий фрейм бывает и тихим, и громким)
+    """
+    rng = np.random.default_rng(seed)
+    stream = 8000 + rng.normal(0, 10, (n_samples, n_channels))
+    for _ in range(n_channels * n_samples // 20000):
+        c = rng.integers(n_channels)
+        start = rng.integers(1000, n_samples - 3000)
+        length = rng.integers(50, 3000)
+        stream[start:start + length, c] += rng.normal(0, rng.uniform(30, 500), length)
+    for c in range(0, n_channels, 2) if n_samples > 20000 else ():
+        for _ in range(4):
+            start = rng.integers(5000, n_samples - 15000)
+            length = rng.integers(9500, 13000)
+            stream[start:start + length, c] += (rng.normal(0, rng.uniform(40, 300), length)
+                                                * (rng.random(length) < 0.3))
+    return stream
+
+async def serve(socket_path, num_traces, trace_size, packets=None, rate=None, varying_header=False):
+    """
+    Unix-сокет сервер, который каждому клиенту отправляет пакеты
+    Args:
+        socket_path (str): путь до unix-сокета
+        num_traces (int): кол-во рефлектограмм в пакете
+        trace_size (int): длина рефлектограммы
+        packets (int, optional): сколько пакетов отправить (None - бесконечно)
+        rate (float, optional): пакетов в секунду (None - так быстро, как возможно)
+        varying_header (bool, optional): писать ли в заголовок номер пакета
+    """
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 16000, size=(num_traces, trace_size), dtype=np.uint16)
+    packet = make_packet(data)
+
+    async def handle(reader, writer):
+        sent = 0
+        start = time.monotonic()
+        try:
+            while packets is None or sent < packets:
+                if varying_header:
+                    writer.write(make_packet(data, {"packetNum": sent}))
+                else:
+                    writer.write(packet)
+                sent += 1
+                if rate is not None:
+                    await writer.drain()
+                    delay = start + sent / rate - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                elif sent % 16 == 0:
+                    await writer.drain()
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    async with server:
+        await server.serve_forever()
+
+def run_server(*args, **kwargs):
+    try:
+        asyncio.run(serve(*args, **kwargs))
+    except KeyboardInterrupt:
+        pass
+
+async def benchmark(socket_path, packets):
+    """
+    Прием packets пакетов через DriverProtocol
+    Returns:
+        dict: пакетов в секунду, МБ/с и счетчики протокола
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    received = 0
+    def on_frame(data, header):
+        nonlocal received
+        received += 1
+        if received == packets and not done.done():
+            done.set_result(time.perf_counter())
+    while True:
+        try:
+            transport, protocol = await loop.create_unix_connection(
+                lambda: DriverProtocol(on_frame, DELIMITER), socket_path)
+            break
+        except OSError:
+            await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    end = await done
+    transport.close()
+    elapsed = end - start
+    return {"packets": protocol.packets,
+            "seconds": elapsed,
+            "packets_per_s": protocol.packets / elapsed,
+            "MB_per_s": protocol.received_bytes / elapsed / 1e6,
+            "header_parses": protocol.header_parses,
+            "errors": protocol.errors}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default="/tmp/das_driver_sim")
+    parser.add_argument("--num-traces", type=int, default=16)
+    parser.add_argument("--trace-size", type=int, default=4096)
+    parser.add_argument("--packets", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=None)
+    parser.add_argument("--varying-header", action="store_true")
+    parser.add_argument("--serve", action="store_true", help="только имитатор, без замера")
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.socket, args.num_traces, args.trace_size,
+                   rate=args.rate, varying_header=args.varying_header)
+        sys.exit()
+
+    server = multiprocessing.Process(target=run_server,
+                                     args=(args.socket, args.num_traces, args.trace_size),
+                                     kwargs={"packets": args.packets, "rate": args.rate,
+                                             "varying_header": args.varying_header},
+                                     daemon=True)
+    server.start()
+    try:
+        result = asyncio.run(benchmark(args.socket, args.packets))
+    finally:
+        server.terminate()
+    print(json.dumps(result, indent=2))
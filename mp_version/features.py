@@ -0,0 +1,710 @@
+'''
+Расчет признаков MyCustomFeatures (см. preprocessing.py) без tsfresh.
+
+tsfresh.extract_features на каждую тревогу строит DataFrame, группирует его,
+вызывает калькуляторы по одному и собирает результат обратно в таблицу:
+для одного сигнала это сотни миллисекунд. Здесь те же калькуляторы
+(только те, что есть в MyCustomFeatures.time_features и freq_features)
+считаются прямо по np.ndarray каждого ряда.
+
+Параметры компилируются в план (FeaturePlan) один раз: имена признаков,
+порядок колонок и вызовы калькуляторов. Калькулятор с несколькими наборами
+параметров вызывается один раз со всеми наборами, а общие для нескольких
+признаков промежуточные величины (среднее, СКО, отсортированная копия,
+разности, спектр, AR-модель, агрегаты по кускам и их регрессии, таблицы
+сравнений для перестановок и пиков) считаются один раз на ряд (Series).
+
+Формулы повторяют tsfresh 0.21 (и используемые им pandas, statsmodels, scipy)
+вплоть до порядка операций, названия признаков - те же, что у tsfresh.
+Если в параметрах есть калькулятор, которого здесь нет, CustomFeatureAugmenter
+считает признаки через tsfresh (см. supported).
+
+Совпадение с tsfresh (до 1e-9) проверяет tests/test_features.py.
+'''
+import math
+import numpy as np
+import pandas as pd
+from scipy.signal import get_window
+
+CALCULATORS = {} # имя калькулятора tsfresh -> (функция, combiner)
+
+def calculator(combiner=False):
+    """
+    Регистрация калькулятора под именем функции. Простой калькулятор
+    вызывается как f(series, **param) для каждого набора параметров,
+    combiner - один раз как f(series, param_list) и возвращает
+    список значений в порядке param_list (так калькулятор считает общее
+    для всех наборов один раз)
+    """
+    def register(func):
+        CALCULATORS[func.__name__] = (func, combiner)
+        return func
+    return register
+
+def output_format(param: dict) -> str:
+    """
+    Суффикс имени признака по параметрам (как
+    tsfresh.utilities.string_manipulation.convert_to_output_format)
+    """
+    return "__".join(f'{key}_"{value}"' if isinstance(value, str) else f"{key}_{value}"
+                     for key, value in sorted(param.items()))
+
+class Series():
+    """
+    Один ряд (значения одного kind одного id) и лениво посчитанные
+    промежуточные величины, общие для нескольких калькуляторов
+    """
+    def __init__(self, x: np.ndarray):
+        self.x = x
+        self.n = len(x)
+        self.cache = {}
+
+    def get(self, key, func):
+        if key not in self.cache:
+            self.cache[key] = func()
+        return self.cache[key]
+
+    @property
+    def mean(self):
+        return self.get("mean", lambda: np.mean(self.x))
+
+    @property
+    def std(self):
+        return self.get("std", lambda: np.std(self.x))
+
+    @property
+    def sorted(self):
+        # на отсортированном ряде np.quantile/np.median/np.percentile дают
+        # те же значения, но не тратят время на разбиение массива
+        return self.get("sorted", lambda: np.sort(self.x))
+
+    @property
+    def diff(self):
+        return self.get("diff", lambda: np.diff(self.x))
+
+    @property
+    def fft_abs(self):
+        return self.get("fft_abs", lambda: np.abs(np.fft.rfft(self.x)))
+
+    def chunks(self, f_agg, chunk_len):
+        """
+        Агрегаты f_agg по кускам длины chunk_len (последний кусок может быть
+        короче), как tsfresh _aggregate_on_chunks
+        """
+        def aggregate():
+            n_full = self.n // chunk_len
+            full = getattr(self.x[:n_full * chunk_len].reshape(n_full, chunk_len), f_agg)(axis=1)
+            if n_full * chunk_len == self.n:
+                return full
+            return np.append(full, getattr(self.x[n_full * chunk_len:], f_agg)())
+        return self.get(("chunks", f_agg, chunk_len), aggregate)
+
+    def ordinal(self, max_dimension):
+        """
+        Таблицы сравнений для кодов перестановок окон длины до max_dimension:
+        less[m][t] - сколько из x[t+1..t+m] меньше x[t],
+        equal[m][t] - есть ли среди них равные x[t]
+        """
+        def tables():
+            x = self.x
+            less, equal = [None], [None]
+            for m in range(1, max_dimension):
+                smaller = x[m:] < x[:self.n - m]
+                same = x[m:] == x[:self.n - m]
+                if m == 1:
+                    less.append(smaller.astype(np.int64))
+                    equal.append(same)
+                else:
+                    less.append(less[-1][:len(smaller)] + smaller)
+                    equal.append(equal[-1][:len(same)] | same)
+            return less, equal
+        return self.get(("ordinal", max_dimension), tables)
+
+    def peaks(self, max_n):
+        """
+        peaks[k][j]: отсчет j + k больше всех соседей на расстоянии до k
+        (для отсчетов k..len(x) - k - 1)
+        """
+        def tables():
+            x = self.x
+            peaks = [np.ones(self.n, dtype=bool)]
+            for k in range(1, max_n + 1):
+                m = max(self.n - 2 * k, 0)
+                center = x[k:k + m]
+                peaks.append(peaks[-1][1:1 + m] & (center > x[:m]) & (center > x[2 * k:2 * k + m]))
+            return peaks
+        return self.get(("peaks", max_n), tables)
+
+def linregress(y):
+    """
+    Линейная регрессия y по 0..len(y)-1 (формулы scipy.stats.linregress)
+    Returns:
+        dict: slope, intercept, rvalue, stderr
+    """
+    n = len(y)
+    x = np.arange(n, dtype=np.float64)
+    xmean, ymean = np.mean(x), np.mean(y)
+    # как np.cov(x, y, bias=1)
+    xc, yc = x - xmean, y - ymean
+    inv_n = np.true_divide(1, n)
+    ssxm, ssxym, ssym = np.dot(xc, xc) * inv_n, np.dot(xc, yc) * inv_n, np.dot(yc, yc) * inv_n
+    if ssxm == 0.0 or ssym == 0.0:
+        r = np.nan if ssxym == 0 else 0.0
+    else:
+        r = min(max(ssxym / np.sqrt(ssxm * ssym), -1.0), 1.0)
+    slope = ssxym / ssxm
+    intercept = ymean - slope * xmean
+    if n == 2:
+        stderr = 0.0
+    else:
+        stderr = np.sqrt((1 - r ** 2) * ssym / ssxm / (n - 2))
+    return {"slope": slope, "intercept": intercept, "rvalue": r, "stderr": stderr}
+
+def autoreg(x, k):
+    """
+    Коэффициенты AR(k) с константой МНК через псевдообратную матрицу
+    (как statsmodels AutoReg(x, lags=k, trend="c").fit().params)
+    Returns:
+        np.ndarray: [const, lag1, ..., lagk]
+    """
+    n = len(x)
+    if n - k < k + 1:
+        raise ValueError("too short for AR model")
+    design = np.empty((n - k, k + 1))
+    design[:, 0] = 1.0
+    for lag in range(1, k + 1):
+        design[:, lag] = x[k - lag:n - lag]
+    u, s, vt = np.linalg.svd(design, False)
+    cutoff = 1e-15 * np.maximum.reduce(s)
+    s = np.where(s > cutoff, 1.0 / np.where(s > cutoff, s, 1.0), 0.0)
+    pinv = np.dot(np.transpose(vt), np.multiply(s[:, np.newaxis], np.transpose(u)))
+    return np.dot(pinv, x[k:])
+
+def welch(x, nperseg):
+    """
+    Спектральная плотность мощности методом Уэлча с параметрами
+    scipy.signal.welch по умолчанию (окно Ханна, перекрытие половина окна,
+    вычитание среднего сегмента, односторонний спектр плотности, fs=1)
+    Returns:
+        np.ndarray: nperseg // 2 + 1 значений плотности
+    """
+    step = nperseg - nperseg // 2
+    n_segments = (len(x) - nperseg) // step + 1
+    segments = np.lib.stride_tricks.sliding_window_view(x, nperseg)[::step][:n_segments]
+    segments = segments - segments.mean(axis=-1, keepdims=True)
+    window = get_window("hann", nperseg)
+    spectrum = np.fft.rfft(window * segments, axis=-1)
+    spectrum = np.conjugate(spectrum) * spectrum
+    spectrum *= 1.0 / (window * window).sum()
+    if nperseg % 2:
+        spectrum[..., 1:] *= 2
+    else:
+        spectrum[..., 1:-1] *= 2
+    return spectrum.mean(axis=0).real
+
+def histogram_entropy(x, max_bins):
+    """
+    Энтропия гистограммы из max_bins бинов (tsfresh binned_entropy)
+    """
+    hist, _ = np.histogram(x, bins=max_bins)
+    probs = hist / x.size
+    probs[probs == 0] = 1.0
+    return -np.sum(probs * np.log(probs))
+
+def ordinal_entropy(series, tau, dimension, tables):
+    """
+    Энтропия перестановок окон длины dimension с шагом tau
+    по таблицам сравнений series.ordinal (не короче dimension)
+    """
+    m = series.n - dimension + 1 # кол-во окон с шагом 1
+    if m <= 0:
+        return np.nan
+    x = series.x
+    # номер перестановки рангов окна в лексикографическом порядке (код Лемера):
+    # для каждого отсчета окна - сколько следующих за ним отсчетов меньше него,
+    # то есть для i-го отсчета окна - строка таблицы less для dimension - 1 - i
+    less, equal = tables
+    codes = np.zeros(m, dtype=np.int64)
+    ties = np.zeros(m, dtype=bool)
+    for i in range(dimension - 1):
+        codes += less[dimension - 1 - i][i:i + m] * math.factorial(dimension - 1 - i)
+        ties |= equal[dimension - 1 - i][i:i + m]
+    codes, ties = codes[::tau], ties[::tau]
+    if ties.any():
+        # порядок равных отсчетов задает np.argsort (для окон длиннее 3
+        # он не обязательно устойчивый), поэтому ранги таких окон - как в tsfresh
+        windows = np.lib.stride_tricks.sliding_window_view(x, dimension)[::tau][ties]
+        ranks = np.argsort(np.argsort(windows))
+        tied_codes = np.zeros(len(ranks), dtype=np.int64)
+        for i in range(dimension - 1):
+            smaller = (ranks[:, i + 1:] < ranks[:, i:i + 1]).sum(axis=1)
+            tied_codes += smaller * math.factorial(dimension - 1 - i)
+        codes[ties] = tied_codes
+    counts = np.bincount(codes)
+    probs = counts[counts > 0] / len(codes)
+    return -np.sum(probs * np.log(probs))
+
+@calculator(combiner=True)
+def permutation_entropy(series, param):
+    # таблицы сравнений - одни на все размерности (до наибольшей)
+    tables = series.ordinal(max(config["dimension"] for config in param))
+    return [ordinal_entropy(series, config["tau"], config["dimension"], tables) for config in param]
+
+@calculator(combiner=True)
+def number_peaks(series, param):
+    peaks = series.peaks(max(config["n"] for config in param))
+    return [np.sum(peaks[config["n"]]) for config in param]
+
+@calculator(combiner=True)
+def ar_coefficient(series, param):
+    res = []
+    for config in param:
+        k, p = config["k"], config["coeff"]
+        def fit():
+            try:
+                return autoreg(series.x, k)
+            except (ZeroDivisionError, np.linalg.LinAlgError, ValueError):
+                return [np.nan] * k
+        params = series.get(("ar", k), fit)
+        if p <= k:
+            res.append(params[p] if p < len(params) else 0)
+        else:
+            res.append(np.nan)
+    return res
+
+@calculator()
+def ratio_beyond_r_sigma(series, r):
+    deviation = series.get("abs_deviation", lambda: np.abs(series.x - series.mean))
+    return np.sum(deviation > r * series.std) / series.n
+
+@calculator(combiner=True)
+def fft_aggregated(series, param):
+    y = series.fft_abs
+    def moment(order):
+        return series.get(("fft_moment", order),
+                          lambda: y.dot(np.arange(len(y), dtype=float) ** order) / y.sum())
+    def variance():
+        return moment(2) - moment(1) ** 2
+    def skew():
+        if variance() < 0.5:
+            return np.nan
+        return (moment(3) - 3 * moment(1) * variance() - moment(1) ** 3) / variance() ** 1.5
+    def kurtosis():
+        if variance() < 0.5:
+            return np.nan
+        return (moment(4) - 4 * moment(1) * moment(3) + 6 * moment(2) * moment(1) ** 2
+                - 3 * moment(1)) / variance() ** 2
+    calculation = {"centroid": lambda: moment(1), "variance": variance, "skew": skew, "kurtosis": kurtosis}
+    return [calculation[config["aggtype"]]() for config in param]
+
+@calculator()
+def absolute_sum_of_changes(series):
+    return np.sum(np.abs(series.diff))
+
+@calculator()
+def binned_entropy(series, max_bins):
+    return histogram_entropy(series.x, max_bins)
+
+@calculator()
+def lempel_ziv_complexity(series, bins):
+    x = series.x
+    edges = np.linspace(np.min(x), np.max(x), bins + 1)[1:]
+    sequence = np.searchsorted(edges, x, side="left").tolist()
+    # tsfresh добавляет в словарь кратчайшую еще не встречавшуюся подстроку,
+    # начиная с текущей позиции: все ее начала уже в словаре, поэтому словарь -
+    # префиксное дерево, и на каждый отсчет нужен один поиск в dict
+    # (узел дерева, номер бина) -> узел
+    trie = {}
+    get = trie.get
+    node = 0
+    for symbol in sequence:
+        child = get(node * bins + symbol)
+        if child is None:
+            trie[node * bins + symbol] = len(trie) + 1
+            node = 0
+        else:
+            node = child
+    return len(trie) / series.n
+
+@calculator()
+def count_below_mean(series):
+    return np.count_nonzero(series.x < series.mean)
+
+@calculator()
+def count_above_mean(series):
+    return np.count_nonzero(series.x > series.mean)
+
+@calculator(combiner=True)
+def agg_linear_trend(series, param):
+    res = []
+    for config in param:
+        chunk_len, f_agg, attr = config["chunk_len"], config["f_agg"], config["attr"]
+        if chunk_len >= series.n:
+            res.append(np.nan)
+            continue
+        # одна регрессия на (f_agg, chunk_len) для всех attr
+        trend = series.get(("trend", f_agg, chunk_len),
+                           lambda: linregress(series.chunks(f_agg, chunk_len)))
+        res.append(trend[attr])
+    return res
+
+@calculator(combiner=True)
+def index_mass_quantile(series, param):
+    abs_x = np.abs(series.x)
+    s = np.sum(abs_x)
+    if s == 0:
+        return [np.nan] * len(param)
+    mass_centralized = np.cumsum(abs_x) / s
+    return [(np.argmax(mass_centralized >= config["q"]) + 1) / series.n for config in param]
+
+@calculator(combiner=True)
+def quantile(series, param):
+    if series.n == 0:
+        return [np.nan] * len(param)
+    # один вызов на все q дает те же значения, что и вызовы по одному
+    return list(np.quantile(series.sorted, [config["q"] for config in param]))
+
+@calculator()
+def minimum(series):
+    return np.min(series.x)
+
+@calculator()
+def variation_coefficient(series):
+    if series.mean == 0:
+        return np.nan
+    return series.std / series.mean
+
+@calculator()
+def c3(series, lag):
+    x, n = series.x, series.n
+    if 2 * lag >= n:
+        return 0.0
+    return np.mean(x[2 * lag:] * x[lag:n - lag] * x[:n - 2 * lag])
+
+@calculator()
+def sum_values(series):
+    if series.n == 0:
+        return 0
+    return np.sum(series.x)
+
+@calculator()
+def variance(series):
+    return np.var(series.x)
+
+@calculator()
+def standard_deviation(series):
+    return series.std
+
+@calculator()
+def root_mean_square(series):
+    return np.sqrt(np.mean(np.square(series.x))) if series.n > 0 else np.nan
+
+def central_sums(series):
+    """
+    Суммы квадратов, кубов и четвертых степеней отклонений от среднего
+    (как pandas nanskew/nankurt)
+    """
+    def sums():
+        adjusted = series.x - series.x.sum(dtype=np.float64) / series.n
+        adjusted2 = adjusted ** 2
+        return adjusted2.sum(), (adjusted2 * adjusted).sum(), (adjusted2 ** 2).sum()
+    return series.get("central_sums", sums)
+
+def zero_out_fperr(value):
+    return 0.0 if np.abs(value) < 1e-14 else value
+
+@calculator()
+def kurtosis(series):
+    count = float(series.n)
+    if count < 4:
+        return np.nan
+    m2, _, m4 = central_sums(series)
+    adj = 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+    numerator = zero_out_fperr(count * (count + 1) * (count - 1) * m4)
+    denominator = zero_out_fperr((count - 2) * (count - 3) * m2 ** 2)
+    if denominator == 0:
+        return 0.0
+    return numerator / denominator - adj
+
+@calculator()
+def skewness(series):
+    count = float(series.n)
+    if count < 3:
+        return np.nan
+    m2, m3, _ = central_sums(series)
+    m2, m3 = zero_out_fperr(m2), zero_out_fperr(m3)
+    if m2 == 0:
+        return 0.0
+    return (count * (count - 1) ** 0.5 / (count - 2)) * (m3 / m2 ** 1.5)
+
+@calculator()
+def fourier_entropy(series, bins):
+    def spectrum():
+        pxx = welch(series.x, nperseg=min(series.n, 256))
+        return pxx / np.max(pxx)
+    return histogram_entropy(series.get("welch", spectrum), bins)
+
+@calculator()
+def longest_strike_below_mean(series):
+    if series.n == 0:
+        return 0
+    below = np.concatenate([[False], series.x < series.mean, [False]])
+    edges = np.flatnonzero(below[1:] != below[:-1])
+    return np.max(edges[1::2] - edges[::2]) if len(edges) else 0
+
+@calculator()
+def median(series):
+    return np.median(series.sorted)
+
+@calculator()
+def range_count(series, min, max):
+    return np.sum((series.x >= min) & (series.x < max))
+
+@calculator()
+def cid_ce(series, normalize):
+    x = series.x
+    if normalize:
+        if series.std != 0:
+            x = (x - series.mean) / series.std
+        else:
+            return 0.0
+    x = np.diff(x) if normalize else series.diff
+    return np.sqrt(np.dot(x, x))
+
+def first_digits(x):
+    """
+    Первая значащая цифра каждого числа (как первая цифра
+    np.format_float_scientific, 0 для нуля)
+    """
+    x = np.abs(np.nan_to_num(x))
+    digits = np.zeros(len(x), dtype=np.int64)
+    positive = x > 0
+    mantissa = x[positive] / 10.0 ** np.floor(np.log10(x[positive]))
+    # ошибка округления log10 около степеней 10
+    mantissa = np.where(mantissa >= 10, mantissa / 10, np.where(mantissa < 1, mantissa * 10, mantissa))
+    digits[positive] = np.floor(mantissa)
+    # мантиссы у самой границы цифры: округление могло перейти через нее
+    doubtful = np.flatnonzero(positive)[np.abs(mantissa - np.round(mantissa)) < 1e-9]
+    for i in doubtful:
+        digits[i] = int(str(np.format_float_scientific(x[i]))[:1])
+    return digits
+
+@calculator()
+def benford_correlation(series):
+    digits = first_digits(series.x)
+    benford_distribution = np.array([np.log10(1 + 1 / n) for n in range(1, 10)])
+    data_distribution = np.bincount(digits, minlength=10)[1:10] / series.n
+    return np.corrcoef(benford_distribution, data_distribution)[0, 1]
+
+@calculator()
+def change_quantiles(series, ql, qh, isabs, f_agg):
+    if ql >= qh:
+        return 0.0
+    div = series.diff
+    if isabs:
+        div = series.get("abs_diff", lambda: np.abs(series.diff))
+    def corridor():
+        # границы коридора - как pd.qcut(x, [ql, qh]) (через np.percentile)
+        low, high = np.percentile(series.sorted, np.asarray([ql, qh]) * 100.0)
+        inside = (series.x >= low) & (series.x <= high)
+        return inside[1:] & inside[:-1]
+    # коридор (ql, qh) общий для разных isabs и f_agg
+    ind = series.get(("corridor", ql, qh), corridor)
+    if not ind.any():
+        return 0.0
+    return getattr(np, f_agg)(div[ind])
+
+@calculator()
+def time_reversal_asymmetry_statistic(series, lag):
+    x, n = series.x, series.n
+    if 2 * lag >= n:
+        return 0.0
+    one_lag = x[lag:n - lag]
+    two_lag = x[2 * lag:]
+    x = x[:n - 2 * lag]
+    return np.mean(two_lag * two_lag * one_lag - one_lag * x * x)
+
+@calculator(combiner=True)
+def energy_ratio_by_chunks(series, param):
+    full_series_energy = series.get("energy", lambda: np.sum(series.x ** 2))
+    res = []
+    for config in param:
+        num_segments, segment_focus = config["num_segments"], config["segment_focus"]
+        assert segment_focus < num_segments
+        assert num_segments > 0
+        if full_series_energy == 0:
+            value = np.nan
+        else:
+            segments = series.get(("segments", num_segments), lambda: np.array_split(series.x, num_segments))
+            value = np.sum(segments[segment_focus] ** 2.0) / full_series_energy
+        res.append(value)
+    return res
+
+@calculator()
+def absolute_maximum(series):
+    return np.max(np.absolute(series.x)) if series.n > 0 else np.nan
+
+@calculator()
+def mean_change(series):
+    x = series.x
+    return (x[-1] - x[0]) / (series.n - 1) if series.n > 1 else np.nan
+
+def supported(fc_parameters: dict) -> bool:
+    """
+    Все ли калькуляторы из fc_parameters ({калькулятор: параметры}) есть здесь
+    """
+    return all(isinstance(name, str) and name in CALCULATORS for name in fc_parameters)
+
+class FeaturePlan():
+    """
+    Признаки одного kind, скомпилированные из fc_parameters: имена признаков
+    строятся один раз при компиляции, а на каждый ряд остается только вызов
+    калькуляторов (combiner - один раз со всеми наборами параметров)
+    """
+    def __init__(self, kind: str, fc_parameters: dict):
+        self.kind = kind
+        self.names = [] # имена признаков в порядке значений __call__
+        self.steps = [] # (функция, список параметров или None, combiner)
+        for name, param_list in fc_parameters.items():
+            func, combiner = CALCULATORS[name]
+            if param_list:
+                self.names.extend(f"{kind}__{name}__{output_format(param)}" for param in param_list)
+            else:
+                self.names.append(f"{kind}__{name}")
+            self.steps.append((func, param_list, combiner))
+
+    def __call__(self, x: np.ndarray) -> list:
+        """
+        Значения признаков ряда x в порядке self.names
+        """
+        series = Series(x)
+        values = []
+        for func, param_list, combiner in self.steps:
+            if combiner:
+                values.extend(func(series, param_list))
+            elif param_list:
+                values.extend(func(series, **param) for param in param_list)
+            else:
+                values.append(func(series))
+        return values
+
+PLANS = {} # ключ параметров -> (параметры, план): параметры держатся, чтобы id не переиспользовался
+MAX_PLANS = 256 # в процессах пула параметры приходят новыми объектами на каждую пачку
+
+def remember_plan(key, value):
+    if len(PLANS) >= MAX_PLANS:
+        PLANS.clear()
+    PLANS[key] = value
+
+def compile_plan(kind: str, fc_parameters: dict) -> FeaturePlan:
+    """
+    План для kind и fc_parameters (один на объект параметров)
+    """
+    key = (kind, id(fc_parameters))
+    if key not in PLANS or PLANS[key][0] is not fc_parameters:
+        remember_plan(key, (fc_parameters, FeaturePlan(kind, fc_parameters)))
+    return PLANS[key][1]
+
+def compile_table(kinds: list, default_fc_parameters: dict, kind_to_fc_parameters: dict = None) -> tuple:
+    """
+    Планы всех kind таблицы и порядок колонок
+    Returns:
+        tuple: (список (kind, план), имена признаков по алфавиту,
+        индексы значений планов подряд в порядке этих имен)
+    """
+    key = (tuple(kinds), id(default_fc_parameters), id(kind_to_fc_parameters))
+    parameters = (default_fc_parameters, kind_to_fc_parameters)
+    if key in PLANS and all(a is b for a, b in zip(PLANS[key][0], parameters)):
+        return PLANS[key][1]
+    plans = []
+    for kind in kinds:
+        fc_parameters = (kind_to_fc_parameters[kind]
+                         if kind_to_fc_parameters and kind in kind_to_fc_parameters
+                         else default_fc_parameters)
+        plans.append((kind, compile_plan(kind, fc_parameters)))
+    names = [name for _, plan in plans for name in plan.names]
+    order = np.argsort(np.array(names, dtype=object), kind="stable")
+    table = (plans, [names[i] for i in order], order)
+    remember_plan(key, (parameters, table))
+    return table
+
+def extract_series(x: np.ndarray, kind: str, fc_parameters: dict) -> dict:
+    """
+    Признаки одного ряда
+    Args:
+        x (np.ndarray): значения ряда (float64, упорядоченные по времени)
+        kind (str): имя ряда (колонки), начало имен признаков
+        fc_parameters (dict): {калькулятор: список параметров или None}, как в tsfresh
+    Returns:
+        dict: {имя признака tsfresh: значение}
+    """
+    plan = compile_plan(kind, fc_parameters)
+    return dict(zip(plan.names, plan(x)))
+
+def extract_features(long_df: pd.DataFrame, column_id: str, column_sort: str,
+                     default_fc_parameters: dict, kind_to_fc_parameters: dict = None, pool=None) -> pd.DataFrame:
+    """
+    Аналог tsfresh.extract_features для long_df в "широком" формате
+    (колонки id, sort и по колонке на каждый kind); pool - см. extract_blocks
+    Returns:
+        pd.DataFrame: признаки (колонки отсортированы по имени), индекс - id
+        в порядке первого появления в long_df
+    """
+    kinds = [column for column in long_df.columns if column not in (column_id, column_sort)]
+    ids = long_df[column_id].to_numpy()
+    order = None
+    if len(ids) > 1 and (np.any(ids[1:] < ids[:-1]) or column_sort is not None and
+                         np.any(np.diff(long_df[column_sort].to_numpy()) < 0)):
+        # строки одного id подряд, внутри id - по column_sort
+        order = np.arange(len(long_df))
+        if column_sort is not None:
+            order = np.argsort(long_df[column_sort].to_numpy(), kind="stable")
+        order = order[np.argsort(ids[order], kind="stable")]
+        ids = ids[order]
+    values = {}
+    for kind in kinds:
+        values[kind] = long_df[kind].to_numpy(dtype=np.float64)
+        if order is not None:
+            values[kind] = values[kind][order]
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    # сигналы - в порядке первого появления id в long_df
+    positions = dict(zip(ids[starts].tolist(), starts))
+    unique_ids = pd.unique(long_df[column_id])
+    block_starts = np.array([positions[sample_id] for sample_id in unique_ids], dtype=np.int64)
+    block_ends = np.r_[starts[1:], len(ids)][np.searchsorted(starts, block_starts)]
+    return extract_blocks(values, block_starts, unique_ids, default_fc_parameters, kind_to_fc_parameters,
+                          ends=block_ends, pool=pool)
+
+def extract_blocks(values: dict, starts: np.ndarray, ids, default_fc_parameters: dict,
+                   kind_to_fc_parameters: dict = None, ends: np.ndarray = None, pool=None) -> pd.DataFrame:
+    """
+    Признаки сигналов, лежащих в массивах подряд (без long_df)
+    Args:
+        values (dict): {kind: отсчеты всех сигналов (float64)}
+        starts (np.ndarray): начало каждого сигнала в массивах
+        ids: id сигналов (индекс результата)
+        ends (np.ndarray, optional): концы сигналов, по умолчанию - начало следующего
+        pool (FeaturePool, optional): если задан и сигналов несколько, они
+        делятся на pool.workers частей, которые считаются в процессах пула
+    Returns:
+        pd.DataFrame: признаки (колонки отсортированы по имени), индекс - ids
+    """
+    kinds = list(values)
+    if ends is None:
+        ends = np.append(starts[1:], len(values[kinds[0]]) if kinds else 0)
+    if pool is not None and len(starts) > 1:
+        args = []
+        for part in np.array_split(np.arange(len(starts)), min(pool.workers, len(starts))):
+            # в процесс уходят только отсчеты своих сигналов
+            low, high = starts[part].min(), ends[part].max()
+            args.append(({kind: values[kind][low:high] for kind in kinds}, starts[part] - low,
+                         np.asarray(ids)[part], default_fc_parameters, kind_to_fc_parameters, ends[part] - low))
+        return pd.concat(pool.starmap(extract_blocks, args))
+    plans, names, columns = compile_table(kinds, default_fc_parameters, kind_to_fc_parameters)
+    rows = np.empty((len(starts), len(names)), dtype=np.float64)
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        row = []
+        for kind, plan in plans:
+            row.extend(plan(values[kind][start:end]))
+        rows[i] = np.array(row, dtype=np.float64)[columns]
+    return pd.DataFrame(rows, index=ids, columns=names)
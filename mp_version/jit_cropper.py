@@ -0,0 +1,203 @@
+'''
+Detector + Cropper для сотен каналов, скомпилированный numba.
+
+Логика событий та же, что у Cropper (см. cropper.py) с Detector (СКО фрейма
+относительно СКО шума из первого фрейма): тревога, охлаждение, max_time,
+отступ indent_time перед пиком (с заходом в предыдущие фреймы). Состояние
+всех каналов хранится в массивах, и один вызов step обновляет их все без
+Python-ветвлений на каждый канал. Сигнал тревоги - всегда непрерывный
+кусок потока, поэтому step возвращает только (канал, начало, конец) в
+номерах отсчетов от начала работы, а сами отсчеты берутся из кольцевого
+буфера потока, в который step пишет фрейм за тот же проход по памяти,
+что и при расчете СКО.
+
+Адаптивный шум, onset_window и предварительная классификация здесь не
+поддерживаются (для них есть MultiCropper).
+
+Совпадение с Cropper проверяет tests/test_jit_cropper.py, замер скорости:
+    python jit_cropper.py --channels 500 --frames 60
+'''
+import time
+import argparse
+import numpy as np
+from numba import njit
+
+@njit(cache=True)
+def step(frames, t0, stream, noise_mean, noise_std, threshold, indent_time, max_cooling_time, max_time,
+         alarm_flag, curr_cooling_time, cached_len, alarm_start, events):
+    """
+    Обработка одного фрейма всех каналов: запись фрейма в кольцевой буфер
+    потока, СКО фрейма по каналам (за тот же проход по памяти) и события Cropper
+    Args:
+        frames (np.ndarray): фрейм (время x каналы)
+        t0 (int): номер первого отсчета фрейма от начала работы
+        stream (np.ndarray): кольцевой буфер потока (отсчет t в строке t % len(stream))
+        noise_mean, noise_std (np.ndarray): среднее и СКО шума по каналам
+        alarm_flag, curr_cooling_time, cached_len, alarm_start (np.ndarray):
+        состояние каналов (обновляется на месте)
+        events (np.ndarray): массив каналы x 3 для закончившихся тревог
+    Returns:
+        int: кол-во закончившихся тревог, events[:n] - (канал, начало, конец)
+    """
+    frame_len, n_channels = frames.shape
+    capacity = stream.shape[0]
+    # суммы отклонений от среднего шума (сдвиг сохраняет точность дисперсии)
+    sum1 = np.zeros(n_channels)
+    sum2 = np.zeros(n_channels)
+    for t in range(frame_len):
+        row = frames[t]
+        stream_row = stream[(t0 + t) % capacity]
+        for c in range(n_channels):
+            stream_row[c] = row[c]
+            d = row[c] - noise_mean[c]
+            sum1[c] += d
+            sum2[c] += d * d
+    n_events = 0
+    for c in range(n_channels):
+        finished = False
+        frame_std = np.sqrt(max(sum2[c] / frame_len - (sum1[c] / frame_len) ** 2, 0.0))
+        if cached_len[c] > max_time:
+            # Событие: длительность тревоги превысила лимит!
+            finished = True
+        elif frame_std / noise_std[c] > threshold:
+            # Событие: детектор сработал
+            if not alarm_flag[c]:
+                # Событие: тревога произошла в первый раз, отступ перед пиком
+                x = frames[:, c].copy()
+                frame_max = x.max()
+                frame_median = np.median(x)
+                frame_min = x.min()
+                if (frame_max - frame_median) < (frame_median - frame_min):
+                    peak_idx = x.argmin()
+                else:
+                    peak_idx = x.argmax()
+                alarm_start[c] = max(0, t0 + peak_idx - indent_time)
+                cached_len[c] = t0 + frame_len - alarm_start[c]
+                alarm_flag[c] = True
+            else:
+                # Событие: тревога уже была раньше
+                cached_len[c] += frame_len
+            curr_cooling_time[c] = 0
+        elif alarm_flag[c]:
+            if curr_cooling_time[c] > max_cooling_time:
+                # Событие: время охлаждения вышло
+                finished = True
+            else:
+                # Событие: время охлаждения еще не закончилось
+                curr_cooling_time[c] += frame_len
+                cached_len[c] += frame_len
+        if finished:
+            events[n_events, 0] = c
+            events[n_events, 1] = alarm_start[c]
+            events[n_events, 2] = alarm_start[c] + cached_len[c]
+            n_events += 1
+            alarm_flag[c] = False
+            curr_cooling_time[c] = 0
+            cached_len[c] = 0
+    return n_events
+
+class JitCropper():
+    """
+    Detector + Cropper сразу для всех каналов (интерфейс как у MultiCropper):
+    вызывается с фреймом (время x каналы), возвращает список
+    (индекс канала, обрезанный сигнал) для каналов, где тревога закончилась.
+    Диапазоны отсчетов последних тревог лежат в self.events[:self.n_events].
+    """
+    def __init__(self, n_channels, indent_time=500, cooling_time=1000, max_time=10000, threshold=2):
+        self.n_channels = n_channels
+        self.indent_time = indent_time # кол-во отсчетов для отступа
+        self.max_cooling_time = cooling_time # кол-во отсчетов охлаждения
+        self.max_time = max_time # максимальное кол-во отсчетов
+        self.threshold = threshold # порог детектора (превышение СКО шума)
+
+        self.is_fitted = False
+        self.noise_std = None
+        self.noise_mean = None
+        self.alarm_flag = np.zeros(n_channels, dtype=np.bool_)
+        self.curr_cooling_time = np.zeros(n_channels, dtype=np.int64)
+        self.cached_len = np.zeros(n_channels, dtype=np.int64)
+        self.alarm_start = np.zeros(n_channels, dtype=np.int64) # номер первого отсчета тревоги
+        self.events = np.zeros((n_channels, 3), dtype=np.int64)
+        self.n_events = 0
+        self.samples = 0 # сколько отсчетов пришло с начала работы
+        # кольцевой буфер потока: отсчет t лежит в строке t % len(stream)
+        self.stream = None
+        self.provisional = [] # предварительная классификация не поддерживается
+
+    def reserve(self, frames):
+        """
+        Выделение кольцевого буфера потока: тревога не длиннее
+        max_time + фрейм + отступ и заканчивается не раньше чем за фрейм до текущего
+        """
+        capacity = self.max_time + 2 * frames.shape[0] + self.indent_time
+        if self.stream is not None and len(self.stream) >= capacity:
+            return
+        stream = np.zeros((capacity, self.n_channels), dtype=frames.dtype)
+        if self.stream is not None:
+            rows = np.arange(max(0, self.samples - len(self.stream)), self.samples)
+            stream[rows % capacity] = self.stream[rows % len(self.stream)]
+        self.stream = stream
+
+    def signal(self, c, start, end) -> np.ndarray:
+        """
+        Отсчеты [start, end) канала c из буфера потока (копия)
+        """
+        return self.stream[np.arange(start, end) % len(self.stream), c]
+
+    def __call__(self, frames):
+        """
+        Обработка очередного фрейма всех каналов
+        Args:
+            frames (np.ndarray): фрейм (время x каналы)
+        Returns:
+            list[tuple[int, np.ndarray]]: (индекс канала, обрезанный сигнал)
+        """
+        self.reserve(frames)
+        if not self.is_fitted:
+            # в первую секунду запоминаем СКО в "спокойном" режиме системы
+            self.noise_std = np.std(frames, axis=0)
+            self.noise_mean = np.mean(frames, axis=0)
+            self.is_fitted = True
+            rows = np.arange(self.samples, self.samples + frames.shape[0])
+            self.stream[rows % len(self.stream)] = frames
+            self.samples += frames.shape[0]
+            return []
+        n_events = step(frames, self.samples, self.stream, self.noise_mean, self.noise_std,
+                        self.threshold, self.indent_time, self.max_cooling_time, self.max_time,
+                        self.alarm_flag, self.curr_cooling_time, self.cached_len,
+                        self.alarm_start, self.events)
+        self.samples += frames.shape[0]
+        return [(c, self.signal(c, start, end)) for c, start, end in self.events[:n_events]]
+
+def benchmark(n_channels, n_frames, frame_len=1000):
+    """
+    Время обработки одного фрейма всех каналов: JitCropper, MultiCropper,
+    Cropper на каждый канал (второй проход по тому же потоку)
+    """
+    from cropper import Cropper
+    from detector import Detector
+    from multizone import MultiCropper, MultiDetector
+    from driver_simulator import make_stream
+    stream = make_stream(n_frames * frame_len, n_channels)
+    engines = {
+        "jit": JitCropper(n_channels, 500, 1000, 10000, threshold=3),
+        "multizone": MultiCropper(n_channels, 500, 1000, 10000, detector=MultiDetector(3)),
+    }
+    croppers = [Cropper(500, 1000, 10000, detector=Detector(3)) for _ in range(n_channels)]
+    engines["cropper"] = lambda frames: [cropper(frames[:, c]) for c, cropper in enumerate(croppers)]
+    for name, engine in engines.items():
+        # первый проход не замеряется: компиляция numba и первое касание страниц буферов
+        for i in range(0, len(stream), frame_len):
+            engine(stream[i:i + frame_len])
+        start = time.perf_counter()
+        for i in range(0, len(stream), frame_len):
+            engine(stream[i:i + frame_len])
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {1000 * elapsed / n_frames:.2f} ms per frame ({n_channels} channels)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--frames", type=int, default=60)
+    args = parser.parse_args()
+    benchmark(args.channels, args.frames)
@@ -4,7 +4,8 @@ import json
 from detector import Detector
 from cropper import Cropper
 from classifier import Classifier
-from saver import Saver
+from worker import InferenceWorker
+from metrics import Metrics
 import multiprocessing as mp
 script_folder  = 'scripts/'
 sys.path.append(script_folder)
@@ -29,12 +30,23 @@ class Mainloop():
                  cooling_time=1000,
                  max_time=10000,
                  threshold=2,
+                 adaptive_horizon=None,
+                 onset_window=None,
                  plotting=False,
                  verbose=True,
                  save_path=None,
                  zone_num=None,
                  max_files_count=250,
-                 saving=False):
+                 saving=False,
+                 inference_queue_size=8,
+                 metrics_path=None,
+                 metrics_interval=60,
+                 provisional_interval=None,
+                 native_features=True,
+                 feature_workers=0,
+                 batch_window=None,
+                 flat_forest=True,
+                 reload_interval=None):
         """
         Задает все необходимые параметры для Detector, Cropper, Preprocessor, Classifier
 
@@ -55,6 +67,12 @@ class Mainloop():
             
             threshold (int, optional): Порог срабатывания детектора (превышение СКО).
             По умолчанию = 2.
+
+            adaptive_horizon (int, optional): Горизонт переоценки шума детектора, отсчетов
+            (см. Detector). По умолчанию None (шум оценивается один раз в первую секунду).
+
+            onset_window (int, optional): Окно (отсчетов) скользящего СКО детектора для
+            поиска точного начала тревоги (см. Detector). По умолчанию None (СКО по фрейму).
             
             plotting (bool, optional): Строить ли графики?  По умолчанию False.
             
@@ -69,35 +87,125 @@ class Mainloop():
             По умолчанию 250.
             
             saving (bool, optional): Сохранять ли тревоги в save_path? По умолчанию False.
+            
+            inference_queue_size (int, optional): Размер очереди фоновой классификации
+            (см. InferenceWorker). 0 - классификация прямо в receive. По умолчанию 8.
+            
+            metrics_path (str, optional): Файл, в который раз в metrics_interval секунд
+            дописываются гистограммы времени работы этапов (JSON lines, см. metrics.py).
+            По умолчанию None (замеры копятся, но не выгружаются).
+            
+            metrics_interval (int, optional): Период выгрузки замеров, с. По умолчанию 60.
+
+            provisional_interval (int, optional): Период (в отсчетах сигнала тревоги)
+            предварительной классификации еще не закончившейся тревоги. В выходную
+            очередь она попадает с 'provisional': True. По умолчанию None (выключено).
+
+            native_features (bool, optional): Считать признаки модели без tsfresh
+            (см. features.py). По умолчанию True.
+
+            feature_workers (int, optional): Кол-во процессов постоянного пула для
+            расчета признаков пачки тревог (см. feature_pool.py). Одна тревога
+            считается в этом процессе, n_jobs из обученной модели не используется.
+            По умолчанию 0 (без пула).
+
+            batch_window (float, optional): Окно сбора пачки тревог для фоновой
+            классификации, с: тревоги, пришедшие в очередь за это время после первой,
+            классифицируются одним вызовом (Classifier.predict_batch).
+            По умолчанию None (каждая тревога отдельно).
+
+            flat_forest (bool, optional): Считать случайный лес модели плоскими
+            массивами numpy (см. forest.py), результат тот же. По умолчанию True.
+
+            reload_interval (float, optional): Период проверки файла модели, с:
+            новая модель загружается в фоне и подменяет текущую между тревогами
+            без перезапуска (см. Classifier.refresh). По умолчанию None (выключено).
         """
-        self.detector = Detector(threshold)
-        self.cropper = Cropper(indent_time, cooling_time, max_time, detector=self.detector)
-        self.classifier = Classifier(model_path=model_path)
+        self.detector = Detector(threshold, adaptive_horizon, onset_window)
+        self.cropper = Cropper(indent_time, cooling_time, max_time, detector=self.detector,
+                               provisional_interval=provisional_interval)
+        # состояние классификации еще не закончившейся тревоги (см. Classifier.predict)
+        self.prefix = None
+        self.classifier = Classifier(model_path=model_path, native_features=native_features,
+                                     feature_workers=feature_workers, flat_forest=flat_forest,
+                                     reload_interval=reload_interval)
         self.qOut   = qOut
         self.verbose = verbose
         self.plotting = plotting
         self.saving = saving
         self.zone_num = zone_num
         if self.saving:
+            from saver import Saver # h5py нужен только при сохранении тревог
             assert save_path, "You should specify save path"
             assert zone_num, "You should specify zone number"
             self.saver = Saver(save_path, zone_num, max_files_count)
+        self.worker = None
+        if inference_queue_size:
+            self.worker = InferenceWorker(self.classifier, self.report_alarm, inference_queue_size,
+                                          batch_window)
+        # замеры времени этапов: детектор, cropper, шаги pipeline, сохранение
+        self.metrics = Metrics(metrics_path, metrics_interval, extra=self.stats,
+                               labels={"zone": str(zone_num)})
+        self.detector.detect = self.metrics.wrap("detect", self.detector.detect)
+        self.classifier.instrument(self.metrics)
     def receive(self, data):
         """
         Метод для классификации/набора полученного сигнала.
+        Если включена фоновая классификация, сигнал только ставится в очередь.
         
         data - сигнал по одной зоне
         """
-        self.stored_signal = self.cropper(data)
+        with self.metrics.timer("crop"):
+            self.stored_signal = self.cropper(data)
+        if self.cropper.provisional_signal is not None:
+            if self.prefix is None:
+                self.prefix = {}
+            self.process_alarm(self.cropper.provisional_signal, self.prefix, provisional=True)
         if self.stored_signal is not None:
-            predictions = self.classifier.predict(self.stored_signal)
-            alarm_name, alarm_prob = max(predictions.items(), key=lambda x: x[1])
-            if self.verbose:
-                self.qOut.put({'nchn':self.zone_num, 'width': 1, 'alarm':alarm_name, 'timestamp':time.time()})
-            if self.saving:
-                self.saver.save_alarm(self.stored_signal, predictions)
-            if self.plotting:
-                self.classifier.plot(self.stored_signal, predictions)
+            prefix, self.prefix = self.prefix, None
+            self.process_alarm(self.stored_signal, prefix)
+        self.metrics.maybe_export()
+    def process_alarm(self, signal, prefix=None, provisional=False):
+        """
+        Классификация сигнала (в фоновом потоке, если он включен)
+        Args:
+            signal (np.ndarray): сигнал после Cropper
+            prefix (dict, optional): состояние классификации этой тревоги (см. Classifier.predict)
+            provisional (bool, optional): предварительная классификация. По умолчанию False.
+        """
+        if self.worker is not None:
+            self.worker.submit(signal, provisional, prefix=prefix, low_priority=provisional)
+        else:
+            self.classifier.refresh()
+            self.report_alarm(signal, self.classifier.predict(signal, prefix), provisional)
+    def report_alarm(self, signal, predictions, provisional=False):
+        """
+        Отправка в выходную очередь, сохранение и отрисовка результата классификации
+        (предварительный результат только отправляется в очередь)
+        """
+        alarm_name, alarm_prob = max(predictions.items(), key=lambda x: x[1])
+        if self.verbose:
+            self.qOut.put({'nchn':self.zone_num, 'width': 1, 'alarm':alarm_name, 'timestamp':time.time(),
+                           'provisional': provisional, 'model_version': self.classifier.model_version})
+        if provisional:
+            return
+        if self.saving:
+            with self.metrics.timer("save"):
+                self.saver.save_alarm(signal, predictions, self.classifier.model_version)
+        if self.plotting:
+            self.classifier.plot(signal, predictions)
+    def stats(self) -> dict:
+        """
+        Счетчики очереди фоновой классификации и адаптивного детектора
+        """
+        stats = self.worker.stats() if self.worker is not None else {}
+        if self.detector.is_fitted:
+            stats["noise_std"] = float(self.detector.noise_std)
+        if self.detector.adaptive_horizon:
+            # без адаптации теневые счетчики тревог не ведутся (см. Cropper.track_static_alarm)
+            stats["avoided_alarms"] = self.cropper.static_alarms - self.cropper.alarms
+        stats.update(self.classifier.stats())
+        return stats
     def start_test(self, path_to_test_signal:str, step:int=1000):
         """
         Тестовая программа для проверки работы системы.
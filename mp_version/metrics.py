@@ -0,0 +1,137 @@
+import time
+import json
+import bisect
+import threading
+import functools
+from contextlib import contextmanager
+
+class LatencyHistogram():
+    """
+    Гистограмма времени выполнения с фиксированными логарифмическими
+    бинами (10 бинов на декаду, от 10 мкс до 100 с). Запись одного значения -
+    это bisect по списку границ и пара сложений, поэтому гистограммы можно
+    не выключать в рабочем режиме. Квантили оцениваются по верхней границе бина
+    (погрешность не больше ширины бина, ~25%).
+    """
+    edges = [10 ** (k / 10) for k in range(-50, 21)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(self.edges, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Оценка квантиля q (0 < q < 1), с
+        """
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(self.edges[i], self.max) if i < len(self.edges) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else None,
+                "max": self.max,
+                "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99)}
+
+class Metrics():
+    """
+    Замер времени работы этапов обработки (чтение фрейма, Detector, Cropper,
+    шаги pipeline классификатора, predict_proba, Saver).
+    Для каждого этапа ведется своя LatencyHistogram. Раз в interval секунд
+    гистограммы выгружаются одной JSON-строкой в файл path и обнуляются,
+    то есть каждая строка описывает только свой интервал.
+    """
+    def __init__(self, path=None, interval=60.0, extra=None, labels=None):
+        """
+        Args:
+            path (str, optional): файл для выгрузки (JSON lines). Если не задан,
+            гистограммы только копятся (см. Metrics.to_dict)
+            interval (float, optional): период выгрузки, с. По умолчанию 60.
+            extra (callable, optional): функция, возвращающая dict счетчиков,
+            которые нужно добавить в выгрузку (например Mainloop.stats)
+            labels (dict, optional): постоянные поля выгрузки (например номер зоны)
+        """
+        self.path = path
+        self.interval = interval
+        self.extra = extra
+        self.labels = labels or {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.last_export = time.monotonic()
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Замер времени выполнения блока with
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def wrap(self, stage: str, func):
+        """
+        Обертка над функцией func, которая замеряет время каждого ее вызова
+        """
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def to_dict(self, reset=False) -> dict:
+        """
+        Текущие гистограммы всех этапов (reset=True - обнулить их)
+        """
+        with self.lock:
+            histograms = self.histograms
+            if reset:
+                self.histograms = {}
+            stages = {stage: histogram.to_dict() for stage, histogram in histograms.items()}
+        result = {"timestamp": time.time(), **self.labels, "stages": stages}
+        if self.extra is not None:
+            result["counters"] = self.extra()
+        return result
+
+    def maybe_export(self):
+        """
+        Выгрузка, если с прошлой выгрузки прошло больше interval секунд
+        (вызывается в цикле обработки, проверка стоит одного time.monotonic)
+        """
+        if self.path is not None and time.monotonic() - self.last_export >= self.interval:
+            self.export()
+
+    def export(self):
+        """
+        Дописать гистограммы одной JSON-строкой в файл path и обнулить их
+        """
+        self.last_export = time.monotonic()
+        line = json.dumps(self.to_dict(reset=True))
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
@@ -0,0 +1,532 @@
+import time
+import numpy as np
+from classifier import Classifier
+from worker import InferenceWorker
+from metrics import Metrics
+from detector import rolling_std
+from ringbuffer import RingBuffer
+
+class MultiDetector():
+    """
+    Детектор сразу для всех каналов (зон). Аналог Detector, но СКО
+    считается одной numpy-редукцией по оси времени матрицы (время x каналы)
+    """
+    def __init__(self, threshold, adaptive_horizon=None, onset_window=None):
+        """
+        threshold (int): Порог тревоги. Допустимое отношение СКО
+        внутри фрейма относительно шума устройства
+        adaptive_horizon (int, optional): Горизонт переоценки шума, отсчетов
+        (см. Detector). По умолчанию None.
+        onset_window (int, optional): Длина скользящего окна СКО, отсчетов
+        (см. Detector). По умолчанию None.
+        is_fitted (bool): Настроен ли детектор?
+        """
+        self.threshold = threshold
+        self.adaptive_horizon = adaptive_horizon
+        self.onset_window = onset_window
+        self.is_fitted = False
+        self.onset = None # индекс начала тревоги в последнем фрейме по каналам (-1 - нет)
+    def fit(self, frames):
+        """
+        Оценка СКО шума устройства по каждому каналу
+        frames: np.ndarray - матрица шума (время x каналы)
+        """
+        self.noise_std = np.std(frames, axis=0)
+        self.noise_mean = np.mean(frames, axis=0)
+        self.noise_var = self.noise_std ** 2
+        self.static_noise_std = self.noise_std.copy()
+        self.static_triggered = np.zeros(frames.shape[1], dtype=bool)
+        if self.onset_window:
+            self.tail = np.asarray(frames[max(0, len(frames) - self.onset_window + 1):], dtype=np.float64)
+        self.is_fitted = True
+    def detect(self, frames) -> np.ndarray:
+        """
+        Проверка наличия тревоги по всем каналам
+        Args:
+            frames (np.ndarray): фрейм данных от прибора (время x каналы)
+        Returns:
+            np.ndarray: bool-маска каналов, на которых есть тревога
+        """
+        assert self.is_fitted, "Detector is not fitted!"
+        frames_std = np.std(frames, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if self.onset_window:
+                # СКО в окне, заканчивающемся на каждом отсчете (см. Detector.window_std)
+                signal = np.concatenate([self.tail, frames])
+                self.tail = signal[max(0, len(signal) - self.onset_window + 1):]
+                if len(signal) < self.onset_window:
+                    stds = np.zeros((0, frames.shape[1]))
+                else:
+                    stds = rolling_std(signal, self.onset_window)
+                exceeded = stds / self.noise_std > self.threshold
+                triggered = exceeded.any(axis=0)
+                self.onset = np.where(triggered, exceeded.argmax(axis=0) + len(frames) - len(stds), -1)
+                level = stds.max(axis=0) if len(stds) else np.zeros(frames.shape[1])
+            else:
+                triggered = frames_std / self.noise_std > self.threshold
+                level = frames_std
+            if self.adaptive_horizon:
+                self.static_triggered = level / self.static_noise_std > self.threshold
+                # обновление шума только на спокойных каналах (см. Detector.update)
+                alpha = min(1.0, frames.shape[0] / self.adaptive_horizon)
+                quiet = ~triggered
+                self.noise_var[quiet] += alpha * (frames_std[quiet] ** 2 - self.noise_var[quiet])
+                self.noise_std = np.sqrt(self.noise_var)
+        return triggered
+
+class MultiCropper():
+    """
+    Cropper сразу для всех каналов. Логика событий та же, что в Cropper
+    (см. cropper.py), но состояние всех каналов хранится в массивах:
+    флажки тревоги, время охлаждения, длина набранного сигнала, а сами
+    сигналы в одной заранее выделенной матрице (каналы x отсчеты).
+    Python-цикл идет только по каналам, на которых закончилась тревога
+    или тревога произошла в первый раз.
+    """
+    def __init__(self, n_channels, indent_time=500, cooling_time=1000, max_time=10000, detector=None,
+                 provisional_interval=None):
+        self.n_channels = n_channels
+        self.indent_time = indent_time # кол-во отсчетов для отступа
+        self.max_cooling_time = cooling_time # кол-во отсчетов охлаждения
+        self.max_time = max_time # максимальное кол-во отсчетов
+        self.detector = detector # Детектор, описанный в классе MultiDetector()
+
+        self.alarm_flag = np.zeros(n_channels, dtype=bool)
+        self.curr_cooling_time = np.zeros(n_channels, dtype=np.int64)
+        self.cached_len = np.zeros(n_channels, dtype=np.int64) # длина набранного сигнала
+        self.cached_frames = np.zeros((n_channels, 0)) # набранные сигналы (каналы x отсчеты)
+        # pre-roll: последние indent_time отсчетов всех каналов (см. Cropper.history)
+        self.history = None
+        # предварительная классификация (см. Cropper.provisional_signal):
+        # список (индекс канала, копия набранного сигнала) за последний вызов
+        self.provisional_interval = provisional_interval
+        self.provisional = []
+        self.next_provisional = np.zeros(n_channels, dtype=np.int64)
+        self.alarms = np.zeros(n_channels, dtype=np.int64) # тревог отдано на классификацию
+        # тревоги с шумом детектора из fit (см. Cropper.track_static_alarm)
+        self.static_alarms = np.zeros(n_channels, dtype=np.int64)
+        self.static_alarm_flag = np.zeros(n_channels, dtype=bool)
+        self.static_cooling_time = np.zeros(n_channels, dtype=np.int64)
+        self.static_len = np.zeros(n_channels, dtype=np.int64)
+
+    def reserve(self, frames):
+        """
+        Выделение памяти под сигналы: набранный сигнал не может быть длиннее
+        max_time + длина фрейма + отступ. Тип данных - как у входных фреймов
+        (см. Cropper.reserve), буфер пересоздается, только если пришел фрейм
+        длиннее прежних (или другого типа данных)
+        """
+        capacity = self.max_time + frames.shape[0] + self.indent_time
+        size = self.cached_frames.shape[1]
+        if size == 0:
+            self.cached_frames = np.zeros((self.n_channels, capacity), dtype=frames.dtype)
+        elif size < capacity or self.cached_frames.dtype != frames.dtype:
+            cached_frames = np.zeros((self.n_channels, max(capacity, size)),
+                                     dtype=np.result_type(self.cached_frames, frames))
+            cached_frames[:, :size] = self.cached_frames
+            self.cached_frames = cached_frames
+
+    def track_static_alarms(self, frame_len):
+        """
+        Подсчет тревог, которые выдал бы детектор без адаптации шума,
+        по всем каналам сразу (см. Cropper.track_static_alarm)
+        """
+        overflow = self.static_len > self.max_time
+        triggered = ~overflow & self.detector.static_triggered
+        cooling = ~overflow & ~triggered & self.static_alarm_flag
+        cooled = cooling & (self.static_cooling_time > self.max_cooling_time)
+        cooling &= ~cooled
+        finished = overflow | cooled
+        self.static_alarms += finished
+        self.static_alarm_flag[finished] = False
+        self.static_cooling_time[finished] = 0
+        self.static_len[finished] = 0
+        new_alarm = triggered & ~self.static_alarm_flag
+        self.static_len[new_alarm] = self.indent_time
+        self.static_alarm_flag |= triggered
+        self.static_cooling_time[triggered] = 0
+        self.static_cooling_time[cooling] += frame_len
+        self.static_len[triggered | cooling] += frame_len
+
+    def remember(self, frames):
+        """
+        Запись фрейма в pre-roll
+        """
+        if self.history is None:
+            self.history = RingBuffer(capacity=max(self.indent_time, 1), width=self.n_channels,
+                                      dtype=frames.dtype)
+        self.history.append(frames)
+
+    def indent_first_frames(self, frames, channels):
+        """
+        Отступ в self.indent_time отсчетов перед пиком для каналов channels,
+        на которых тревога произошла в первый раз (см. Cropper.indent_first_frame)
+        Returns:
+            list[np.ndarray]: сигнал с отступом для каждого канала
+        """
+        frames_current = frames[:, channels]
+        frame_max = np.max(frames_current, axis=0)
+        frame_median = np.median(frames_current, axis=0)
+        frame_min = np.min(frames_current, axis=0)
+        peak_idxs = np.where((frame_max - frame_median) < (frame_median - frame_min),
+                             frames_current.argmin(axis=0),
+                             frames_current.argmax(axis=0))
+        if self.detector.onset is not None:
+            # детектор со скользящим окном сам нашел отсчет начала тревоги
+            peak_idxs = self.detector.onset[channels]
+        indented = []
+        for i, (c, peak_idx) in enumerate(zip(channels, peak_idxs)):
+            if peak_idx >= self.indent_time:
+                indented.append(frames_current[peak_idx - self.indent_time:, i])
+            else:
+                indented.append(np.concatenate([
+                    self.history.last(self.indent_time - peak_idx)[:, c],
+                    frames_current[:, i]
+                ]))
+        return indented
+
+    def __call__(self, frames):
+        """
+        Обработка очередного фрейма всех каналов
+        Args:
+            frames (np.ndarray): фрейм (время x каналы)
+        Returns:
+            list[tuple[int, np.ndarray]]: (индекс канала, обрезанный сигнал)
+            для каналов, на которых тревога закончилась
+        """
+        if not self.detector.is_fitted:
+            # в первую секунду запоминаем СКО в "спокойном" режиме системы
+            self.detector.fit(frames)
+            self.remember(frames)
+            return []
+        frame_len = frames.shape[0]
+        self.reserve(frames)
+
+        # Событие: длительность тревоги превысила лимит!
+        overflow = self.cached_len > self.max_time
+        triggered = ~overflow & self.detector.detect(frames)
+        new_alarm = triggered & ~self.alarm_flag
+        cooling = ~overflow & ~triggered & self.alarm_flag
+        # Событие: время охлаждения вышло
+        cooled = cooling & (self.curr_cooling_time > self.max_cooling_time)
+        cooling &= ~cooled
+        finished = overflow | cooled
+
+        results = []
+        for c in np.flatnonzero(finished):
+            results.append((c, self.cached_frames[c, :self.cached_len[c]].copy()))
+        self.alarms += finished
+        self.alarm_flag[finished] = False
+        self.curr_cooling_time[finished] = 0
+        self.cached_len[finished] = 0
+
+        # Событие: тревога произошла в первый раз
+        new_channels = np.flatnonzero(new_alarm)
+        if len(new_channels):
+            for c, indented in zip(new_channels, self.indent_first_frames(frames, new_channels)):
+                self.cached_frames[c, :len(indented)] = indented
+                self.cached_len[c] = len(indented)
+            self.alarm_flag[new_channels] = True
+            self.next_provisional[new_channels] = self.provisional_interval or 0
+
+        # Событие: тревога уже была раньше или еще не закончилось охлаждение
+        appending = np.flatnonzero((triggered & ~new_alarm) | cooling)
+        if len(appending):
+            cols = self.cached_len[appending, None] + np.arange(frame_len)
+            self.cached_frames[appending[:, None], cols] = frames[:, appending].T
+            self.cached_len[appending] += frame_len
+        self.curr_cooling_time[triggered] = 0
+        self.curr_cooling_time[cooling] += frame_len
+        if self.detector.adaptive_horizon:
+            self.track_static_alarms(frame_len)
+
+        # Событие: тревога еще идет, пора выдать предварительную классификацию
+        self.provisional = []
+        if self.provisional_interval:
+            for c in np.flatnonzero(self.alarm_flag & (self.cached_len >= self.next_provisional)):
+                self.provisional.append((c, self.cached_frames[c, :self.cached_len[c]].copy()))
+                self.next_provisional[c] = (self.cached_len[c] // self.provisional_interval + 1) * self.provisional_interval
+
+        # фрейм запоминается на всех каналах, в том числе там, где тревога
+        # закончилась: следующая тревога может начаться сразу за ним (как в Cropper)
+        self.remember(frames)
+        return results
+
+class EventMerger():
+    """
+    Объединение тревог на соседних позициях трассы в одно событие:
+    одно воздействие обычно видно сразу на нескольких соседних каналах.
+    Тревоги (в том числе еще не закончившиеся) связаны, если позиции каналов
+    отличаются не больше чем на distance, а интервалы отсчетов пересекаются.
+    Закончившаяся тревога ждет, пока не закончатся все связанные с ней
+    (в том числе через цепочку соседей), после чего вся группа выдается
+    одним событием. При непрерывных воздействиях на соседних каналах цепочка
+    может не заканчиваться никогда, поэтому ожидание ограничено max_wait:
+    группа выдается, как только ее самая старая тревога ждет дольше.
+    """
+    def __init__(self, positions, distance=1, max_wait=None):
+        """
+        Args:
+            positions (np.ndarray): позиции каналов на трассе
+            distance (int): максимальное расстояние между позициями соседних каналов
+            max_wait (int, optional): сколько отсчетов закончившаяся тревога
+            может ждать связанные с ней. По умолчанию None (без ограничения).
+        """
+        self.positions = np.asarray(positions)
+        self.distance = distance
+        self.max_wait = max_wait
+        self.pending = [] # закончившиеся тревоги (канал, начало, конец, тревога из finished)
+        self.merged = 0 # сколько тревог вошло в группы, не будучи в них сильнейшей
+        self.timeouts = 0 # сколько групп выдано по max_wait, а не по окончании всех тревог
+
+    def __call__(self, finished, end, open_channels, open_starts, now):
+        """
+        Args:
+            finished (list[tuple]): тревоги, закончившиеся на этом фрейме:
+            (канал, сигнал, ...) - остальные поля (например состояние
+            предварительной классификации) возвращаются в группе как есть
+            end (int): номер отсчета, на котором они закончились
+            open_channels (np.ndarray): каналы с еще не закончившейся тревогой
+            open_starts (np.ndarray): номера первых отсчетов этих тревог
+            now (int): номер отсчета конца текущего фрейма
+        Returns:
+            list[list[tuple]]: группы закончившихся тревог (в виде, в котором
+            они пришли в finished), которые больше не могут вырасти или
+            ждут дольше max_wait
+        """
+        for alarm in finished:
+            c, signal = alarm[:2]
+            self.pending.append((c, end - len(signal), end, alarm))
+        if not self.pending:
+            return []
+        n_pending = len(self.pending)
+        channels = np.concatenate([[event[0] for event in self.pending], open_channels]).astype(np.int64)
+        starts = np.concatenate([[event[1] for event in self.pending], open_starts])
+        ends = np.concatenate([[event[2] for event in self.pending], np.full(len(open_channels), now)])
+        positions = self.positions[channels]
+        # тревоги одного канала не объединяются напрямую (новая тревога
+        # может захватить конец предыдущей отступом indent_time)
+        linked = ((np.abs(positions[:, None] - positions[None, :]) <= self.distance)
+                  & (starts[:, None] < ends[None, :]) & (starts[None, :] < ends[:, None])
+                  & (channels[:, None] != channels[None, :]))
+        # компоненты связности: каждая тревога получает наименьший номер в своей компоненте
+        labels = np.arange(len(channels))
+        while True:
+            neighbours = np.where(linked, labels[None, :], len(labels)).min(axis=1)
+            updated = np.minimum(labels, neighbours)
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+        held = set(labels[n_pending:].tolist()) # компоненты с еще идущими тревогами
+        if self.max_wait is not None:
+            expired = {label for label, event in zip(labels[:n_pending], self.pending)
+                       if now - event[2] > self.max_wait}
+            self.timeouts += len(held & expired)
+            held -= expired
+        groups = {}
+        pending = []
+        for label, event in zip(labels[:n_pending], self.pending):
+            if label in held:
+                pending.append(event)
+            else:
+                groups.setdefault(label, []).append(event[3])
+        self.pending = pending
+        self.merged += sum(len(group) - 1 for group in groups.values())
+        return list(groups.values())
+
+class MultiMainloop():
+    """
+    Движок, который обрабатывает сразу много зон (каналов рефлектограммы)
+    в одном процессе:
+    * MultiDetector считает статистики детектора по всем каналам одной редукцией
+    * MultiCropper хранит состояние обрезки всех каналов в массивах
+    * EventMerger (если задан merge_distance) объединяет тревоги соседних каналов
+    в одно событие
+    * Classifier (один на все зоны) вызывается только для каналов, на которых
+    закончилась тревога
+    * Saver (свой на каждую зону)
+    """
+    def __init__(self,
+                 model_path,
+                 qOut,
+                 channels,
+                 indent_time=500,
+                 cooling_time=1000,
+                 max_time=10000,
+                 threshold=2,
+                 adaptive_horizon=None,
+                 onset_window=None,
+                 plotting=False,
+                 verbose=True,
+                 save_path=None,
+                 max_files_count=250,
+                 saving=False,
+                 inference_queue_size=8,
+                 metrics_path=None,
+                 metrics_interval=60,
+                 provisional_interval=None,
+                 jit=False,
+                 merge_distance=None,
+                 native_features=True,
+                 feature_workers=0,
+                 batch_window=None,
+                 flat_forest=True,
+                 reload_interval=None):
+        """
+        Args:
+            model_path (str): Путь к файлу с обученной моделью
+
+            qOut (mp.Queue): Выходная очередь в которую передается сигнал о тревоге от
+            классификатора
+
+            channels (list[int]): позиции на трассе (номера каналов), которые
+            являются охраняемыми зонами
+
+            Остальные параметры (в том числе adaptive_horizon, onset_window, inference_queue_size,
+            metrics_path, metrics_interval, provisional_interval, native_features,
+            feature_workers, batch_window, flat_forest, reload_interval) совпадают
+            с параметрами Mainloop (см. mainloop_mp.py)
+
+            jit (bool, optional): Использовать JitCropper (см. jit_cropper.py,
+            нужен numba) вместо MultiDetector + MultiCropper: детектор и обрезка
+            всех каналов за один скомпилированный проход по фрейму.
+            Не совместим с adaptive_horizon, onset_window и provisional_interval.
+            По умолчанию False.
+
+            merge_distance (int, optional): Объединять тревоги каналов, позиции
+            которых отличаются не больше чем на merge_distance и которые идут
+            одновременно (см. EventMerger): классифицируется один раз сигнал
+            канала с наибольшим СКО, в 'nchn' выходного сообщения - его позиция,
+            в 'width' - протяженность события по трассе (в позициях).
+            Закончившаяся тревога ждет соседей не дольше max_time + cooling_time
+            отсчетов. По умолчанию None (каждый канал классифицируется отдельно).
+        """
+        self.channels = np.asarray(channels)
+        if jit:
+            assert not (adaptive_horizon or onset_window or provisional_interval), \
+                "jit supports neither adaptive_horizon, onset_window nor provisional_interval"
+            from jit_cropper import JitCropper # numba нужен только в этом режиме
+            self.detector = None # детектор встроен в JitCropper
+            self.cropper = JitCropper(len(channels), indent_time, cooling_time, max_time, threshold)
+        else:
+            self.detector = MultiDetector(threshold, adaptive_horizon, onset_window)
+            self.cropper = MultiCropper(len(channels), indent_time, cooling_time, max_time, detector=self.detector,
+                                        provisional_interval=provisional_interval)
+        # тревога соседа, начавшаяся до конца закончившейся, длится не больше
+        # max_time (с охлаждением): дольше ждут только цепочки через соседей
+        self.merger = (EventMerger(self.channels, merge_distance, max_wait=max_time + cooling_time)
+                       if merge_distance is not None else None)
+        self.samples = 0 # сколько отсчетов пришло с начала работы
+        # состояние классификации еще не закончившейся тревоги по каналам (см. Classifier.predict)
+        self.prefixes = [None] * len(channels)
+        self.classifier = Classifier(model_path=model_path, native_features=native_features,
+                                     feature_workers=feature_workers, flat_forest=flat_forest,
+                                     reload_interval=reload_interval)
+        self.qOut = qOut
+        self.verbose = verbose
+        self.plotting = plotting
+        self.saving = saving
+        if self.saving:
+            from saver import Saver # h5py нужен только при сохранении тревог
+            assert save_path, "You should specify save path"
+            self.savers = [Saver(save_path, zone_num, max_files_count) for zone_num in channels]
+        self.worker = None
+        if inference_queue_size:
+            self.worker = InferenceWorker(self.classifier, self.report_alarm, inference_queue_size,
+                                          batch_window)
+        # замеры времени этапов: детектор, cropper, шаги pipeline, сохранение
+        self.metrics = Metrics(metrics_path, metrics_interval, extra=self.stats,
+                               labels={"zones": [int(c) for c in self.channels]})
+        if self.detector is not None:
+            self.detector.detect = self.metrics.wrap("detect", self.detector.detect)
+        self.classifier.instrument(self.metrics)
+
+    def receive(self, frames):
+        """
+        Метод для классификации/набора полученного сигнала.
+        Если включена фоновая классификация, сигналы только ставятся в очередь.
+
+        frames - фрейм рефлектограмм (время x позиция на трассе)
+        """
+        with self.metrics.timer("crop"):
+            finished = self.cropper(frames[:, self.channels])
+        # состояние предварительной классификации уходит вместе с закончившейся
+        # тревогой: следующая тревога канала начинается с чистого prefix, даже
+        # если эта еще ждет соседей в EventMerger
+        alarms = []
+        for c, signal in finished:
+            prefix, self.prefixes[c] = self.prefixes[c], None
+            alarms.append((c, signal, prefix))
+        for c, signal in self.cropper.provisional:
+            if self.prefixes[c] is None:
+                self.prefixes[c] = {}
+            self.process_alarm(signal, c, self.prefixes[c], provisional=True)
+        end = self.samples # закончившиеся тревоги не включают текущий фрейм
+        self.samples += frames.shape[0]
+        if self.merger is None:
+            for c, signal, prefix in alarms:
+                self.process_alarm(signal, c, prefix)
+        else:
+            open_channels = np.flatnonzero(self.cropper.alarm_flag)
+            open_starts = self.samples - self.cropper.cached_len[open_channels]
+            for group in self.merger(alarms, end, open_channels, open_starts, self.samples):
+                self.process_group(group)
+        self.metrics.maybe_export()
+
+    def process_group(self, group):
+        """
+        Классификация группы объединенных тревог (канал, сигнал, prefix)
+        (см. EventMerger) по сигналу канала с наибольшим СКО
+        """
+        c, signal, prefix = max(group, key=lambda event: np.std(event[1]))
+        positions = self.channels[[event[0] for event in group]]
+        self.process_alarm(signal, c, prefix, width=int(positions.max() - positions.min()) + 1)
+
+    def process_alarm(self, signal, c, prefix=None, provisional=False, width=1):
+        """
+        Классификация сигнала канала с индексом c (в фоновом потоке, если
+        он включен), параметры как у Mainloop.process_alarm (см. mainloop_mp.py),
+        width - протяженность события по трассе
+        """
+        if self.worker is not None:
+            self.worker.submit(signal, c, provisional, width, prefix=prefix, low_priority=provisional)
+        else:
+            self.classifier.refresh()
+            self.report_alarm(signal, self.classifier.predict(signal, prefix), c, provisional, width)
+
+    def report_alarm(self, signal, predictions, c, provisional=False, width=1):
+        """
+        Отправка в выходную очередь, сохранение и отрисовка результата
+        классификации канала с индексом c (предварительный результат
+        только отправляется в очередь)
+        """
+        zone_num = int(self.channels[c])
+        alarm_name, alarm_prob = max(predictions.items(), key=lambda x: x[1])
+        if self.verbose:
+            self.qOut.put({'nchn':zone_num, 'width': width, 'alarm':alarm_name, 'timestamp':time.time(),
+                           'provisional': provisional, 'model_version': self.classifier.model_version})
+        if provisional:
+            return
+        if self.saving:
+            with self.metrics.timer("save"):
+                self.savers[c].save_alarm(signal, predictions, self.classifier.model_version)
+        if self.plotting:
+            self.classifier.plot(signal, predictions)
+
+    def stats(self) -> dict:
+        """
+        Счетчики очереди фоновой классификации, объединения тревог и адаптивного детектора
+        """
+        stats = self.worker.stats() if self.worker is not None else {}
+        stats.update(self.classifier.stats())
+        if self.merger is not None:
+            stats["merged_alarms"] = self.merger.merged
+            stats["merge_timeouts"] = self.merger.timeouts
+        if self.detector is None: # JitCropper: шум фиксируется в первом фрейме
+            return stats
+        if self.detector.is_fitted:
+            stats["noise_std"] = [float(std) for std in self.detector.noise_std]
+        if self.detector.adaptive_horizon:
+            # без адаптации теневые счетчики тревог не ведутся (см. Cropper.track_static_alarm)
+            stats["avoided_alarms"] = int((self.cropper.static_alarms - self.cropper.alarms).sum())
+        return stats
@@ -1,10 +1,171 @@
-import os
-import h5py
+import functools
 import pandas as pd
 import numpy as np
 from tsfresh.transformers import FeatureAugmenter
+from tsfresh import extract_features as tsfresh_extract_features
+from features import supported, extract_features, extract_blocks
 from sklearn.base import BaseEstimator, TransformerMixin
 
+class SignalBlocks():
+    """
+    Сигналы тревог без long_df: отсчеты всех сигналов подряд (по массиву
+    на каждый ряд, как колонки long_df) и начало каждого сигнала.
+    Шаги из этого модуля принимают и возвращают SignalBlocks так же, как
+    long_df, поэтому в реальном времени pipeline работает без pandas до
+    таблицы признаков, а для обучения long_df по-прежнему подходит.
+    """
+    def __init__(self, columns: dict, starts: np.ndarray, ids=None, sort: str = "time"):
+        """
+        Args:
+            columns (dict): {имя ряда: np.ndarray отсчетов всех сигналов подряд}
+            starts (np.ndarray): начало каждого сигнала (возрастают)
+            ids (np.ndarray, optional): id сигналов, по умолчанию 0..len(starts)-1
+            sort (str): имя колонки номера отсчета в long_df ("time", "freq_num")
+        """
+        self.columns = columns
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ids = np.arange(len(self.starts)) if ids is None else np.asarray(ids)
+        self.sort = sort
+
+    @classmethod
+    def from_signals(cls, signals, name: str = "signal_raw") -> "SignalBlocks":
+        """
+        Args:
+            signals: один сигнал (np.ndarray 1D), сигналы одной длины
+            (np.ndarray 2D, сигнал в строке) или список сигналов разной длины
+        """
+        if isinstance(signals, np.ndarray) and signals.ndim == 1:
+            signals = [signals]
+        signals = [np.asarray(signal, dtype=np.float64) for signal in signals]
+        lengths = np.array([len(signal) for signal in signals], dtype=np.int64)
+        values = np.concatenate(signals) if signals else np.empty(0)
+        return cls({name: values}, np.cumsum(lengths) - lengths)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def size(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(np.append(self.starts, self.size))
+
+    def to_long_df(self, column_id: str = "id") -> pd.DataFrame:
+        """
+        Те же сигналы в формате long_df (колонки id, sort и ряды)
+        """
+        lengths = self.lengths
+        return pd.DataFrame({
+            column_id: np.repeat(self.ids, lengths),
+            self.sort: np.arange(self.size) - np.repeat(self.starts, lengths),
+            **self.columns,
+        })
+
+def as_blocks(X):
+    """
+    SignalBlocks из входа шага, если это не long_df (иначе None)
+    """
+    if isinstance(X, SignalBlocks):
+        return X
+    if isinstance(X, (np.ndarray, list, tuple)):
+        return SignalBlocks.from_signals(X)
+    return None
+
+def block_bounds(starts: np.ndarray, n: int) -> tuple:
+    """
+    Номер блока каждого отсчета и границы его блока
+    Args:
+        starts (np.ndarray): начала блоков (возрастают, первый - 0)
+        n (int): всего отсчетов
+    Returns:
+        tuple: (номер блока, начало блока, конец блока) для каждого отсчета
+    """
+    lengths = np.diff(np.append(starts, n))
+    block = np.repeat(np.arange(len(starts)), lengths)
+    return block, starts[block], (starts + lengths)[block]
+
+def window_sums(values: np.ndarray, lo: np.ndarray, hi: np.ndarray, size: int, squares: bool = True) -> tuple:
+    """
+    Суммы отклонений отсчетов окон [lo, hi) (не длиннее size) от опорного
+    отсчета и суммы их квадратов. Кумулятивные суммы считаются по кускам
+    длиной 2 * size с шагом size от первого отсчета куска: каждое окно целиком
+    лежит в куске, где начинается, поэтому ошибка округления не копится по
+    всему массиву, а разность сумм не теряет точность на тихих участках.
+    NaN в суммы не входят.
+
+    Returns:
+        tuple: (опорный отсчет, сумма отклонений, сумма квадратов или None) для каждого окна
+    """
+    n_chunks = len(values) // size + 1
+    padded = np.zeros((n_chunks + 1) * size)
+    padded[:len(values)] = values
+    chunks = np.lib.stride_tricks.sliding_window_view(padded, 2 * size)[::size]
+    reference = np.nan_to_num(padded[:n_chunks * size:size])
+    # строка куска: 0 и отклонения, после cumsum - суммы префиксов куска
+    deviation = np.zeros((n_chunks, 2 * size + 1))
+    np.subtract(chunks, reference[:, np.newaxis], out=deviation[:, 1:])
+    if np.isnan(values).any():
+        deviation[np.isnan(deviation)] = 0.0
+    s2 = np.cumsum(deviation * deviation, axis=1).ravel() if squares else None
+    s1 = np.cumsum(deviation, axis=1, out=deviation).ravel()
+    chunk = lo // size
+    a = chunk * (2 * size + 1) + lo - chunk * size
+    b = a + (hi - lo)
+    return reference[chunk], s1[b] - s1[a], s2[b] - s2[a] if squares else None
+
+def centered_rolling(values: np.ndarray, starts: np.ndarray, std_window: int, mean_window: int) -> tuple:
+    """
+    Скользящие СКО и среднее с окном по центру отсчета внутри каждого блока
+    (сигнала одного id) - как groupby("id").rolling(window, min_periods=1,
+    center=True).std() / .mean() в pandas: у краев блока окно укорачивается,
+    NaN не учитываются, СКО (ddof=1) одного отсчета - NaN, а по окну из
+    равных отсчетов СКО ровно 0 и среднее ровно равно отсчету.
+    Суммы окон - разности кумулятивных сумм (см. window_sums), один проход
+    на все блоки.
+
+    Args:
+        values (np.ndarray): отсчеты всех блоков подряд
+        starts (np.ndarray): начала блоков (возрастают, первый - 0)
+        std_window (int): окно СКО
+        mean_window (int): окно среднего
+    Returns:
+        tuple: (СКО, среднее) для каждого отсчета
+    """
+    n = len(values)
+    values = np.asarray(values, dtype=np.float64)
+    position = np.arange(n)
+    _, block_start, block_end = block_bounds(starts, n)
+    valid = ~np.isnan(values)
+    s0 = np.concatenate([[0], np.cumsum(valid)])
+    # начало серии равных отсчетов, в которой лежит отсчет
+    change = np.ones(n, dtype=bool)
+    change[1:] = values[1:] != values[:-1]
+    change[starts[starts < n]] = True
+    run_start = np.maximum.accumulate(np.where(change, position, 0)) if n else position
+
+    def window(size):
+        # окно [lo, hi): как в pandas, справа от отсчета (size - 1) // 2 отсчетов
+        hi = np.minimum(block_end, position + (size - 1) // 2 + 1)
+        lo = np.maximum(block_start, position + (size - 1) // 2 + 1 - size)
+        constant = (run_start[hi - 1] <= lo) & valid[lo]
+        return lo, hi, s0[hi] - s0[lo], constant
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lo, hi, count, constant = window(std_window)
+        _, sum1, sum2 = window_sums(values, lo, hi, std_window)
+        std = np.sqrt(np.maximum((sum2 - sum1 * sum1 / count) / (count - 1), 0.0))
+        std[constant] = 0.0
+        std[count <= 1] = np.nan
+
+        lo, hi, count, constant = window(mean_window)
+        reference, sum1, _ = window_sums(values, lo, hi, mean_window, squares=False)
+        mean = reference + sum1 / count
+        mean[constant] = values[lo[constant]]
+        mean[count == 0] = np.nan
+    return std, mean
+
 class TimePreprocessing(BaseEstimator, TransformerMixin):
     """
     Класс, предназначенный для расчета в long_df новых колонок,
@@ -37,31 +198,119 @@ class TimePreprocessing(BaseEstimator, TransformerMixin):
 
         Args:
             long_df (pd.DataFram): Входной long_df с одним каналом (сырой сигнал)
+            или сигналы без long_df (np.ndarray, список np.ndarray, SignalBlocks)
 
         Returns:
             long_df (pd.DataFrame): Выходной long_df с тремя каналами:
             (сырой, скользящее СКО, скользящее среднее) 
+            (SignalBlocks с теми же рядами, если на входе не long_df)
         """
+        blocks = as_blocks(long_df)
+        if blocks is not None:
+            signal_raw, signal_std, signal_mean = self.filters(blocks.columns["signal_raw"], blocks.starts)
+            return SignalBlocks({"signal_raw": signal_raw, "signal_std": signal_std, "signal_mean": signal_mean},
+                                blocks.starts, blocks.ids)
+        # отсчеты каждого id - непрерывный блок (в порядке строк)
+        codes, _ = pd.factorize(long_df["id"])
+        order = None
+        if np.any(codes[1:] < codes[:-1]):
+            order = np.argsort(codes, kind="stable")
+            codes = codes[order]
+        values = long_df["signal_raw"].to_numpy(dtype=np.float64)
+        if order is not None:
+            values = values[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else codes
+        values, signal_std, signal_mean = self.filters(values, starts)
+        if order is not None:
+            # обратно в порядок строк long_df
+            inverse = np.empty_like(order)
+            inverse[order] = np.arange(len(order))
+            values, signal_std, signal_mean = values[inverse], signal_std[inverse], signal_mean[inverse]
         if self.normilize:
-            stats = long_df.groupby("id")["signal_raw"].agg(["min", "max"])
-            long_df = long_df.join(stats, on="id")
-            long_df['signal_raw'] = (long_df['signal_raw'] - long_df['min']) / (long_df['max'] - long_df['min'])
-            long_df.drop(columns=["min", "max"], inplace=True)
-        
-        long_df["signal_std"] = (
-            long_df.groupby("id")["signal_raw"]
-            .rolling(window=self.std_window, min_periods=1, center=True)
-            .std().reset_index(level=0, drop=True)
-            )
-        long_df["signal_mean"] = (
-            long_df.groupby("id")["signal_raw"]
-            .rolling(window=self.mean_window, min_periods=1, center=True)
-            .mean().reset_index(level=0, drop=True)
-            )
+            long_df = long_df.assign(signal_raw=values)
+        long_df["signal_std"] = signal_std
+        long_df["signal_mean"] = signal_mean
         return long_df
+    def filters(self, values: np.ndarray, starts: np.ndarray) -> tuple:
+        """
+        Нормализация и скользящие фильтры сигналов, лежащих подряд
+
+        Args:
+            values (np.ndarray): отсчеты всех сигналов подряд
+            starts (np.ndarray): начало каждого сигнала
+        Returns:
+            tuple: (сырой сигнал после нормализации, скользящее СКО, скользящее среднее)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if self.normilize and len(values):
+            block, _, _ = block_bounds(starts, len(values))
+            low = np.minimum.reduceat(values, starts)[block]
+            high = np.maximum.reduceat(values, starts)[block]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = (values - low) / (high - low)
+        signal_std, signal_mean = centered_rolling(values, starts, self.std_window, self.mean_window)
+        return values, signal_std, signal_mean
+    def transform_prefix(self, signal: np.ndarray, cache: dict) -> SignalBlocks:
+        """
+        То же, что transform для одного сигнала, когда сигнал - это
+        продолжение сигнала из прошлого вызова (тревога, которая еще набирается).
+        Скользящие СКО и среднее считаются по сырому сигналу и хранятся в cache:
+        пересчитываются только последние отсчеты, окна которых захватывают
+        новые данные. Нормализация min-max - аффинное преобразование, поэтому
+        она применяется к уже посчитанным статистикам (СКО делится на размах,
+        среднее сдвигается и делится на размах), а не к сигналу заново.
+
+        Args:
+            signal (np.ndarray): сигнал тревоги от начала до текущего момента
+            cache (dict): состояние для этой тревоги (пустой dict при первом вызове)
+        Returns:
+            SignalBlocks: как у transform (signal_raw, signal_std, signal_mean), id = 0
+        """
+        window = max(self.std_window, self.mean_window)
+        length = len(signal)
+        # отсчеты, окна которых целиком в уже полученной части, не пересчитываются
+        stable = min(cache.get("stable", 0), length)
+        start = max(0, stable - window)
+        signal_std, signal_mean = centered_rolling(signal[start:], np.zeros(1, dtype=np.int64),
+                                                   self.std_window, self.mean_window)
+        cache["std"] = np.concatenate([cache.get("std", np.empty(0))[:stable], signal_std[stable - start:]])
+        cache["mean"] = np.concatenate([cache.get("mean", np.empty(0))[:stable], signal_mean[stable - start:]])
+        cache["stable"] = max(0, length - window)
+
+        signal_raw, signal_std, signal_mean = signal, cache["std"], cache["mean"]
+        if self.normilize:
+            low, scale = signal.min(), signal.max() - signal.min()
+            # постоянный сигнал (scale = 0) дает NaN, как в transform
+            with np.errstate(invalid="ignore", divide="ignore"):
+                signal_raw = (signal - low) / scale
+                signal_std = signal_std / scale
+                signal_mean = (signal_mean - low) / scale
+        return SignalBlocks({"signal_raw": signal_raw, "signal_std": signal_std, "signal_mean": signal_mean},
+                            np.zeros(1, dtype=np.int64))
     def set_output(self, *, transform = None):
         return self
 
+@functools.lru_cache(maxsize=1024)
+def fourier_bins(N: int, fs: int, n_bins: int) -> tuple:
+    """
+    Разбиение спектра сигнала длины N на n_bins логарифмических bin-ов
+    (зависит только от N, fs, n_bins, поэтому считается один раз на длину)
+    Returns:
+        tuple: (номера частот rfft без нулевой, попавшие в bin-ы;
+        номер bin-а каждой из них; кол-во частот в каждом bin-е;
+        номера непустых bin-ов)
+    """
+    fftfreqz = np.fft.rfftfreq(N, 1/fs)[1:]
+    bin_edges = np.logspace(np.log2(fftfreqz[0]), np.log2(fftfreqz[-1]), num=n_bins+1, base=2)
+    inds = np.digitize(fftfreqz, bin_edges) - 1
+    columns = np.flatnonzero((inds >= 0) & (inds < n_bins))
+    inds = inds[columns]
+    counts = np.bincount(inds, minlength=n_bins)
+    kept = np.flatnonzero(counts)
+    for array in (columns, inds, counts, kept):
+        array.flags.writeable = False # общие для всех вызовов
+    return columns, inds, counts, kept
+
 class FreqPreprocessing(BaseEstimator, TransformerMixin):
     """
     Класс, предназначенный для создания из long_df колонки,
@@ -92,32 +341,72 @@ class FreqPreprocessing(BaseEstimator, TransformerMixin):
         Returns:
             np.ndarray: спектр сигнала 
         """
-        N = len(signal)
-        fftfreqz = np.fft.rfftfreq(N, 1/self.fs)[1:]
-        signal_fft = 2/N * np.abs(np.fft.rfft(signal))[1:]
-        bin_edges = np.logspace(np.log2(fftfreqz[0]), np.log2(fftfreqz[-1]), num=self.n_bins+1, base=2)
-        inds = np.digitize(fftfreqz, bin_edges) - 1
-        binned_fft = np.array([signal_fft[inds == i].mean() for i in range(self.n_bins) if np.any(inds == i)])
-        return binned_fft
+        return self.binned_fourier_batch(np.asarray(signal, dtype=np.float64)[np.newaxis])[0]
+    def binned_fourier_batch(self, signals: np.ndarray) -> np.ndarray:
+        """
+        binned_fourier для нескольких сигналов одной длины: один rfft
+        по строкам и одна сумма по bin-ам для всех сигналов
+
+        Args:
+            signals (np.ndarray): сигналы (сигнал x отсчеты)
+
+        Returns:
+            np.ndarray: спектры (сигнал x непустые bin-ы)
+        """
+        rows, N = signals.shape
+        columns, inds, counts, kept = fourier_bins(N, self.fs, self.n_bins)
+        signal_fft = (2/N * np.abs(np.fft.rfft(signals, axis=1))[:, 1:])[:, columns]
+        # bin i строки r - ячейка r * n_bins + i одного np.bincount
+        cells = (np.arange(rows)[:, np.newaxis] * self.n_bins + inds).ravel()
+        sums = np.bincount(cells, weights=signal_fft.ravel(), minlength=rows * self.n_bins)
+        return sums.reshape(rows, self.n_bins)[:, kept] / counts[kept]
     def fit(self, X, y=None):
         return self
     def transform(self, long_df: pd.DataFrame) -> pd.DataFrame:
-        longFreqDataFrame = pd.DataFrame()
-        indexes = long_df["id"].unique()
-        result = (
-            long_df.groupby("id")
-            ["signal_raw"].
-            apply(func=lambda x : self.binned_fourier(signal=x),))
-            
-        for idx in indexes:
-            temp_data = result[idx]
-            temp_df = pd.DataFrame({
-                'id': [int(idx)] * len(temp_data),
-                'freq_num': range(len(temp_data)),
-                'signal_binned_fft': temp_data
-            })
-            longFreqDataFrame = pd.concat([longFreqDataFrame, temp_df])
-        return longFreqDataFrame.reset_index(drop=True)
+        """
+        Сгруппированный спектр каждого сигнала
+
+        Args:
+            long_df (pd.DataFrame): long_df с сырым сигналом (id, time, signal_raw)
+            или сигналы без long_df (np.ndarray, список np.ndarray, SignalBlocks)
+        Returns:
+            pd.DataFrame: long_df спектров (id, freq_num, signal_binned_fft)
+            (SignalBlocks с рядом signal_binned_fft, если на входе не long_df)
+        """
+        blocks = as_blocks(long_df)
+        if blocks is not None:
+            binned_fft, starts = self.binned(blocks.columns["signal_raw"], blocks.starts, blocks.lengths)
+            return SignalBlocks({"signal_binned_fft": binned_fft}, starts, blocks.ids, sort="freq_num")
+        # сигналы id в порядке первого появления, отсчеты - в порядке строк
+        codes, indexes = pd.factorize(long_df["id"])
+        order = np.argsort(codes, kind="stable")
+        values = long_df["signal_raw"].to_numpy(dtype=np.float64)[order]
+        lengths = np.bincount(codes, minlength=len(indexes))
+        binned_fft, starts = self.binned(values, np.cumsum(lengths) - lengths, lengths)
+        sizes = np.diff(np.append(starts, len(binned_fft)))
+        return pd.DataFrame({
+            'id': np.repeat(np.asarray(indexes, dtype=np.int64), sizes),
+            'freq_num': np.arange(len(binned_fft)) - np.repeat(starts, sizes),
+            'signal_binned_fft': binned_fft,
+        })
+    def binned(self, values: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> tuple:
+        """
+        binned_fourier сигналов, лежащих подряд (сигналы одной длины - одним пакетом)
+
+        Returns:
+            tuple: (спектры всех сигналов подряд, начало спектра каждого сигнала)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        # кол-во непустых bin-ов зависит только от длины: выход выделяется сразу
+        sizes = np.array([len(fourier_bins(N, self.fs, self.n_bins)[3]) for N in lengths], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        binned_fft = np.empty(offsets[-1])
+        for N in np.unique(lengths):
+            group = np.flatnonzero(lengths == N)
+            batch = values[starts[group, np.newaxis] + np.arange(N)]
+            cells = offsets[group, np.newaxis] + np.arange(sizes[group[0]])
+            binned_fft[cells] = self.binned_fourier_batch(batch)
+        return binned_fft, offsets[:-1]
     def set_output(self, *, transform = None):
         return self
     
@@ -126,9 +415,52 @@ class CustomFeatureAugmenter(FeatureAugmenter):
     Обертка над tsfresh FeatureAugmenter, который, по моему
     не очень удобно устроен из-за set_timeseries_container
     и отсутствия метода set_output.
-    """    
+    Если native = True (его включает Classifier), признаки считаются
+    без tsfresh (см. features.py) - если все калькуляторы там есть.
+    Если задан pool (FeaturePool, см. feature_pool.py, его задает Classifier),
+    признаки пачки из нескольких сигналов считаются в процессах пула,
+    а одного сигнала - в этом процессе.
+    """
+    native = False
+    pool = None
+
+    def native_parameters(self):
+        """
+        (default_fc_parameters, kind_to_fc_parameters) для features.extract_features
+        или None, если признаки нельзя посчитать без tsfresh
+        """
+        default, kinds = self.default_fc_parameters, self.kind_to_fc_parameters
+        if self.column_kind is not None or self.column_value is not None:
+            return None
+        if default is None:
+            if kinds is None:
+                return None # tsfresh взял бы ComprehensiveFCParameters
+            default = {}
+        if not all(supported(fc_parameters) for fc_parameters in [default, *(kinds or {}).values()]):
+            return None
+        return default, kinds
+
     def transform(self, X: pd.DataFrame):
+        parameters = self.native_parameters() if self.native else None
+        blocks = as_blocks(X)
+        if blocks is not None:
+            if parameters is not None:
+                return extract_blocks(blocks.columns, blocks.starts, blocks.ids, *parameters, pool=self.pool)
+            X = blocks.to_long_df(self.column_id)
+        if parameters is not None:
+            return extract_features(X, self.column_id, self.column_sort, *parameters, pool=self.pool)
         X_idxs = pd.DataFrame(index=X["id"].unique())
+        if self.pool is not None and len(X_idxs) > 1:
+            # тот же расчет, что в FeatureAugmenter.transform, но в постоянном пуле
+            transformation = tsfresh_extract_features(
+                X, default_fc_parameters=self.default_fc_parameters,
+                kind_to_fc_parameters=self.kind_to_fc_parameters, column_id=self.column_id,
+                column_sort=self.column_sort, column_kind=self.column_kind,
+                column_value=self.column_value, chunksize=self.chunksize,
+                show_warnings=self.show_warnings, disable_progressbar=self.disable_progressbar,
+                impute_function=self.impute_function,
+                distributor=self.pool.distributor(self.disable_progressbar)).reindex(X_idxs.index)
+            return transformation[sorted(transformation.columns)]
         self.set_timeseries_container(X)
         transformation = super().transform(X_idxs)
         self.set_timeseries_container(None)
@@ -1,54 +1,63 @@
-
 import asyncio
 import numpy as np
-import json
+from ringbuffer import RingBuffer
+from driver_protocol import DriverProtocol
 
 class DataReceiver():
+    """
+    Получение рефлектограмм от драйвера DAS через unix-сокет.
+    Пакеты разбирает DriverProtocol (см. driver_protocol.py), каждый пакет
+    дописывается в окно последних рефлектограмм data_window (RingBuffer).
+    """
     def __init__(self, socket_path):
         self.socket_path = socket_path
         self.driver_one_second = 1024 # настройка для драйвера
         self.driver_delimiter = bytearray(b'<<<EndOfData.>>>') # разделитель конца сообщения
         self.event = asyncio.Event()
-        self.connect_to_data_server()
-        
-    async def get_data(self):
-        try:
-            data = await self.reader.readuntil(separator=self.driver_delimiter)
-            buffer += data
-
-            delimiterJSON = buffer.index(b'\0')
-            jsonHdrBytes = buffer[:delimiterJSON]
-            jsonHdrObj = json.loads(jsonHdrBytes.decode())
-            numTraces = jsonHdrObj['numTraces'] # кол-во рефлектограм
-            traceSize = jsonHdrObj['traceSize'] # длина рефлекторгам
+        # окно последних рефлектограмм (время x позиция на трассе),
+        # создается при получении первого пакета, когда известен traceSize
+        self.data_window = None
+        self.protocol = None
 
-            byteData = buffer[delimiterJSON + 1: delimiterJSON + numTraces * traceSize * 2 + 1]
-            data_np = np.frombuffer(byteData, dtype=np.uint16).reshape(numTraces, traceSize)
+    def on_frame(self, data_np, header):
+        """
+        Вызывается DriverProtocol для каждого пакета
+        Args:
+            data_np (np.ndarray): view на данные пакета (numTraces x traceSize)
+            header (dict): JSON-заголовок пакета
+        """
+        traceSize = data_np.shape[1] # длина рефлекторгам
+        if self.data_window is None or self.data_window.width != traceSize:
+            self.data_window = RingBuffer(capacity=2 * self.driver_one_second,
+                                          width=traceSize,
+                                          dtype=np.uint16)
+        self.data_window.append(data_np)
+        self.event.set()
 
+    async def get_data(self):
+        """
+        Ожидание новых данных в data_window (при разрыве соединения с
+        драйвером происходит переподключение)
+        """
+        while True:
+            if self.protocol is None or self.protocol.closed:
+                await self.connect_to_data_server()
+            await self.event.wait()
+            self.event.clear()
+            if not self.protocol.closed:
+                return
 
-            self.data_window = np.vstack((self.data_window, data_np)) if self.data_window.size else data_np
-            if self.data_window.shape[0] >= self.driver_one_second + self.driver_one_second:
-                self.data_window = self.data_window[(self.data_window.shape[0]-self.driver_one_second):]
-            buffer.clear()
-            # здесь нужно придумать как вытащить из класса data_window
-            # моя идея: заблокироваться через примитив синхронизации, потом 
-            # взять data_window и продолжить выполнение сняв примитив синхронизации
-            self.event.set()
-
-        except asyncio.exceptions.LimitOverrunError as e:
-            buffer += await self.reader.read(e.consumed)
-        except asyncio.exceptions.IncompleteReadError:
-            buffer.clear()
-            self.reader, _ = await self.connect_to_data_server()
-        
     async def connect_to_data_server(self):
         dots = '.'
+        loop = asyncio.get_running_loop()
         while True:
             try:
-                self.reader, self.writer = await asyncio.open_unix_connection(self.data_socket_path)
+                _, self.protocol = await loop.create_unix_connection(
+                    lambda: DriverProtocol(self.on_frame, self.driver_delimiter, on_lost=self.event.set),
+                    self.socket_path)
                 print('das driver connected')
-            
-            except Exception:
+                return
+            except OSError:
                 print('', end="\rconnecting to das driver" + dots)
                 await asyncio.sleep(3)
                 print('\x1b[2K', end='\r')  # clear line
@@ -0,0 +1,112 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+class SharedFrameStore():
+    """
+    Хранилище фреймов рефлектограмм в разделяемой памяти
+    (multiprocessing.shared_memory).
+
+    Главный процесс (receiver) один раз записывает фрейм в очередной слот,
+    дочерним процессам зон по очереди уходит только пара (slot, seq).
+    Зона читает свой канал напрямую из разделяемой памяти, фрейм не
+    сериализуется (pickle) и не копируется для каждой зоны.
+
+    Фреймы хранятся транспонированными (позиция на трассе x время), поэтому
+    канал одной зоны лежит в памяти непрерывно.
+    Слоты переиспользуются по кругу: если зона отстала больше чем на n_slots
+    фреймов, слот будет перезаписан, это проверяется по номеру seq.
+    """
+    def __init__(self, n_slots, frame_rows, width, dtype=np.uint16, name=None):
+        """
+        Args:
+            n_slots (int): кол-во слотов (сколько фреймов может отстать зона)
+            frame_rows (int): кол-во рефлектограмм в одном фрейме
+            width (int): длина рефлектограммы (traceSize)
+            dtype (optional): тип данных. По умолчанию np.uint16.
+            name (str, optional): имя существующего блока разделяемой памяти.
+            Если не задано, блок создается (так делает главный процесс).
+        """
+        self.n_slots = n_slots
+        self.frame_rows = frame_rows
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        seq_bytes = n_slots * np.dtype(np.int64).itemsize
+        frames_bytes = n_slots * width * frame_rows * self.dtype.itemsize
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=seq_bytes + frames_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        # номер последнего записанного в слот фрейма (-1 - слот пишется сейчас)
+        self.seqs = np.ndarray((n_slots,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((n_slots, width, frame_rows), dtype=self.dtype,
+                                 buffer=self.shm.buf, offset=seq_bytes)
+        if self.owner:
+            self.seqs[:] = -1
+        self.seq = 0 # номер следующего фрейма (используется только в главном процессе)
+
+    @property
+    def spec(self) -> dict:
+        """
+        Описание хранилища, которого достаточно дочернему процессу для
+        подключения к нему (см. SharedFrameStore.attach)
+        """
+        return {"name": self.shm.name,
+                "n_slots": self.n_slots,
+                "frame_rows": self.frame_rows,
+                "width": self.width,
+                "dtype": self.dtype.str}
+
+    @classmethod
+    def attach(cls, spec: dict):
+        """
+        Подключение к хранилищу, созданному в другом процессе
+        Args:
+            spec (dict): описание хранилища (SharedFrameStore.spec)
+        """
+        return cls(spec["n_slots"], spec["frame_rows"], spec["width"],
+                   dtype=spec["dtype"], name=spec["name"])
+
+    def publish(self, frame: np.ndarray) -> tuple[int, int]:
+        """
+        Запись фрейма в очередной слот (вызывается только в главном процессе)
+        Args:
+            frame (np.ndarray): матрица frame_rows x width (время x позиция на трассе)
+        Returns:
+            tuple[int, int]: (slot, seq) - уведомление для дочерних процессов
+        """
+        seq = self.seq
+        slot = seq % self.n_slots
+        self.seqs[slot] = -1
+        self.frames[slot] = frame.T
+        self.seqs[slot] = seq
+        self.seq += 1
+        return slot, seq
+
+    def read(self, slot: int, seq: int, channel: int):
+        """
+        Чтение одного канала фрейма в дочернем процессе
+        Args:
+            slot (int): номер слота из уведомления
+            seq (int): номер фрейма из уведомления
+            channel (int): позиция на трассе (канал зоны)
+        Returns:
+            np.ndarray | None: сигнал канала за фрейм или None, если слот
+            уже перезаписан более новым фреймом (зона не успевает)
+        """
+        if self.seqs[slot] != seq:
+            return None
+        signal = self.frames[slot, channel].copy()
+        if self.seqs[slot] != seq:
+            return None
+        return signal
+
+    def close(self):
+        """
+        Отключение от разделяемой памяти (главный процесс ее еще и удаляет)
+        """
+        self.seqs = None
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
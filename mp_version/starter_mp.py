@@ -15,15 +15,32 @@
 в главном процессе запущен поток с методом, котому передана общая очередь
     mainQueueWaiting(q)
 Пока не реализована остановка дочерних процессов, при завершении главного процесса    
+
+Передача данных дочерним процессам идет через разделяемую память (см. shared_frames.py):
+главный процесс один раз записывает фрейм рефлектограмм в SharedFrameStore,
+в очередь каждого потомка кладется только (slot, seq), канал зоны потомок
+читает сам. Первым сообщением (и при смене traceSize) потомку приходит
+описание хранилища SharedFrameStore.spec (dict) для подключения к нему.
+
+Если в classifier_config.json задано "multizone": true, дочерние процессы не
+создаются: все зоны обрабатываются в главном процессе движком MultiMainloop
+(см. multizone.py), который получает фрейм целиком (время x позиция на трассе).
+С "jit": true (только вместе с "multizone") детектор и обрезка всех зон
+выполняются скомпилированным numba JitCropper (см. jit_cropper.py).
+С "merge_distance": N (только вместе с "multizone") одновременные тревоги
+зон, позиции которых отличаются не больше чем на N, классифицируются
+одним событием (см. EventMerger в multizone.py), его протяженность
+по трассе передается в поле 'width'.
 '''
 import multiprocessing
 import threading
-import time
+import asyncio
 import sys
 import json
-import random
 from mainloop_mp import Mainloop
+from multizone import MultiMainloop
 from receiver_mp import DataReceiver
+from shared_frames import SharedFrameStore
 
 #======================================
 #child process
@@ -33,9 +50,21 @@ def childProcess(argv, nchn, qIn, qOut):
     argv["zone_num"] = nchn
     argv["qOut"] = qOut
     classifier = Mainloop(**argv)
+    store = None
     while True:        
         mes = qIn.get()             #ждем входного сообщения
-        classifier.receiver(mes)    #вызываем обработку
+        if isinstance(mes, dict):
+            # описание (нового) хранилища фреймов в разделяемой памяти
+            if store is not None:
+                store.close()
+            store = SharedFrameStore.attach(mes)
+            continue
+        slot, seq = mes
+        data = store.read(slot, seq, nchn)
+        if data is None:
+            print(f"zone {nchn}: frame {seq} is lost (zone is too slow)", file=sys.stderr)
+            continue
+        classifier.receive(data)    #вызываем обработку
 
 #======================================
 #main process
@@ -47,13 +76,57 @@ def mainQueueWaiting(q):
         res = q.get()
         print(res)
 
-# нужно сделать:
-async def reflectogram_to_zones(queues, channels, receiver):
-    for c, q in zip(channels, queues):
-        receiver.wait()
-        data = receiver.data_window[:, c]
-        q.put(data)
-        
+async def receive_frames(receiver):
+    """
+    Асинхронный генератор фреймов рефлектограмм: каждые
+    receiver.driver_one_second рефлектограмм отдает матрицу
+    (время x позиция на трассе) в виде view на окно receiver.data_window
+    (view действителен до следующей итерации)
+    """
+    published = None # номер первой рефлектограммы, еще не отданной наружу
+    frame_rows = receiver.driver_one_second
+    while True:
+        await receiver.get_data()
+        window = receiver.data_window
+        if published is None or window.count - published > window.capacity:
+            # первый пакет или не успели забрать часть данных и они уже вытеснены из окна
+            published = window.count - len(window)
+        while window.count - published >= frame_rows:
+            frame = window.last(window.count - published)[:frame_rows]
+            published += frame_rows
+            yield frame
+
+async def reflectogram_to_zones(queues, receiver, n_slots=8):
+    """
+    Раздача фреймов рефлектограмм дочерним процессам зон.
+    Каждый фрейм записывается в разделяемую память, в очереди потомков
+    уходит только (slot, seq).
+    """
+    store = None
+    try:
+        async for frame in receive_frames(receiver):
+            if store is None or store.width != frame.shape[1]:
+                # первый фрейм или поменялся traceSize: новое хранилище
+                if store is not None:
+                    store.close()
+                store = SharedFrameStore(n_slots, frame.shape[0], frame.shape[1], dtype=frame.dtype)
+                for q in queues:
+                    q.put(store.spec)
+            notification = store.publish(frame)
+            for q in queues:
+                q.put(notification)
+    finally:
+        if store is not None:
+            store.close()
+
+async def reflectogram_to_engine(engine, receiver):
+    """
+    Обработка всех зон в одном процессе (см. MultiMainloop в multizone.py):
+    фрейм целиком уходит в движок, который сам выбирает нужные каналы
+    """
+    async for frame in receive_frames(receiver):
+        engine.receive(frame)
+
 def mainProcess():
     # считывание json с базовыми настройками
     congig_path = "classifier_config.json"
@@ -62,6 +135,11 @@ def mainProcess():
     print("start main", argv_dict)
     #список каналов
     channels        = [33, 44, 55]
+    jit = argv_dict.pop("jit", False)
+    merge_distance = argv_dict.pop("merge_distance", None)
+    if argv_dict.pop("multizone", False):
+        multizoneProcess(argv_dict, channels, jit, merge_distance)
+        return
     #список процессов потомков
     childProcesses  = []
     #список очередей потомков
@@ -79,15 +157,22 @@ def mainProcess():
         childProcesses.append(p)    
         p.start()
     
-    #данные отправлчемые процессам потомкам
-    dataSize = 1024
     receiver = DataReceiver(socket_path='/tmp/das_driver')
-    while True:
+    asyncio.run(reflectogram_to_zones(childQueues, receiver))
 
-        # Здесь нужно реализовать логику получения из receiver данных
-        # (Внутри receiver содержится data_window, который представляет собой матрицу)
-        # нужно взять значения channels
-        time.sleep(1.024)
+def multizoneProcess(argv, channels, jit=False, merge_distance=None):
+    """
+    Все зоны обрабатываются в главном процессе одним векторизованным
+    движком MultiMainloop, без дочерних процессов
+    """
+    qMain   = multiprocessing.Queue()
+    t1 = threading.Thread(target=mainQueueWaiting, args=(qMain,))
+    t1.start()
+    argv["qOut"] = qMain
+    argv.pop("zone_num", None)
+    engine = MultiMainloop(channels=channels, jit=jit, merge_distance=merge_distance, **argv)
+    receiver = DataReceiver(socket_path='/tmp/das_driver')
+    asyncio.run(reflectogram_to_engine(engine, receiver))
 #======================================
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+'''
+Формат обученной модели .zbm - каталог вместо pickle всего pipeline.
+
+joblib.load(pipeline_with_kashira.pkl) восстанавливает объекты sklearn и
+tsfresh той версии, в которой модель сохранена (с другой версией pickle
+может не загрузиться), занимает секунды, и каждый процесс зоны держит
+свою копию леса. В .zbm лежат:
+    manifest.json - версия формата, классы, имена признаков, шаги pipeline
+    (класс из preprocessing.py и его параметры, в том числе признаки
+    tsfresh) и описание леса;
+    forest/*.npy - массивы FlatForest (см. forest.py), в имени файла -
+    начало sha256 содержимого.
+Загрузка собирает тот же Pipeline из классов preprocessing.py по параметрам
+(без pickle), а массивы леса отображаются в память только для чтения:
+процессы зон на одной машине делят одни и те же страницы.
+
+Сохранение из notebook (после final_pipeline.fit):
+    from artifact import export_model
+    export_model(final_pipeline, "pipeline_with_kashira.zbm")
+Перевод сохраненной модели с проверкой совпадения predict_proba:
+    python artifact.py pipeline_with_kashira.pkl pipeline_with_kashira.zbm
+'''
+import io
+import os
+import json
+import time
+import hashlib
+import argparse
+import datetime
+from contextlib import contextmanager
+import numpy as np
+import sklearn
+from sklearn.pipeline import Pipeline, FeatureUnion
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier
+import preprocessing
+from forest import FlatForest
+
+FORMAT = "zbm"
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+STEPS = ("TimePreprocessing", "FreqPreprocessing", "CustomFeatureAugmenter", "ColumnSorter")
+FOREST_ARRAYS = ("roots", "feature", "threshold", "children", "missing_left", "value")
+SKIP_PARAMS = ("timeseries_container",) # данные, которые tsfresh держит между вызовами
+
+def is_artifact(path) -> bool:
+    """
+    Путь - каталог модели .zbm (а не pickle)?
+    """
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+def describe(estimator) -> dict:
+    """
+    Шаг pipeline в виде, пригодном для json (рекурсивно для Pipeline и FeatureUnion)
+    """
+    if isinstance(estimator, (Pipeline, FeatureUnion)):
+        steps = estimator.steps if isinstance(estimator, Pipeline) else estimator.transformer_list
+        return {"class": type(estimator).__name__,
+                "steps": [[name, describe(step)] for name, step in steps]}
+    name = type(estimator).__name__
+    if name not in STEPS:
+        raise ValueError(f"{name} cannot be stored in a .{FORMAT} model")
+    params = {key: value for key, value in estimator.get_params(deep=False).items()
+              if key not in SKIP_PARAMS}
+    try:
+        json.dumps(params)
+    except TypeError as error:
+        raise ValueError(f"parameters of {name} are not json-serializable: {error}")
+    return {"class": name, "params": params}
+
+def build(spec: dict):
+    """
+    Шаг pipeline по описанию describe
+    """
+    if spec["class"] in ("Pipeline", "FeatureUnion"):
+        steps = [(name, build(step)) for name, step in spec["steps"]]
+        return Pipeline(steps) if spec["class"] == "Pipeline" else FeatureUnion(steps)
+    if spec["class"] not in STEPS:
+        raise ValueError(f"unknown step {spec['class']}")
+    return getattr(preprocessing, spec["class"])(**spec["params"])
+
+@contextmanager
+def replacing(path: str, mode: str, **kwargs):
+    """
+    Запись файла через временный файл и os.replace: процессы, которые уже
+    отобразили старый файл в память, продолжают читать его (он не обрезается),
+    а новые открывают только целиком записанный
+    """
+    temporary = path + ".tmp"
+    with open(temporary, mode, **kwargs) as file:
+        yield file
+    os.replace(temporary, path)
+
+def read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def write_array(path: str, array: np.ndarray, name: str) -> str:
+    """
+    Запись массива в path/forest под именем с хешем содержимого: файлы,
+    на которые ссылается текущий manifest, не перезаписываются
+    Returns:
+        str: путь файла относительно path
+    """
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    data = buffer.getvalue()
+    file_name = f"forest/{name}-{hashlib.sha256(data).hexdigest()[:16]}.npy"
+    if not os.path.isfile(os.path.join(path, file_name)):
+        with replacing(os.path.join(path, file_name), "wb") as file:
+            file.write(data)
+    return file_name
+
+def remove_stale_arrays(path: str, *manifests):
+    """
+    Удаление массивов, на которые не ссылается ни один из manifests
+    (процесс, прочитавший прошлый manifest, еще может открывать его массивы)
+    """
+    keep = {os.path.normpath(file) for manifest in manifests if manifest
+            for file in manifest["forest"]["arrays"].values()}
+    for file_name in os.listdir(os.path.join(path, "forest")):
+        file = os.path.join("forest", file_name)
+        if file_name.endswith(".npy") and os.path.normpath(file) not in keep:
+            os.remove(os.path.join(path, file))
+
+def export_model(pipeline: Pipeline, path: str) -> dict:
+    """
+    Сохранение обученного pipeline (признаки + случайный лес) в каталог .zbm
+    Args:
+        pipeline (Pipeline): final_pipeline из notebook: шаги признаков и
+        последний шаг RandomForestClassifier (ExtraTreesClassifier)
+        path (str): каталог модели (создается)
+    Returns:
+        dict: записанный manifest
+    """
+    name, forest = pipeline.steps[-1]
+    if not isinstance(forest, (RandomForestClassifier, ExtraTreesClassifier)):
+        raise ValueError(f"the last step must be a random forest, got {type(forest).__name__}")
+    flat = FlatForest.from_sklearn(forest)
+    previous = read_manifest(path) if is_artifact(path) else None
+    os.makedirs(os.path.join(path, "forest"), exist_ok=True)
+    # новые массивы ложатся рядом со старыми (имена по хешу), поэтому
+    # модель в каталоге всегда согласована с manifest, каким бы он ни был
+    arrays = {array: write_array(path, getattr(flat, array), array) for array in FOREST_ARRAYS}
+    manifest = {
+        "format": FORMAT,
+        "format_version": FORMAT_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "sklearn_version": sklearn.__version__,
+        "classes": flat.classes_.tolist(),
+        "feature_names": None if flat.feature_names_in_ is None else flat.feature_names_in_.tolist(),
+        "steps": [[step, describe(estimator)] for step, estimator in pipeline.steps[:-1]],
+        "forest": {"step": name, "depth": flat.depth, "arrays": arrays},
+    }
+    # manifest пишется последним: каталог без него - незаконченная модель,
+    # а его изменение - сигнал перезагрузки (см. Classifier.reload_interval)
+    with replacing(os.path.join(path, MANIFEST), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=1)
+    remove_stale_arrays(path, manifest, previous)
+    return manifest
+
+def load_model(path: str, mmap: bool = True) -> Pipeline:
+    """
+    Pipeline из каталога .zbm (predict_proba тот же, что у сохраненного)
+    Args:
+        path (str): каталог модели
+        mmap (bool, optional): отображать массивы леса в память (только
+        чтение, общие страницы для процессов). По умолчанию True.
+    """
+    manifest = read_manifest(path)
+    if manifest.get("format") != FORMAT or manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported model format "
+                         f"{manifest.get('format')} v{manifest.get('format_version')}")
+    spec = manifest["forest"]
+    # np.asarray: ndarray поверх того же отображения (без копии и без накладных расходов np.memmap)
+    arrays = {array: np.asarray(np.load(os.path.join(path, file), mmap_mode="r" if mmap else None))
+              for array, file in spec["arrays"].items()}
+    feature_names = manifest["feature_names"]
+    forest = FlatForest(depth=spec["depth"], classes=np.asarray(manifest["classes"]),
+                        feature_names=None if feature_names is None else np.asarray(feature_names, dtype=object),
+                        **arrays)
+    pipeline = Pipeline([(name, build(step)) for name, step in manifest["steps"]] + [(spec["step"], forest)])
+    pipeline.set_output(transform="pandas")
+    pipeline.manifest = manifest
+    return pipeline
+
+if __name__ == "__main__":
+    import joblib
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pickle_path", help="pipeline, сохраненный joblib.dump")
+    parser.add_argument("zbm_path", help="каталог модели .zbm")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    pipeline = joblib.load(args.pickle_path)
+    pickle_load = time.perf_counter() - start
+    export_model(pipeline, args.zbm_path)
+    start = time.perf_counter()
+    model = load_model(args.zbm_path)
+    zbm_load = time.perf_counter() - start
+    rng = np.random.default_rng(0)
+    signals = [8000 + np.cumsum(rng.normal(scale=20, size=n)) + rng.normal(scale=50, size=n)
+               for n in rng.integers(300, 6000, 16)]
+    assert np.array_equal(model.predict_proba(signals), pipeline.predict_proba(signals)), \
+        "predict_proba of the .zbm model differs"
+    print(f"{args.zbm_path}: predict_proba matches the pickle on {len(signals)} signals; "
+          f"load {1e3 * zbm_load:.1f} ms (pickle {1e3 * pickle_load:.0f} ms)")
@@ -0,0 +1,32 @@
+'''
+Замер производительности классификатора на записанном сигнале
+(см. Mainloop.start_benchmark). Используются настройки из classifier_config.json.
+
+Пример запуска:
+    python benchmark.py recording.npy --step 1000 --repeat 3
+'''
+import os
+import json
+import argparse
+from mainloop import Mainloop
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path_to_test_signal", help="файл .npy с записанным сигналом")
+    parser.add_argument("--step", type=int, default=1000, help="размер порции данных")
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз прогнать запись")
+    args = parser.parse_args()
+    path_to_test_signal = os.path.abspath(args.path_to_test_signal)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    with open("classifier_config.json", "r", encoding="utf-8") as file:
+        config = json.load(file)
+    config["verbose"] = False
+    config["plotting"] = False
+    config["inference_queue_size"] = 0
+    if config.get("saving"):
+        config["zone_num"] = "benchmark"
+
+    mainloop = Mainloop(**config)
+    result = mainloop.start_benchmark(path_to_test_signal, step=args.step, repeat=args.repeat)
+    print(json.dumps(result, indent=2))
@@ -1,58 +1,353 @@
+import os
 import sys
-import json
 import joblib
+import hashlib
+import threading
+import traceback
+import collections
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
 # здесь важно импортировать из preprocessing все (*)!
 # Хотя в коде нет явного вызова модулей из preprocessing,
 # классификтор состоит из блоков, описанных в preprocessing
 from preprocessing import *
+from feature_pool import shared_pool, pool_startup_cost
+from forest import FlatForest
+from artifact import MANIFEST, is_artifact, load_model
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier
+
+# контрольный сигнал для проверки перезагруженной модели: шум прибора
+CANARY = 8000 + np.random.default_rng(0).normal(0, 50, 2000)
+
+def model_file(model_path) -> str:
+    """
+    Файл, изменение которого означает новую модель (у .zbm manifest пишется последним)
+    """
+    return os.path.join(model_path, MANIFEST) if is_artifact(model_path) else model_path
+
+def model_signature(model_path):
+    """
+    (время изменения, размер) файла модели или None, если его сейчас нет
+    """
+    try:
+        stat = os.stat(model_file(model_path))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def model_version(model_path) -> str:
+    """
+    Версия модели: начало sha256 файла модели (manifest.json для .zbm)
+    """
+    digest = hashlib.sha256()
+    with open(model_file(model_path), "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
 
 class Classifier():
     """
     Класс классификатора для применения в режиме реального времени
     """
-    def __init__(self, model_path):
+    def __init__(self, model_path, native_features=True, feature_workers=0, flat_forest=True,
+                 reload_interval=None):
         """
         Args:
-            model_path (str): путь до обученной модели
+            model_path (str): путь до обученной модели: pickle (joblib.dump)
+            или каталог .zbm (см. artifact.py)
+            native_features (bool): считать признаки tsfresh без tsfresh
+            (см. features.py), если все калькуляторы модели там есть.
+            По умолчанию True.
+            feature_workers (int): кол-во процессов постоянного пула, в котором
+            считаются признаки пачки тревог (см. feature_pool.py). Одна тревога
+            всегда считается в этом процессе. По умолчанию 0 (без пула).
+            flat_forest (bool): заменить случайный лес модели на FlatForest
+            (см. forest.py) с тем же результатом predict_proba. По умолчанию True.
+            reload_interval (float): период проверки model_path, с: если файл
+            модели изменился, новая модель загружается в фоновом потоке,
+            проверяется на контрольных сигналах и подменяет текущую между
+            тревогами (см. refresh). По умолчанию None (без перезагрузки).
             preprocessor (Preprocessor): объект предобработчика, который
             преобразует np.ndarray -> longDataFrame.
             
         """
-        self.model = joblib.load(model_path)
-        self.classes = self.model["classifier"].classes_
+        self.model_path = model_path
+        self.native_features = native_features
+        self.flat_forest = flat_forest
+        self.pool = shared_pool(feature_workers) if feature_workers else None
+        self.metrics = None
+        self.signature = model_signature(model_path)
+        model, pickled_n_jobs, self.tsfresh_n_jobs = self.load(model_path)
+        self.activate(model, model_version(model_path))
+        self.parallelism = {"pickled_n_jobs": pickled_n_jobs,
+                            "feature_workers": feature_workers,
+                            "pool_startup": round(self.pool.startup, 3) if self.pool else 0.0}
+        # перезагрузка модели: загруженная и проверенная модель ждет в pending,
+        # пока поток классификации не вызовет refresh между тревогами
+        # (pending пишет фоновый поток, а забирает поток классификации - под lock)
+        self.pending = None
+        self.lock = threading.Lock()
+        self.reloads = 0
+        self.reload_failures = 0
+        self.results = collections.Counter() # версия модели -> кол-во классифицированных сигналов
+        self.canary = None # последний классифицированный сигнал
+        self.watcher = None
+        self.stopped = threading.Event()
+        if reload_interval:
+            self.watcher = threading.Thread(target=self.watch, args=(reload_interval,), daemon=True)
+            self.watcher.start()
+
+    def load(self, model_path) -> tuple:
+        """
+        Загрузка модели и настройка ее шагов для работы в реальном времени
+        Returns:
+            tuple: (модель, n_jobs обученной модели, n_jobs шагов, которые
+            считаются через tsfresh и запускали бы свой пул на каждый вызов)
+        """
+        model = load_model(model_path) if is_artifact(model_path) else joblib.load(model_path)
+        name, estimator = model.steps[-1]
+        if self.flat_forest and isinstance(estimator, (RandomForestClassifier, ExtraTreesClassifier)):
+            model.steps[-1] = (name, FlatForest.from_sklearn(estimator))
+        augmenters = self.find_steps(model, CustomFeatureAugmenter)
+        # n_jobs из обученной модели заставил бы tsfresh запускать и
+        # останавливать свой пул процессов на каждый вызов: считаем в этом
+        # процессе (или в постоянном пуле), а сколько это стоило бы, замеряет stats
+        pickled_n_jobs = [augmenter.n_jobs for augmenter in augmenters]
+        tsfresh_n_jobs = []
+        for augmenter in augmenters:
+            augmenter.native = self.native_features
+            uses_tsfresh = not self.native_features or augmenter.native_parameters() is None
+            if uses_tsfresh and augmenter.n_jobs and augmenter.n_jobs > 1:
+                tsfresh_n_jobs.append(augmenter.n_jobs)
+            augmenter.n_jobs = 0
+            augmenter.pool = self.pool
+        return model, max(pickled_n_jobs, default=0), tsfresh_n_jobs
+
+    def activate(self, model, version):
+        """
+        Сделать model текущей моделью (вызывается только между тревогами)
+        """
+        self.model = model
+        self.model_version = version
+        self.classes = model.steps[-1][1].classes_
+        # шаг TimePreprocessing модели: для еще не закончившейся тревоги его
+        # результат считается инкрементально (см. TimePreprocessing.transform_prefix)
+        self.time_step = self.find_step(model, TimePreprocessing)
+        if self.metrics is not None:
+            self.instrument_model()
+
+    def watch(self, interval):
+        """
+        Цикл фонового потока: проверка model_path раз в interval секунд.
+        Файл загружается, когда он изменился и не менялся целый период
+        (joblib.dump и export_model пишут не мгновенно)
+        """
+        seen = self.signature
+        while not self.stopped.wait(interval):
+            signature = model_signature(self.model_path)
+            if signature is None or signature == self.signature:
+                continue
+            if signature != seen:
+                seen = signature # файл еще могут дописывать
+                continue
+            self.signature = signature
+            try:
+                self.stage(self.model_path)
+            except Exception:
+                self.reload_failures += 1
+                print(f"model reload failed, keeping {self.model_version}", file=sys.stderr)
+                traceback.print_exc(file=sys.stderr)
+
+    def stage(self, model_path):
+        """
+        Загрузка новой модели и проверка на контрольных сигналах (последняя
+        классифицированная тревога и синтетический шум): вероятности по всем
+        классам конечны и в сумме дают 1. Проверенная модель ждет refresh.
+        """
+        model, _, _ = self.load(model_path)
+        version = model_version(model_path)
+        canaries = [CANARY] if self.canary is None else [CANARY, self.canary]
+        prob = model.predict_proba(canaries)
+        if prob.shape != (len(canaries), len(model.steps[-1][1].classes_)) \
+                or not np.isfinite(prob).all() or not np.allclose(prob.sum(axis=1), 1.0):
+            raise ValueError(f"model {version} failed the canary check: {prob}")
+        with self.lock:
+            self.pending = (model, version)
+
+    def refresh(self) -> bool:
+        """
+        Подмена модели на загруженную фоновым потоком, если она есть.
+        Вызывается потоком классификации между тревогами, поэтому тревога
+        (и все тревоги пачки) целиком классифицируется одной моделью,
+        а model_version после predict - версия, которая дала результат.
+        Returns:
+            bool: была ли подмена
+        """
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if pending is None:
+            return False
+        previous = self.model_version
+        self.activate(*pending)
+        self.reloads += 1
+        print(f"model reloaded: {previous} -> {self.model_version}", file=sys.stderr)
+        return True
+
+    def close(self):
+        """
+        Остановка фоновой проверки model_path
+        """
+        self.stopped.set()
+
+    def stats(self) -> dict:
+        """
+        Отчет о параллельности расчета признаков: n_jobs обученной модели,
+        сколько стоил бы запуск пула tsfresh на каждый вызов (с), размер и
+        время запуска постоянного пула (с), кол-во пачек, посчитанных в нем;
+        версия текущей модели и счетчики ее перезагрузок
+        """
+        stats = dict(self.parallelism)
+        # замер запускает пул tsfresh, поэтому он делается только для выгрузки
+        # метрик и один раз на процесс (см. pool_startup_cost)
+        stats["pool_startup_per_call"] = round(sum(pool_startup_cost(n_jobs) for n_jobs in self.tsfresh_n_jobs), 3)
+        stats["pool_batches"] = self.pool.batches if self.pool else 0
+        stats["model_version"] = self.model_version
+        stats["model_reloads"] = self.reloads
+        stats["model_reload_failures"] = self.reload_failures
+        stats["results_by_model"] = dict(self.results)
+        return stats
+
+    def find_steps(self, estimator, step_type):
+        """
+        Поиск шагов типа step_type в Pipeline/FeatureUnion (рекурсивно)
+        Returns:
+            list: найденные шаги в порядке обхода
+        """
+        found = []
+        steps = getattr(estimator, "steps", None) or getattr(estimator, "transformer_list", None)
+        for _, step in steps or []:
+            if isinstance(step, step_type):
+                found.append(step)
+            else:
+                found.extend(self.find_steps(step, step_type))
+        return found
 
-    def predict(self, signal: np.ndarray) -> dict[str,float]:
+    def find_step(self, estimator, step_type):
+        """
+        Поиск шага типа step_type в Pipeline/FeatureUnion (рекурсивно)
+        Returns:
+            первый найденный шаг или None
+        """
+        found = self.find_steps(estimator, step_type)
+        return found[0] if found else None
+
+    def instrument(self, metrics):
+        """
+        Включение замеров времени (см. metrics.py): predict целиком ("classify"),
+        predict_batch ("classify_batch"),
+        каждый шаг pipeline (например "timeExtractor.CustomFeatureAugmenter")
+        и predict_proba модели ("predict_proba")
+        
+        Args:
+            metrics (Metrics): объект, в который пишутся замеры
+        """
+        self.metrics = metrics
+        self.predict = metrics.wrap("classify", self.predict)
+        self.predict_batch = metrics.wrap("classify_batch", self.predict_batch)
+        self.instrument_model()
+
+    def instrument_model(self):
+        """
+        Замеры времени шагов текущей модели (и модели после перезагрузки)
+        """
+        self.instrument_steps(self.model, "model", self.metrics)
+        if self.time_step is not None:
+            self.time_step.transform_prefix = self.metrics.wrap("TimePreprocessing.prefix",
+                                                                self.time_step.transform_prefix)
+
+    def instrument_steps(self, estimator, name, metrics):
+        """
+        Рекурсивный обход Pipeline/FeatureUnion и замена transform (predict_proba
+        у модели) каждого шага на обертку с замером времени
+        """
+        steps = getattr(estimator, "steps", None) or getattr(estimator, "transformer_list", None)
+        if steps is not None:
+            for step_name, step in steps:
+                if hasattr(step, "steps") or hasattr(step, "transformer_list"):
+                    self.instrument_steps(step, step_name, metrics)
+                elif hasattr(step, "predict_proba"):
+                    step.predict_proba = metrics.wrap("predict_proba", step.predict_proba)
+                elif hasattr(step, "transform"):
+                    step.transform = metrics.wrap(f"{name}.{step_name}", step.transform)
+
+    def predict(self, signal: np.ndarray, prefix=None) -> dict[str,float]:
         """
         Метод для предсказания метки класса по полученному сигналу
-        Этот метод должен подавать на вход классификатора данные в формате long_df
+        Сигнал подается в pipeline как np.ndarray (шаги preprocessing принимают
+        его без long_df, см. SignalBlocks)
         А возвращать в формате, который требуется дальше (Кирилл просит json с вероятностями по классам)
         Поэтому я возвращаю dict
         
         signal (np.ndarray) - обрезанный после cropper сигнал
+        prefix (dict, optional) - состояние тревоги, начало которой уже
+        классифицировалось (предварительная классификация): signal - продолжение
+        сигнала прошлого вызова с тем же prefix, скользящие статистики
+        TimePreprocessing для начала сигнала не пересчитываются
         Возвращает:
         dict: ключи - имена классов, значения - вероятности
         соответствующих классов.
         """
-        # Преобразование в формат tsfresh
-        long_df = pd.DataFrame({
-            'id': [0]*len(signal),
-            'time': range(len(signal)),
-            'signal_raw': signal,
-        })
-        
-        prob = self.model.predict_proba(long_df).round(2)
+        # Cropper отдает сигнал в типе данных прибора (например uint16),
+        # модель обучена на float64
+        signal = np.asarray(signal, dtype=np.float64)
+        self.canary = signal
+        if prefix is not None and prefix.get("model_version", self.model_version) != self.model_version:
+            # начало тревоги посчитано моделью до перезагрузки (окна фильтров могли измениться)
+            prefix.clear()
+        if prefix is not None and self.time_step is not None:
+            prefix["model_version"] = self.model_version
+            time_df = self.time_step.transform_prefix(signal, prefix)
+            # на время вызова шаг TimePreprocessing отдает уже посчитанный результат
+            transform = self.time_step.__dict__.get("transform")
+            self.time_step.transform = lambda X: time_df
+            try:
+                prob = self.model.predict_proba(signal).round(2)
+            finally:
+                if transform is None:
+                    del self.time_step.transform
+                else:
+                    self.time_step.transform = transform
+        else:
+            prob = self.model.predict_proba(signal).round(2)
+        self.results[self.model_version] += 1
         model_predictions = dict(zip(self.classes, *prob))
         return model_predictions
+
+    def predict_batch(self, signals: list) -> list[dict[str,float]]:
+        """
+        Предсказание для пачки тревог (например, с нескольких зон сразу):
+        признаки всех сигналов считаются за один проход pipeline, и
+        predict_proba вызывается один раз на всю пачку
+        
+        signals (list[np.ndarray]) - обрезанные сигналы, длины могут различаться
+        Возвращает:
+        list[dict]: вероятности по классам для каждого сигнала, в порядке signals
+        """
+        if len(signals) == 0:
+            return []
+        signals = [np.asarray(signal, dtype=np.float64) for signal in signals]
+        prob = self.model.predict_proba(signals).round(2)
+        self.results[self.model_version] += len(signals)
+        return [dict(zip(self.classes, p)) for p in prob]
     
     def plot(self, signal, model_predictions):
         """
         Метод для отладки, который нужен чтобы строить графики сырого сигнала
         и соответствующего распределения классификатора по классам
         """
+        # matplotlib импортируется только при plotting=True:
+        # в рабочем режиме его импорт лишь замедляет запуск процесса зоны
+        import matplotlib.pyplot as plt
+        import matplotlib.colors as mcolors
         fig, ax = plt.subplots(1, 2, figsize = (10,6))
         ax[0].plot(signal)
         ax[0].set_xlabel('Time, ms')
@@ -0,0 +1,91 @@
+'''
+Постоянный пул процессов для расчета признаков пачки тревог.
+
+В обученной модели у CustomFeatureAugmenter задан n_jobs (в notebook_v4 - 10),
+и tsfresh на каждый вызов создает multiprocessing.Pool и закрывает его:
+для одной тревоги запуск процессов дольше самого расчета. Classifier
+поэтому считает одну тревогу в своем процессе (n_jobs = 0), а пачку тревог
+(несколько сигналов в одном вызове) - в этом пуле: он запускается один раз
+(процессы уже прогреты - модули импортированы до fork) и общий для всех
+зон процесса (MultiMainloop) и для перезапусков Mainloop.
+'''
+import os
+import time
+import multiprocessing
+from tsfresh.utilities.distribution import MultiprocessingDistributor
+
+POOLS = {} # кол-во процессов -> FeaturePool (один пул на процесс и размер)
+STARTUP_COSTS = {} # n_jobs -> стоимость пула tsfresh на вызов, с (замер один на процесс)
+
+def ping(_):
+    return os.getpid()
+
+class FeaturePool():
+    """
+    multiprocessing.Pool, который живет все время работы процесса
+    """
+    def __init__(self, workers: int):
+        """
+        Args:
+            workers (int): кол-во процессов
+        """
+        start = time.perf_counter()
+        self.workers = workers
+        self.pool = multiprocessing.Pool(workers)
+        # ждем, пока ответит каждый процесс: дальше пул не тратит время на запуск
+        self.pool.map(ping, range(workers), chunksize=1)
+        self.startup = time.perf_counter() - start # время запуска пула, с
+        self.batches = 0 # кол-во пачек, посчитанных в пуле
+
+    def starmap(self, func, args: list) -> list:
+        """
+        func(*a) для каждого a из args в процессах пула
+        """
+        self.batches += 1
+        return self.pool.starmap(func, args, chunksize=1)
+
+    def distributor(self, disable_progressbar=True) -> "PoolDistributor":
+        """
+        Распределитель для tsfresh.extract_features(distributor=...)
+        """
+        self.batches += 1
+        return PoolDistributor(self, disable_progressbar)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+class PoolDistributor(MultiprocessingDistributor):
+    """
+    MultiprocessingDistributor tsfresh поверх FeaturePool: tsfresh вызывает
+    close после каждого extract_features, здесь close пул не останавливает
+    """
+    def __init__(self, feature_pool: FeaturePool, disable_progressbar=True,
+                 progressbar_title="Feature Extraction"):
+        self.pool = feature_pool.pool
+        self.n_workers = feature_pool.workers
+        self.disable_progressbar = disable_progressbar
+        self.progressbar_title = progressbar_title
+
+    def close(self):
+        pass
+
+def shared_pool(workers: int) -> FeaturePool:
+    """
+    Пул на workers процессов, общий для всех Classifier процесса
+    """
+    if workers not in POOLS:
+        POOLS[workers] = FeaturePool(workers)
+    return POOLS[workers]
+
+def pool_startup_cost(n_jobs: int) -> float:
+    """
+    Сколько стоит tsfresh запуск и остановка своего пула на n_jobs процессов,
+    то есть сколько терял каждый вызов с n_jobs из обученной модели, с.
+    Пул запускается для замера только при первом вызове с этим n_jobs
+    """
+    if n_jobs not in STARTUP_COSTS:
+        start = time.perf_counter()
+        MultiprocessingDistributor(n_jobs, disable_progressbar=True).close()
+        STARTUP_COSTS[n_jobs] = time.perf_counter() - start
+    return STARTUP_COSTS[n_jobs]
@@ -0,0 +1,187 @@
+'''
+Случайный лес sklearn в виде плоских массивов numpy.
+
+RandomForestClassifier.predict_proba на одну тревогу тратит больше времени
+на проверку входа и запуск joblib.Parallel (даже при n_jobs=None), чем на
+сам проход по деревьям. FlatForest хранит узлы всех деревьев в общих
+массивах (признак, порог, левый и правый потомок, вероятности листа) и
+проходит все деревья для всех сигналов пачки одновременно: одна итерация
+на уровень дерева. Результат бит в бит совпадает с predict_proba sklearn:
+X приводится к float32, как в sklearn, NaN идут по missing_go_to_left,
+вероятности деревьев складываются в том же порядке.
+
+Совпадение с sklearn (в том числе NaN и краевые значения float32)
+проверяет tests/test_forest.py; проверка на обученной модели и замер скорости:
+    python forest.py model.pkl --rows 1000
+'''
+import time
+import argparse
+import numpy as np
+
+class FlatForest():
+    """
+    Лес решающих деревьев (классификация, один выход) в плоских массивах.
+    Узел i: признак feature[i], порог threshold[i], правый и левый потомки
+    children[2 * i], children[2 * i + 1] (номера в общих массивах). У листа
+    оба потомка - он сам, поэтому после depth шагов каждый сигнал стоит
+    в листе любого своего дерева. Массивы только читаются, поэтому могут
+    быть отображены в память из файла (см. artifact.py) и общими для процессов.
+    """
+    def __init__(self, roots, feature, threshold, children, missing_left, value, depth,
+                 classes, feature_names=None):
+        """
+        Args:
+            roots (np.ndarray): номер корня каждого дерева
+            feature, threshold, missing_left (np.ndarray): узлы
+            children (np.ndarray): потомки узлов парами (правый, левый)
+            value (np.ndarray): вероятности классов в узлах (узлы x классы)
+            depth (int): наибольшая глубина дерева
+            classes (np.ndarray): метки классов (как classes_ у sklearn)
+            feature_names (np.ndarray, optional): имена признаков, на которых
+            обучен лес (feature_names_in_). По умолчанию None.
+        """
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        # следующий узел - children[2 * node + go_left]
+        self.children = children
+        self.missing_left = missing_left
+        self.value = value
+        self.depth = int(depth)
+        self.classes_ = classes
+        self.feature_names_in_ = feature_names
+        self.n_features_in_ = int(feature.max(initial=-1)) + 1 if feature_names is None else len(feature_names)
+
+    @classmethod
+    def from_sklearn(cls, forest) -> "FlatForest":
+        """
+        Перевод обученного RandomForestClassifier (ExtraTreesClassifier)
+        в плоские массивы
+        """
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("FlatForest supports single-output forests only")
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        n_classes = len(forest.classes_)
+        sizes = np.array([tree.node_count for tree in trees])
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        feature, threshold, children, missing_left, value = [], [], [], [], []
+        for root, tree in zip(roots, trees):
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left < 0
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+            left = np.where(leaf, nodes, tree.children_left)
+            right = np.where(leaf, nodes, tree.children_right)
+            children.append(root + np.stack([right, left], axis=1).ravel())
+            missing_left.append(tree.missing_go_to_left.astype(bool) & ~leaf)
+            # в sklearn >= 1.4 value дерева классификации - уже доли классов
+            value.append(tree.value[:, 0, :n_classes])
+        return cls(roots,
+                   np.concatenate(feature).astype(np.intp),
+                   np.concatenate(threshold).astype(np.float64),
+                   np.concatenate(children).astype(np.intp),
+                   np.concatenate(missing_left),
+                   np.ascontiguousarray(np.concatenate(value), dtype=np.float64),
+                   max(tree.max_depth for tree in trees),
+                   forest.classes_,
+                   getattr(forest, "feature_names_in_", None))
+
+    def check_input(self, X) -> np.ndarray:
+        """
+        Признаки как матрица float32 (как _validate_X_predict у sklearn)
+        """
+        names = getattr(X, "columns", None)
+        if names is not None and self.feature_names_in_ is not None \
+                and not np.array_equal(np.asarray(names, dtype=object), self.feature_names_in_):
+            raise ValueError("The feature names should match those that were passed during fit.")
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[-1]} features, but FlatForest "
+                             f"is expecting {self.n_features_in_} features as input.")
+        if np.isinf(X).any():
+            raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+        return X
+
+    def apply(self, X) -> np.ndarray:
+        """
+        Листы, в которые попадает каждый сигнал в каждом дереве
+        Returns:
+            np.ndarray: номера узлов (сигналы x деревья)
+        """
+        X = self.check_input(X)
+        # номер признака в X.ravel() - сдвиг строки + номер признака
+        offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+        values = X.ravel()
+        has_nan = np.isnan(values).any()
+        node = np.repeat(self.roots[None, :], len(X), axis=0)
+        for _ in range(self.depth):
+            x = values[offsets + self.feature[node]]
+            go_left = x <= self.threshold[node]
+            if has_nan:
+                nan = np.isnan(x)
+                go_left[nan] = self.missing_left[node[nan]]
+            node = self.children[2 * node + go_left]
+        return node
+
+    def predict_proba(self, X) -> np.ndarray:
+        """
+        Вероятности классов (сигналы x классы), как у RandomForestClassifier
+        """
+        leaves = self.apply(X)
+        # сумма по деревьям по порядку, начиная с первого (как в sklearn)
+        proba = np.add.reduce(self.value[leaves.T], axis=0)
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+def probe_rows(flat, n_rows, seed=0) -> np.ndarray:
+    """
+    Тестовые признаки: значения около порогов леса (чтобы пройти обе ветви
+    узлов), точно на порогах и немного NaN
+    """
+    rng = np.random.default_rng(seed)
+    inner = np.isfinite(flat.threshold)
+    X = np.zeros((n_rows, flat.n_features_in_))
+    for f in range(flat.n_features_in_):
+        thresholds = flat.threshold[inner & (flat.feature == f)]
+        if len(thresholds) == 0:
+            X[:, f] = rng.normal(size=n_rows)
+            continue
+        X[:, f] = rng.choice(thresholds, n_rows)
+        spread = thresholds.std() + 1e-3
+        X[:, f] += rng.choice([0.0, 1.0], n_rows) * rng.normal(0, spread, n_rows)
+    X[rng.random(X.shape) < 0.01] = np.nan
+    return X
+
+if __name__ == "__main__":
+    import joblib
+    import pandas as pd
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model_path", help="Pipeline с шагом classifier (или сам лес)")
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+    model = joblib.load(args.model_path)
+    forest = model["classifier"] if hasattr(model, "steps") else model
+    flat = FlatForest.from_sklearn(forest)
+    X = probe_rows(flat, args.rows)
+    if flat.feature_names_in_ is not None:
+        X = pd.DataFrame(X, columns=flat.feature_names_in_)
+    expected = forest.predict_proba(X)
+    assert np.array_equal(flat.predict_proba(X), expected), "FlatForest differs from sklearn"
+    for i in range(min(50, args.rows)):
+        assert np.array_equal(flat.predict_proba(X[i:i + 1]), expected[i:i + 1]), i
+    print(f"FlatForest matches predict_proba exactly on {args.rows} rows "
+          f"({len(flat.roots)} trees, {len(flat.feature)} nodes, depth {flat.depth})")
+    for name, estimator in (("sklearn", forest), ("flat", flat)):
+        start = time.perf_counter()
+        for i in range(100):
+            estimator.predict_proba(X[i % args.rows:i % args.rows + 1])
+        single = (time.perf_counter() - start) / 100
+        start = time.perf_counter()
+        estimator.predict_proba(X)
+        batch = time.perf_counter() - start
+        print(f"{name}: {1e3 * single:.3f} ms per row, {1e3 * batch:.1f} ms per {args.rows} rows")
@@ -1,10 +1,12 @@
 import sys
+import time
 import numpy as np
 import json
 from detector import Detector
 from cropper import Cropper
 from classifier import Classifier
-from saver import Saver
+from worker import InferenceWorker
+from metrics import Metrics
 
 script_folder  = 'scripts/'
 sys.path.append(script_folder)
@@ -22,8 +24,13 @@ class Mainloop():
     логи системы для дальнейшего просмотра, разметки при помощи GUI_viewer)
     """
     def __init__(self, model_path, indent_time = 500, cooling_time=1000, max_time=10000,
-                 threshold=2, plotting=False, verbose=True,
-                 save_path=None, zone_num=None, max_files_count=250, saving=False):
+                 threshold=2, adaptive_horizon=None, onset_window=None, plotting=False, verbose=True,
+                 save_path=None, zone_num=None, max_files_count=250, saving=False,
+                 channels=None, zone_nums=None, n_channels=10, frame_len=1000, fs=1000,
+                 inference_queue_size=8, metrics_path=None, metrics_interval=60,
+                 provisional_interval=None, native_features=True, feature_workers=0,
+                 batch_window=None, flat_forest=True,
+                 reload_interval=None):
         """
         Задает все необходимые параметры для Detector, Cropper, Preprocessor, Classifier
 
@@ -37,48 +44,210 @@ class Mainloop():
             По умолчанию = 10000.
             threshold (int, optional): Порог срабатывания детектора (превышение СКО).
             По умолчанию = 2.
+            adaptive_horizon (int, optional): Горизонт переоценки шума детектора, отсчетов
+            (см. Detector). По умолчанию None (шум оценивается один раз в первую секунду).
+            onset_window (int, optional): Окно (отсчетов) скользящего СКО детектора для
+            поиска точного начала тревоги (см. Detector). По умолчанию None (СКО по фрейму).
             plotting (bool, optional): Строить ли графики?  По умолчанию False.
             verbose (bool, optional): Выводить ли в консоль классификацию? По умолчанию True.
             save_path (str, optional): Путь для сохранения тревог (наборов датасетов).По умолчанию None
             zone_num (int, optional): Номер зоны охранной системы .По умолчанию None.
             max_files_count (int, optional): Максимальное кол-во тревог в одном файле. По умолчанию 250.
             saving (bool, optional): Сохранять ли тревоги в save_path? По умолчанию False.
+            channels (list[int], optional): Каналы интерферометра (из n_channels чередующихся
+            в stdin), которые нужно обрабатывать. У каждого канала свои Detector и Cropper.
+            По умолчанию [5] (центральный канал).
+            zone_nums (list, optional): Номера зон для каналов channels. По умолчанию
+            [zone_num] для одного канала и номера каналов для нескольких.
+            n_channels (int, optional): Кол-во чередующихся каналов в stdin. По умолчанию 10.
+            frame_len (int, optional): Кол-во отсчетов одного канала, приходящих за раз.
+            По умолчанию 1000.
+            fs (int, optional): Частота дискретизации (отсчетов в секунду). Нужна для
+            расчета отставания чтения от реального времени. По умолчанию 1000.
+            inference_queue_size (int, optional): Размер очереди фоновой классификации
+            (см. InferenceWorker). 0 - классификация в цикле чтения. По умолчанию 8.
+            metrics_path (str, optional): Файл, в который раз в metrics_interval секунд
+            дописываются гистограммы времени работы этапов (JSON lines, см. metrics.py).
+            По умолчанию None (замеры копятся, но не выгружаются).
+            metrics_interval (int, optional): Период выгрузки замеров, с. По умолчанию 60.
+            provisional_interval (int, optional): Период (в отсчетах сигнала тревоги)
+            предварительной классификации еще не закончившейся тревоги. Результат
+            выводится с пометкой "provisional": true, окончательная классификация -
+            как раньше, когда тревога закончится. По умолчанию None (выключено).
+            native_features (bool, optional): Считать признаки модели без tsfresh
+            (см. features.py). По умолчанию True.
+            feature_workers (int, optional): Кол-во процессов постоянного пула для
+            расчета признаков пачки тревог (см. feature_pool.py). Одна тревога
+            считается в этом процессе, n_jobs из обученной модели не используется.
+            По умолчанию 0 (без пула).
+            batch_window (float, optional): Окно сбора пачки тревог для фоновой
+            классификации, с: тревоги, пришедшие в очередь за это время после первой,
+            классифицируются одним вызовом (Classifier.predict_batch).
+            По умолчанию None (каждая тревога отдельно).
+            flat_forest (bool, optional): Считать случайный лес модели плоскими
+            массивами numpy (см. forest.py), результат тот же. По умолчанию True.
+            reload_interval (float, optional): Период проверки файла модели, с:
+            новая модель загружается в фоне и подменяет текущую между тревогами
+            без перезапуска (см. Classifier.refresh). По умолчанию None (выключено).
         """
-        self.detector = Detector(threshold)
-        self.cropper = Cropper(indent_time, cooling_time, max_time, detector=self.detector)
-        self.classifier = Classifier(model_path=model_path)
+        self.channels = list(channels) if channels is not None else [5]
+        if zone_nums is None:
+            zone_nums = [zone_num] if len(self.channels) == 1 else self.channels
+        assert len(zone_nums) == len(self.channels), "zone_nums must match channels"
+        self.zone_nums = list(zone_nums)
+        self.n_channels = n_channels
+        self.frame_len = frame_len
+        self.fs = fs
+        self.detectors = [Detector(threshold, adaptive_horizon, onset_window) for _ in self.channels]
+        self.croppers = [Cropper(indent_time, cooling_time, max_time, detector=detector,
+                                 provisional_interval=provisional_interval)
+                         for detector in self.detectors]
+        # состояние классификации еще не закончившейся тревоги по каждому каналу
+        # (см. Classifier.predict), None - предварительной классификации не было
+        self.prefixes = [None] * len(self.channels)
+        self.detector = self.detectors[0]
+        self.cropper = self.croppers[0]
+        self.classifier = Classifier(model_path=model_path, native_features=native_features,
+                                     feature_workers=feature_workers, flat_forest=flat_forest,
+                                     reload_interval=reload_interval)
         
         self.verbose = verbose
         self.plotting = plotting
         self.saving = saving
         if self.saving:
+            from saver import Saver # h5py нужен только при сохранении тревог
             assert save_path, "You should specify save path"
-            assert zone_num, "You should specify zone number"
-            self.saver = Saver(save_path, zone_num, max_files_count)
+            assert all(self.zone_nums), "You should specify zone number"
+            self.savers = [Saver(save_path, zone, max_files_count) for zone in self.zone_nums]
+            self.saver = self.savers[0]
+        self.worker = None
+        if inference_queue_size:
+            self.worker = InferenceWorker(self.classifier, self.report_alarm, inference_queue_size,
+                                          batch_window)
+        self.ingest_lag = 0.0 # отставание чтения stdin от реального времени, с
+        self.max_ingest_lag = 0.0
+        # замеры времени этапов: чтение, детектор, cropper, шаги pipeline, сохранение
+        self.metrics = Metrics(metrics_path, metrics_interval, extra=self.stats,
+                               labels={"zones": [str(zone) for zone in self.zone_nums]})
+        for detector in self.detectors:
+            detector.detect = self.metrics.wrap("detect", detector.detect)
+        self.classifier.instrument(self.metrics)
+    def read_frames(self, buffer: memoryview) -> bool:
+        """
+        Чтение из stdin ровно len(buffer) байт в заранее выделенный буфер
+        (без создания новых объектов bytes)
+        Returns:
+            bool: False, если поток закончился
+        """
+        filled = 0
+        while filled < len(buffer):
+            n = sys.stdin.buffer.readinto(buffer[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
     def start(self):
         """
         Метод для запуска системы. В бесконечном цикле происходит чтение
         из буффера (в буффер данные идут через драйвер Кирилла), затем 
         вызывается происходит обрезка и классификация
-        
-        central_chl - выбор центрального канала интерферометра
+
+        В stdin приходят float64 отсчеты n_channels чередующихся каналов
+        интерферометра. Данные читаются в один заранее выделенный буфер,
+        который без копирования представляется в виде матрицы
+        (отсчеты x каналы), каждый канал из channels передается своему Cropper.
+        Так один процесс обслуживает все зоны потока.
         """
-        while True:
-            buffer_data = sys.stdin.buffer.read(80000)
-            current_data = np.frombuffer(buffer_data)
-            current_data = current_data[5:10000:10]
-            self.stored_signal = self.cropper(current_data)
-            if self.stored_signal is None:
-                pass
+        buffer = bytearray(self.frame_len * self.n_channels * np.dtype(np.float64).itemsize)
+        frames = np.frombuffer(buffer, dtype=np.float64).reshape(self.frame_len, self.n_channels)
+        frames_count = 0
+        with memoryview(buffer) as view:
+            while True:
+                with self.metrics.timer("read"):
+                    if not self.read_frames(view):
+                        break
+                if frames_count == 0:
+                    start_time = time.monotonic()
+                frames_count += 1
+                # прошедшее время минус длительность прочитанных данных
+                self.ingest_lag = (time.monotonic() - start_time) - (frames_count - 1) * self.frame_len / self.fs
+                self.max_ingest_lag = max(self.max_ingest_lag, self.ingest_lag)
+                for i, channel in enumerate(self.channels):
+                    # без копирования: Cropper сам переписывает отсчеты в свой
+                    # буфер тревоги и pre-roll, view на буфер чтения не хранит
+                    current_data = frames[:, channel]
+                    with self.metrics.timer("crop"):
+                        self.stored_signal = self.croppers[i](current_data)
+                    if self.croppers[i].provisional_signal is not None:
+                        self.process_alarm(self.croppers[i].provisional_signal, i, provisional=True)
+                    if self.stored_signal is not None:
+                        self.process_alarm(self.stored_signal, i)
+                self.metrics.maybe_export()
+        if self.worker is not None:
+            self.worker.close()
+        self.classifier.close()
+        if self.metrics.path is not None:
+            self.metrics.export()
+    def process_alarm(self, signal, zone_idx=0, provisional=False):
+        """
+        Классификация обрезанного сигнала и вывод/сохранение результата.
+        Если включена фоновая классификация, сигнал только ставится в очередь.
+        Args:
+            signal (np.ndarray): сигнал после Cropper
+            zone_idx (int, optional): индекс канала в self.channels. По умолчанию 0.
+            provisional (bool, optional): предварительная классификация еще
+            не закончившейся тревоги. По умолчанию False.
+        """
+        # предварительные и окончательная классификации одной тревоги используют
+        # общее состояние, чтобы не пересчитывать то, что зависит только от начала сигнала
+        prefix = self.prefixes[zone_idx]
+        if provisional and prefix is None:
+            prefix = self.prefixes[zone_idx] = {}
+        elif not provisional:
+            self.prefixes[zone_idx] = None
+        if self.worker is not None:
+            self.worker.submit(signal, zone_idx, provisional, prefix=prefix, low_priority=provisional)
+        else:
+            self.classifier.refresh()
+            self.report_alarm(signal, self.classifier.predict(signal, prefix), zone_idx, provisional)
+    def report_alarm(self, signal, predictions, zone_idx=0, provisional=False):
+        """
+        Вывод в консоль, сохранение и отрисовка результата классификации
+        (предварительный результат только выводится)
+        """
+        if self.verbose:
+            if len(self.channels) == 1 and not provisional:
+                print(json.dumps(predictions))
+            elif len(self.channels) == 1:
+                print(json.dumps({"provisional": True, "predictions": predictions}))
             else:
-                predictions = self.classifier.predict(self.stored_signal)
-                if self.verbose:
-                    print(json.dumps(predictions))
-                    sys.stdout.flush()
-                if self.saving:
-                    self.saver.save_alarm(self.stored_signal, predictions)
-                if self.plotting:
-                    self.classifier.plot(self.stored_signal, predictions)
+                message = {"zone": self.zone_nums[zone_idx], "predictions": predictions}
+                if provisional:
+                    message["provisional"] = True
+                print(json.dumps(message))
+            sys.stdout.flush()
+        if provisional:
+            return
+        if self.saving:
+            with self.metrics.timer("save"):
+                self.savers[zone_idx].save_alarm(signal, predictions, self.classifier.model_version)
+        if self.plotting:
+            self.classifier.plot(signal, predictions)
+    def stats(self) -> dict:
+        """
+        Счетчики работы: отставание чтения от реального времени, текущий
+        шум и отсеянные тревоги детекторов, состояние очереди фоновой классификации
+        """
+        stats = {"ingest_lag": self.ingest_lag, "max_ingest_lag": self.max_ingest_lag,
+                 "noise_std": [float(detector.noise_std) if detector.is_fitted else None
+                               for detector in self.detectors]}
+        if self.detectors[0].adaptive_horizon:
+            # без адаптации теневые счетчики тревог не ведутся (см. Cropper.track_static_alarm)
+            stats["avoided_alarms"] = sum(cropper.static_alarms - cropper.alarms for cropper in self.croppers)
+        if self.worker is not None:
+            stats.update(self.worker.stats())
+        stats.update(self.classifier.stats())
+        return stats
     def start_test(self, path_to_test_signal:str, step:int=1000):
         """
         Тестовая программа для проверки работы системы.
@@ -115,6 +284,67 @@ class Mainloop():
                 if self.saving:
                     self.saver.save_alarm(self.stored_signal, predictions)
             curr_idx += step
+    def start_benchmark(self, path_to_test_signal:str, step:int=1000, repeat:int=1) -> dict:
+        """
+        Замер производительности на записанном сигнале (режим start_test без
+        отладочного вывода): запись прогоняется через Detector -> Cropper ->
+        Classifier -> Saver (если saving=True) так быстро, как возможно.
+        Классификация выполняется в цикле (без InferenceWorker).
+
+        Задержка тревоги считается так, как она была бы в реальном времени:
+        от срабатывания детектора (конец фрейма, на котором началась тревога,
+        раньше детектор ее увидеть не может) до результата классификации,
+        то есть время записи до фрейма, закрывшего тревогу (по отсчетам
+        записи, / fs), плюс время его обработки.
+        
+        Args:
+            path_to_test_signal (str): Путь до файла .npy с записанным сигналом
+            step (int, optional): Размер порции данных, поступающих за раз.
+            По умолчанию 1000.
+            repeat (int, optional): Сколько раз прогнать запись. По умолчанию 1.
+
+        Returns:
+            dict: samples_per_s - обработано отсчетов в секунду,
+            realtime_factor - во сколько раз быстрее реального времени (оценка того,
+            сколько зон выдержит одно ядро), alarms - кол-во тревог,
+            latency_p50/p95/p99 - задержка тревоги от срабатывания детектора (с),
+            processing_p50/p95/p99 - время обработки фрейма, закрывшего тревогу (с)
+        """
+        test_data = np.load(path_to_test_signal)
+        latencies = []
+        processing = []
+        samples = 0
+        alarm_start = None # отсчет записи, на котором детектор увидел тревогу
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for curr_idx in range(0, len(test_data), step):
+                current_data = test_data[curr_idx: curr_idx + step]
+                frame_end = samples + len(current_data)
+                was_alarm = self.cropper.alarm_flag
+                frame_time = time.perf_counter()
+                stored_signal = self.cropper(current_data)
+                samples = frame_end
+                closed_start = alarm_start # начало тревоги, которую мог закрыть этот фрейм
+                if self.cropper.alarm_flag and not was_alarm:
+                    # Cropper открыл тревогу на этом фрейме
+                    alarm_start = frame_end
+                if stored_signal is None:
+                    continue
+                predictions = self.classifier.predict(stored_signal)
+                if self.saving:
+                    self.saver.save_alarm(stored_signal, predictions)
+                processing.append(time.perf_counter() - frame_time)
+                latencies.append((frame_end - closed_start) / self.fs + processing[-1])
+        elapsed = time.perf_counter() - start
+        result = {"samples": samples,
+                  "seconds": elapsed,
+                  "samples_per_s": samples / elapsed,
+                  "realtime_factor": samples / elapsed / self.fs,
+                  "alarms": len(latencies)}
+        for name, values in (("latency", latencies), ("processing", processing)):
+            for q in (50, 95, 99):
+                result[f"{name}_p{q}"] = float(np.percentile(values, q)) if values else None
+        return result
         
 if __name__ == "__main__":
     # Пример запуска
@@ -0,0 +1,73 @@
+import numpy as np
+
+class RingBuffer():
+    """
+    Кольцевой буфер фиксированной емкости для матрицы рефлектограмм
+    (время x позиция на трассе).
+
+    Память выделяется один раз. Каждая строка хранится в двух копиях
+    (в позиции i и i + capacity), поэтому последние N строк всегда лежат
+    в памяти непрерывно и отдаются в виде view без копирования.
+    Добавление блока numTraces x traceSize стоит O(numTraces) независимо
+    от емкости буфера (никаких vstack и перевыделений памяти).
+    """
+    def __init__(self, capacity: int, width: int, dtype=np.uint16):
+        """
+        Args:
+            capacity (int): максимальное кол-во хранимых строк (рефлектограмм)
+            width (int): длина одной рефлектограммы (traceSize)
+            dtype (optional): тип данных. По умолчанию np.uint16.
+        """
+        self.capacity = capacity
+        self.width = width
+        self.data = np.zeros((2 * capacity, width), dtype=dtype)
+        self.head = 0 # позиция для записи следующей строки (0 <= head < capacity)
+        self.count = 0 # сколько строк записано за все время работы
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, block: np.ndarray):
+        """
+        Добавление блока рефлектограмм в буфер
+        Args:
+            block (np.ndarray): матрица numTraces x traceSize
+        """
+        if block.shape[0] > self.capacity:
+            # в буфер все равно поместятся только последние capacity строк
+            block = block[-self.capacity:]
+        n = block.shape[0]
+        cap = self.capacity
+        head = self.head
+        # основная копия: в удвоенном буфере запись никогда не выходит за край
+        self.data[head:head + n] = block
+        # зеркальная копия
+        if head + n <= cap:
+            self.data[head + cap:head + n + cap] = block
+        else:
+            split = cap - head
+            self.data[head + cap:] = block[:split]
+            self.data[:n - split] = block[split:]
+        self.head = (head + n) % cap
+        self.count += n
+
+    def last(self, n: int) -> np.ndarray:
+        """
+        Последние n строк буфера (view, без копирования)
+        Args:
+            n (int): кол-во строк, не больше capacity
+        Returns:
+            np.ndarray: матрица n x traceSize (старые строки сверху)
+        """
+        n = min(n, len(self))
+        end = self.head + self.capacity
+        return self.data[end - n:end]
+
+    def channel(self, channel: int, n: int) -> np.ndarray:
+        """
+        Последние n отсчетов одной позиции на трассе (view, без копирования)
+        Args:
+            channel (int): номер позиции на трассе (канала)
+            n (int): кол-во отсчетов
+        """
+        return self.last(n)[:, channel]
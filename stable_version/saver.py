@@ -21,12 +21,13 @@ class Saver():
         self.save_path = save_path
         self.zone_num = zone_num
         self.max_files_count = max_files_count
-    def save_alarm(self, signal, probabilities):
+    def save_alarm(self, signal, probabilities, model_version=None):
         """
         Сохранение сырого сигнала, вероятностей классификатора
         Args:
             signal (np.ndarray): сигнал который привел к возникновению тревоги
             probabilities (_type_): dict в формате {имя_класса: вероятность_класса}
+            model_version (str, optional): версия модели, которая дала probabilities
         """
         now = datetime.now()
         date = now.strftime("%Y_%m_%d")
@@ -62,6 +63,8 @@ class Saver():
                     
             dataset = file.create_dataset(f"alarm {current_index:05d}", data=np.array(signal))
             dataset.attrs["probabilities"] = json.dumps(probabilities)
+            if model_version is not None:
+                dataset.attrs["model_version"] = model_version
             now = datetime.now()
             dt_string = now.strftime("%d/%m/%Y %H:%M:%S")
             dataset.attrs["date_time"] = dt_string
\ No newline at end of file
@@ -1,13 +1,39 @@
 import os
 import sys
 import json
+import time
+import importlib
+import traceback
+started = time.perf_counter()
 scripts_folder = "scripts/"
-sys.path.append(scripts_folder) # add folder with scripts to PATH 
+sys.path.append(scripts_folder) # add folder with scripts to PATH
 script_curdir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_curdir)
 
+max_restarts = 10 # сколько раз можно перезапустить Mainloop после падения
 
-from mainloop import Mainloop
+def timed_import(name, report):
+    """
+    Импорт модуля name с записью времени импорта (с) в report.
+    Модули импортируются по очереди, поэтому время каждого - это время
+    только тех его зависимостей, которые еще не были импортированы
+    """
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    report[name] = round(time.perf_counter() - start, 3)
+    return module
+
+def log(message: dict):
+    """
+    Служебные сообщения пишутся в stderr: stdout занят результатами классификации
+    """
+    print(json.dumps(message), file=sys.stderr)
+    sys.stderr.flush()
+
+import_report = {}
+for name in ("numpy", "pandas", "sklearn", "tsfresh"):
+    timed_import(name, import_report)
+Mainloop = timed_import("mainloop", import_report).Mainloop
 
 if __name__ == '__main__':
 
@@ -15,13 +41,36 @@ if __name__ == '__main__':
         zone_num = sys.argv[1]  # 1-st argument from command line
     else:
         raise Exception("you must specify zone number as argument in command line")
-        
+
     with open("classifier_config.json", "r", encoding="utf-8") as file:
         config = json.load(file)
         config["zone_num"] = zone_num
-    
-    mainloop = Mainloop(**config)
-    mainloop.start()
 
+    start = time.perf_counter()
+    mainloop = Mainloop(**config)
+    log({"startup": {"imports": import_report,
+                     "model_load": round(time.perf_counter() - start, 3),
+                     "parallelism": mainloop.classifier.parallelism,
+                     "total": round(time.perf_counter() - started, 3)}})
 
-    
+    # При падении Mainloop пересоздается в этом же процессе: модули уже
+    # импортированы, поэтому перезапуск занимает только загрузку модели,
+    # а чтение stdin продолжается с того же места
+    restarts = 0
+    while True:
+        try:
+            mainloop.start()
+            break
+        except Exception:
+            traceback.print_exc()
+            restarts += 1
+            if restarts > max_restarts:
+                raise
+            if mainloop.worker is not None:
+                mainloop.worker.close(wait=False)
+            # иначе поток проверки model_path старого Classifier живет до конца процесса
+            mainloop.classifier.close()
+            start = time.perf_counter()
+            mainloop = Mainloop(**config)
+            log({"restart": {"count": restarts,
+                             "seconds": round(time.perf_counter() - start, 3)}})
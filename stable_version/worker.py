@@ -0,0 +1,157 @@
+import sys
+import time
+import queue
+import threading
+import traceback
+
+class InferenceWorker():
+    """
+    Фоновый поток классификации. Цикл чтения данных только кладет обрезанный
+    сигнал в ограниченную очередь и сразу возвращается к чтению, а
+    Classifier.predict (tsfresh, модель) выполняется в отдельном потоке.
+    Так пока считаются признаки для длинной тревоги, stdin (или сокет)
+    продолжает вычитываться и буфер драйвера не переполняется.
+
+    Если очередь заполнена (классификатор не успевает), новая тревога
+    отбрасывается и учитывается в счетчике dropped.
+
+    Если задано batch_window, тревоги, пришедшие за batch_window секунд
+    после первой (например, порыв ветра вызвал тревоги сразу на многих зонах),
+    классифицируются одним вызовом Classifier.predict_batch.
+    """
+    def __init__(self, classifier, callback, queue_size=8, batch_window=None):
+        """
+        Args:
+            classifier (Classifier): классификатор
+            callback (callable): функция callback(signal, predictions, *context),
+            которая вызывается в потоке классификации для каждого результата
+            queue_size (int, optional): максимальное кол-во тревог в очереди. По умолчанию 8.
+            batch_window (float, optional): окно сбора пачки, с (отсчитывается от
+            постановки в очередь первой тревоги пачки). По умолчанию None (по одной).
+        """
+        self.classifier = classifier
+        self.callback = callback
+        self.batch_window = batch_window
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.submitted = 0 # кол-во тревог, поставленных в очередь
+        self.dropped = 0 # кол-во тревог, отброшенных из-за переполнения очереди
+        self.processed = 0 # кол-во классифицированных тревог
+        self.failed = 0 # кол-во тревог, на которых классификация упала с ошибкой
+        self.last_wait = 0.0 # время ожидания последней тревоги в очереди, с
+        self.max_wait = 0.0 # максимальное время ожидания в очереди, с
+        self.batches = 0 # кол-во вызовов predict_batch
+        self.max_batch = 0 # наибольшая пачка
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, signal, *context, prefix=None, low_priority=False) -> bool:
+        """
+        Постановка тревоги в очередь классификации (не блокируется)
+        Args:
+            signal (np.ndarray): обрезанный после Cropper сигнал
+            context (optional): любые данные, которые нужно передать в callback
+            (например номер зоны)
+            prefix (dict, optional): состояние тревоги для Classifier.predict
+            (предварительная классификация, см. Classifier.predict)
+            low_priority (bool, optional): тревога ставится в очередь, только если
+            очередь заполнена меньше чем наполовину (место остается для
+            окончательных классификаций). По умолчанию False.
+        Returns:
+            bool: False, если очередь заполнена и тревога отброшена
+        """
+        if low_priority and 2 * self.queue.qsize() >= self.queue.maxsize:
+            self.dropped += 1
+            return False
+        try:
+            self.queue.put_nowait((signal, context, prefix, time.monotonic()))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def collect(self, job) -> tuple:
+        """
+        Пачка тревог: job и те, что придут в очередь до конца окна batch_window
+        Returns:
+            tuple: (список тревог, пришел ли сигнал остановки)
+        """
+        jobs = [job]
+        deadline = job[3] + self.batch_window
+        while len(jobs) < self.queue.maxsize:
+            try:
+                job = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if job is None:
+                return jobs, True
+            jobs.append(job)
+        return jobs, False
+
+    def run(self):
+        """
+        Цикл потока классификации
+        """
+        stop = False
+        while not stop:
+            job = self.queue.get()
+            if job is None:
+                break
+            jobs = [job]
+            if self.batch_window:
+                jobs, stop = self.collect(job)
+            # перезагруженная модель подменяется только между пачками:
+            # вся пачка классифицируется одной версией (Classifier.model_version)
+            self.classifier.refresh()
+            now = time.monotonic()
+            for _, _, _, enqueued in jobs:
+                self.last_wait = now - enqueued
+                self.max_wait = max(self.max_wait, self.last_wait)
+            # тревоги с состоянием предварительной классификации - по одной
+            batch = [job for job in jobs if job[2] is None] if len(jobs) > 1 else []
+            results = {}
+            if batch:
+                self.batches += 1
+                self.max_batch = max(self.max_batch, len(batch))
+                try:
+                    predictions = self.classifier.predict_batch([job[0] for job in batch])
+                    results = {id(job): p for job, p in zip(batch, predictions)}
+                except Exception:
+                    # например, один сигнал пачки испорчен: остальные считаем по одному
+                    traceback.print_exc(file=sys.stderr)
+            for job in jobs:
+                signal, context, prefix, _ = job
+                try:
+                    if id(job) in results:
+                        predictions = results[id(job)]
+                    else:
+                        predictions = self.classifier.predict(signal, prefix)
+                    self.callback(signal, predictions, *context)
+                except Exception:
+                    self.failed += 1
+                    traceback.print_exc(file=sys.stderr)
+                self.processed += 1
+
+    def close(self, wait=True):
+        """
+        Остановить поток после классификации всех тревог из очереди
+        Args:
+            wait (bool, optional): ждать ли завершения потока. По умолчанию True.
+        """
+        self.queue.put(None)
+        if wait:
+            self.thread.join()
+
+    def stats(self) -> dict:
+        """
+        Счетчики работы очереди классификации
+        """
+        return {"queue_depth": self.queue.qsize(),
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "processed": self.processed,
+                "failed": self.failed,
+                "queue_wait": self.last_wait,
+                "max_queue_wait": self.max_wait,
+                "batches": self.batches,
+                "max_batch": self.max_batch}
@@ -0,0 +1,44 @@
+'''
+Тесты запускаются из корня репозитория:
+    python -m pytest -q tests
+Модули импортируются из mp_version: там есть все общие модули
+(stable_version держит их копии, см. test_shared_modules.py) и многозонные.
+'''
+import os
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "mp_version"))
+
+from sklearn.pipeline import Pipeline, FeatureUnion
+from sklearn.ensemble import RandomForestClassifier
+from preprocessing import TimePreprocessing, CustomFeatureAugmenter, ColumnSorter
+
+def make_data(seed=0):
+    """
+    Обучающие сигналы двух классов: тихий и громкий шум
+    """
+    rng = np.random.default_rng(seed)
+    signals = [8000 + rng.normal(0, 50 * (1 + i % 2), int(rng.integers(500, 2000))) for i in range(20)]
+    return signals, np.array(["quiet", "loud"] * 10)
+
+def train(n_estimators, seed):
+    """
+    Маленький pipeline той же структуры, что в notebook: TimePreprocessing,
+    признаки tsfresh, ColumnSorter и случайный лес
+    """
+    signals, y = make_data()
+    pipeline = Pipeline([
+        ("features", FeatureUnion([
+            ("time", Pipeline([
+                ("pre", TimePreprocessing(std_window=32, mean_window=128, normilize=True)),
+                ("aug", CustomFeatureAugmenter(column_id="id", column_sort="time", disable_progressbar=True,
+                                               default_fc_parameters={"variance": None, "median": None})),
+            ])),
+        ])),
+        ("sort", ColumnSorter()),
+        ("classifier", RandomForestClassifier(n_estimators=n_estimators, random_state=seed)),
+    ])
+    pipeline.set_output(transform="pandas")
+    return pipeline.fit(signals, y)
@@ -0,0 +1,27 @@
+import os
+import numpy as np
+from artifact import export_model, load_model, read_manifest
+from conftest import make_data, train
+
+def test_reexport_keeps_loaded_model_consistent(tmp_path):
+    """
+    Повторное сохранение в тот же каталог: уже загруженная (отображенная
+    в память) модель не меняется, новая загрузка совпадает с новой моделью,
+    а в forest/ остаются только массивы текущего и прошлого manifest
+    """
+    path = str(tmp_path / "model.zbm")
+    signals, _ = make_data(seed=1)
+    first, second, third = train(5, 0), train(7, 1), train(9, 2)
+    export_model(first, path)
+    loaded = load_model(path)
+    first_files = set(read_manifest(path)["forest"]["arrays"].values())
+    export_model(second, path)
+    assert np.array_equal(loaded.predict_proba(signals), first.predict_proba(signals))
+    assert np.array_equal(load_model(path).predict_proba(signals), second.predict_proba(signals))
+    second_files = set(read_manifest(path)["forest"]["arrays"].values())
+    export_model(third, path)
+    third_files = set(read_manifest(path)["forest"]["arrays"].values())
+    stored = {f"forest/{name}" for name in os.listdir(os.path.join(path, "forest"))}
+    assert stored == second_files | third_files
+    assert not first_files & third_files
+    assert np.array_equal(load_model(path).predict_proba(signals), third.predict_proba(signals))
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from cropper import Cropper
+from detector import Detector
+from multizone import MultiCropper, MultiDetector
+from driver_simulator import make_stream
+
+@pytest.mark.parametrize("onset_window", [None, 50])
+@pytest.mark.parametrize("adaptive_horizon", [None, 20000])
+@pytest.mark.parametrize("frame_len", [1000, 250])
+def test_multicropper_matches_cropper(onset_window, adaptive_horizon, frame_len):
+    """
+    MultiCropper и Cropper на каждый канал отдают поотсчетно одинаковые
+    тревоги, в том числе после переполнения max_time (детектор видит и
+    фрейм переполнения, см. Cropper.__call__)
+    """
+    n_channels, n_samples = 16, 150_000
+    stream = make_stream(n_samples, n_channels, seed=1)
+    multi = MultiCropper(n_channels, 500, 1000, 10000,
+                         detector=MultiDetector(3, adaptive_horizon, onset_window))
+    croppers = [Cropper(500, 1000, 10000, detector=Detector(3, adaptive_horizon, onset_window))
+                for _ in range(n_channels)]
+    alarms = overflows = 0
+    for i in range(0, n_samples - frame_len + 1, frame_len):
+        frames = stream[i:i + frame_len]
+        results = dict(multi(frames))
+        for c, cropper in enumerate(croppers):
+            signal = cropper(frames[:, c])
+            assert (signal is None) == (c not in results), (i, c)
+            if signal is not None:
+                assert np.array_equal(signal, results[c]), (i, c)
+                alarms += 1
+                overflows += len(signal) > 10000
+    if adaptive_horizon:
+        # шум обновлялся на тех же фреймах (векторная и скалярная арифметика - до округления)
+        noise_std = [cropper.detector.noise_std for cropper in croppers]
+        np.testing.assert_allclose(noise_std, multi.detector.noise_std, rtol=1e-12)
+    assert overflows > 0 and alarms > overflows
+
+def test_multicropper_keeps_input_dtype():
+    """
+    Отсчеты прибора (uint16) набираются без перевода в float64:
+    сигналы тревог того же типа и те же, что у Cropper
+    """
+    n_channels, n_samples, frame_len = 8, 60_000, 1000
+    stream = make_stream(n_samples, n_channels, seed=2).clip(0, 65535).astype(np.uint16)
+    multi = MultiCropper(n_channels, 500, 1000, 10000, detector=MultiDetector(3))
+    croppers = [Cropper(500, 1000, 10000, detector=Detector(3)) for _ in range(n_channels)]
+    alarms = 0
+    for i in range(0, n_samples, frame_len):
+        frames = stream[i:i + frame_len]
+        results = dict(multi(frames))
+        for c, cropper in enumerate(croppers):
+            signal = cropper(frames[:, c])
+            assert (signal is None) == (c not in results), (i, c)
+            if signal is not None:
+                assert results[c].dtype == np.uint16
+                assert np.array_equal(signal, results[c]), (i, c)
+                alarms += 1
+    assert multi.cached_frames.dtype == np.uint16
+    assert alarms > 0
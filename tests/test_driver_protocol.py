@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from driver_protocol import DriverProtocol
+from driver_simulator import make_packet
+
+def feed(protocol, stream: bytes, rng, max_chunk):
+    """
+    Подача потока так, как это делает asyncio: кусками случайной длины
+    в буфер из get_buffer
+    """
+    position = 0
+    while position < len(stream):
+        buffer = protocol.get_buffer(-1)
+        n = min(len(buffer), int(rng.integers(1, max_chunk + 1)), len(stream) - position)
+        buffer[:n] = stream[position:position + n]
+        protocol.buffer_updated(n)
+        position += n
+
+def make_frames(rng, n_packets):
+    """
+    Пакеты двух размеров подряд сериями (заголовок то повторяется, то меняется)
+    """
+    shapes = [(4, 64), (3, 200)]
+    return [rng.integers(0, 16000, size=shapes[(i // 5) % 2], dtype=np.uint16) for i in range(n_packets)]
+
+@pytest.mark.parametrize("max_chunk", [7, 300, 5000])
+def test_split_packets(max_chunk):
+    """
+    Пакеты, разрезанные на куски любой длины, в маленьком буфере (он
+    переносит хвост в начало и растет) приходят целиком; json.loads
+    вызывается только при смене заголовка
+    """
+    rng = np.random.default_rng(max_chunk)
+    frames = make_frames(rng, 40)
+    received = []
+    protocol = DriverProtocol(lambda data, header: received.append((data.copy(), header)), buffer_size=64)
+    feed(protocol, b"".join(make_packet(frame) for frame in frames), rng, max_chunk)
+    assert len(received) == len(frames) == protocol.packets
+    for frame, (data, header) in zip(frames, received):
+        assert np.array_equal(data, frame)
+        assert (header["numTraces"], header["traceSize"]) == frame.shape
+    assert protocol.header_parses == 8 # 40 пакетов сериями по 5
+    assert protocol.errors == 0
+    assert len(protocol.buffer) > 64
+    assert protocol.start == protocol.end == 0
+
+def test_varying_header_is_parsed_every_time():
+    rng = np.random.default_rng(0)
+    frames = make_frames(rng, 10)
+    received = []
+    protocol = DriverProtocol(lambda data, header: received.append(header["packetNum"]))
+    feed(protocol, b"".join(make_packet(frame, {"packetNum": i}) for i, frame in enumerate(frames)), rng, 1000)
+    assert received == list(range(10))
+    assert protocol.header_parses == 10
+
+@pytest.mark.parametrize("seed", range(5))
+def test_resync_after_garbage(seed):
+    """
+    Мусор между пакетами (в том числе с b'\\0'): теряется только пакет
+    сразу после мусора (его заголовок склеился с мусором), остальные
+    приходят без изменений
+    """
+    rng = np.random.default_rng(seed)
+    frames = make_frames(rng, 60)
+    corrupted = set(rng.choice(np.arange(1, len(frames)), 8, replace=False).tolist())
+    stream = []
+    for i, frame in enumerate(frames):
+        if i in corrupted:
+            garbage = rng.integers(1, 256, int(rng.integers(1, 40)), dtype=np.uint8)
+            if rng.random() < 0.5:
+                garbage[rng.integers(len(garbage))] = 0
+            stream.append(garbage.tobytes())
+        stream.append(make_packet(frame))
+    received = []
+    protocol = DriverProtocol(lambda data, header: received.append(data.copy()), buffer_size=256)
+    feed(protocol, b"".join(stream), rng, 700)
+    expected = [frame for i, frame in enumerate(frames) if i not in corrupted]
+    assert len(received) == len(expected)
+    for frame, data in zip(expected, received):
+        assert np.array_equal(data, frame)
+    assert protocol.errors == len(corrupted)
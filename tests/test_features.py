@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+import features
+from preprocessing import TimePreprocessing, FreqPreprocessing, CustomFeatureAugmenter, MyCustomFeatures
+
+def make_signals(n_signals=12, seed=0):
+    """
+    Сигналы, похожие на тревоги (импульс, синусоида с середины, случайное
+    блуждание), и два коротких; целые отсчеты прибора дают равные значения
+    """
+    rng = np.random.default_rng(seed)
+    signals = []
+    for i in range(n_signals):
+        n = int(rng.integers(300, 6000)) if i > 1 else (40, 250)[i]
+        x = 8000 + rng.normal(scale=50, size=n)
+        if i % 3 == 0:
+            x[n // 3:n // 3 + 50] += rng.normal(scale=2000, size=min(50, n - n // 3))
+        elif i % 3 == 1:
+            x += 800 * np.sin(np.arange(n) / 7) * (np.arange(n) > n // 4)
+        else:
+            x += np.cumsum(rng.normal(scale=20, size=n))
+        signals.append(np.round(x) if i % 2 else x)
+    return signals
+
+def make_steps():
+    return {
+        "time": (TimePreprocessing(std_window=32, mean_window=128, normilize=True),
+                 CustomFeatureAugmenter(column_id="id", column_sort="time", disable_progressbar=True, n_jobs=0,
+                                        kind_to_fc_parameters=MyCustomFeatures.time_features)),
+        "freq": (FreqPreprocessing(n_bins=70, fs=1000),
+                 CustomFeatureAugmenter(column_id="id", column_sort="freq_num", disable_progressbar=True, n_jobs=0,
+                                        default_fc_parameters=MyCustomFeatures.freq_features)),
+    }
+
+def transform_both(preprocessing, augmenter, signal) -> tuple:
+    """
+    Признаки сигнала через tsfresh и через features.py
+    """
+    long_df = pd.DataFrame({"id": 0, "time": range(len(signal)), "signal_raw": signal})
+    df = preprocessing.transform(long_df.copy())
+    results = []
+    for native in (False, True):
+        augmenter.native = native
+        results.append(augmenter.transform(df))
+    return tuple(results)
+
+def assert_same_features(expected, actual):
+    assert list(expected.columns) == list(actual.columns)
+    assert list(expected.index) == list(actual.index)
+    a, b = expected.to_numpy(dtype=np.float64), actual.to_numpy(dtype=np.float64)
+    close = np.isclose(a, b, rtol=1e-9, atol=1e-9, equal_nan=True)
+    assert close.all(), [(column, x, y) for column, x, y, ok
+                         in zip(expected.columns, a[0], b[0], close[0]) if not ok]
+
+@pytest.mark.parametrize("kind", ["time", "freq"])
+def test_native_features_match_tsfresh(kind):
+    """
+    features.py дает те же имена признаков, что tsfresh, и значения до 1e-9
+    """
+    preprocessing, augmenter = make_steps()[kind]
+    assert augmenter.native_parameters() is not None
+    for signal in make_signals():
+        assert_same_features(*transform_both(preprocessing, augmenter, signal))
+
+def test_unsupported_calculator_falls_back_to_tsfresh():
+    """
+    Калькулятор, которого нет в features.py: признаки считает tsfresh
+    (и с native = True результат тот же, что без него)
+    """
+    fc_parameters = {**MyCustomFeatures.freq_features, "sample_entropy": None}
+    assert "sample_entropy" not in features.CALCULATORS
+    assert not features.supported(fc_parameters)
+    preprocessing = FreqPreprocessing(n_bins=70, fs=1000)
+    augmenter = CustomFeatureAugmenter(column_id="id", column_sort="freq_num", disable_progressbar=True,
+                                       n_jobs=0, default_fc_parameters=fc_parameters)
+    assert augmenter.native_parameters() is None
+    expected, actual = transform_both(preprocessing, augmenter, make_signals(3)[2])
+    assert any(column.endswith("__sample_entropy") for column in actual.columns)
+    assert_same_features(expected, actual)
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier, ExtraTreesClassifier
+from forest import FlatForest, probe_rows
+
+def train_forest(estimator_type, with_nan, seed=0):
+    """
+    Лес на 3 класса; with_nan - в обучении есть пропуски (узлы с missing_go_to_left)
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(400, 6))
+    y = (X[:, 0] + X[:, 1] > 0).astype(int) + (X[:, 2] > 1)
+    if with_nan:
+        X[rng.random(X.shape) < 0.1] = np.nan
+    columns = [f"feature_{i}" for i in range(X.shape[1])]
+    forest = estimator_type(n_estimators=15, max_depth=8, random_state=seed)
+    return forest.fit(pd.DataFrame(X, columns=columns), y)
+
+def edge_rows(flat) -> np.ndarray:
+    """
+    Значения на границе float32: пороги, соседние с ними float64 (после
+    приведения к float32 они могут оказаться на пороге), наибольшее
+    и наименьшее float32, денормализованные числа, -0.0 и NaN
+    """
+    thresholds = flat.threshold[np.isfinite(flat.threshold)]
+    special = np.array([np.finfo(np.float32).max, -np.finfo(np.float32).max, np.finfo(np.float32).tiny,
+                        np.finfo(np.float32).smallest_subnormal, -0.0, 0.0, np.nan])
+    values = np.concatenate([thresholds, np.nextafter(thresholds, np.inf), np.nextafter(thresholds, -np.inf),
+                             thresholds.astype(np.float32).astype(np.float64) + 1e-12, special])
+    rng = np.random.default_rng(1)
+    return rng.choice(values, (len(values), flat.n_features_in_))
+
+@pytest.mark.parametrize("estimator_type, with_nan", [(RandomForestClassifier, False),
+                                                       (RandomForestClassifier, True),
+                                                       (ExtraTreesClassifier, False)])
+def test_flat_forest_matches_sklearn(estimator_type, with_nan):
+    """
+    predict_proba FlatForest бит в бит совпадает с sklearn: пачкой и по одной
+    строке, на строках около порогов, с NaN (ExtraTreesClassifier NaN
+    не принимает) и на краевых значениях float32
+    """
+    forest = train_forest(estimator_type, with_nan)
+    flat = FlatForest.from_sklearn(forest)
+    for X in (probe_rows(flat, 500), edge_rows(flat)):
+        if estimator_type is ExtraTreesClassifier:
+            X = np.nan_to_num(X, nan=0.0, posinf=np.inf, neginf=-np.inf)
+        X = pd.DataFrame(X, columns=forest.feature_names_in_)
+        expected = forest.predict_proba(X)
+        assert np.array_equal(flat.predict_proba(X), expected)
+        for i in range(20):
+            assert np.array_equal(flat.predict_proba(X.iloc[i:i + 1]), expected[i:i + 1])
+        assert np.array_equal(flat.predict(X), forest.predict(X))
+
+@pytest.mark.filterwarnings("ignore:overflow encountered in cast:RuntimeWarning")
+def test_flat_forest_rejects_what_sklearn_rejects():
+    """
+    Бесконечности, значения вне float32, чужой порядок колонок и
+    другое кол-во признаков - ошибка, как у sklearn
+    """
+    forest = train_forest(RandomForestClassifier, with_nan=True)
+    flat = FlatForest.from_sklearn(forest)
+    X = pd.DataFrame(probe_rows(flat, 5), columns=forest.feature_names_in_)
+    for value in (np.inf, -np.inf, 1e39): # 1e39 не помещается во float32
+        bad = X.copy()
+        bad.iloc[2, 3] = value
+        with pytest.raises(ValueError):
+            forest.predict_proba(bad)
+        with pytest.raises(ValueError):
+            flat.predict_proba(bad)
+    with pytest.raises(ValueError):
+        flat.predict_proba(X[X.columns[::-1]])
+    with pytest.raises(ValueError):
+        flat.predict_proba(X.to_numpy()[:, :-1])
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from cropper import Cropper
+from detector import Detector
+from driver_simulator import make_stream
+
+jit_cropper = pytest.importorskip("jit_cropper") # numba нужен только для JitCropper
+
+@pytest.mark.parametrize("frame_len", [1000, 250, 137])
+def test_jit_cropper_matches_cropper(frame_len):
+    """
+    JitCropper и Cropper на каждый канал отдают поотсчетно одинаковые тревоги,
+    в том числе переполнившие max_time. Onset_window и адаптивный шум JitCropper
+    не поддерживает (их сверяет с Cropper test_cropper.py для MultiCropper)
+    """
+    n_channels, n_samples = 16, 150_000
+    stream = make_stream(n_samples, n_channels, seed=1)
+    jit = jit_cropper.JitCropper(n_channels, 500, 1000, 10000, threshold=3)
+    croppers = [Cropper(500, 1000, 10000, detector=Detector(3)) for _ in range(n_channels)]
+    alarms = overflows = 0
+    for i in range(0, n_samples - frame_len + 1, frame_len):
+        frames = stream[i:i + frame_len]
+        results = dict(jit(frames))
+        for c, cropper in enumerate(croppers):
+            signal = cropper(frames[:, c])
+            assert (signal is None) == (c not in results), (i, c)
+            if signal is not None:
+                assert np.array_equal(signal, results[c]), (i, c)
+                alarms += 1
+                overflows += len(signal) > 10000
+    assert overflows > 0 and alarms > overflows
@@ -0,0 +1,95 @@
+import joblib
+import numpy as np
+from multizone import MultiCropper, MultiDetector, EventMerger, MultiMainloop
+from preprocessing import TimePreprocessing
+from conftest import train
+
+def merge_stream(stream, merger, frame_len=1000):
+    """
+    Обрезка потока MultiCropper и объединение тревог EventMerger
+    (как в MultiMainloop.receive)
+    Returns:
+        tuple: (закончившиеся тревоги, выданные группы, наибольшее кол-во ждущих тревог)
+    """
+    cropper = MultiCropper(stream.shape[1], 500, 1000, 10000, detector=MultiDetector(3))
+    samples = 0
+    finished_alarms, groups, max_pending = [], [], 0
+    for i in range(0, len(stream), frame_len):
+        finished = cropper(stream[i:i + frame_len])
+        end = samples
+        samples += frame_len
+        open_channels = np.flatnonzero(cropper.alarm_flag)
+        open_starts = samples - cropper.cached_len[open_channels]
+        finished_alarms.extend(finished)
+        groups.extend(merger(finished, end, open_channels, open_starts, samples))
+        max_pending = max(max_pending, len(merger.pending))
+    return finished_alarms, groups, max_pending
+
+def test_merger_flushes_staggered_activity():
+    """
+    Непрерывные воздействия на соседних каналах, начавшиеся в разное время:
+    тревоги каналов переполняют max_time вразнобой и цепочка связанных
+    тревог не заканчивается. Группы все равно выдаются (не позже max_wait),
+    а ждущих тревог не больше нескольких
+    """
+    rng = np.random.default_rng(0)
+    n_samples = 220_000
+    stream = 8000 + rng.normal(0, 10, (n_samples, 2))
+    stream[5000:205_000, 0] += rng.normal(0, 300, 200_000)
+    stream[8000:208_000, 1] += rng.normal(0, 300, 200_000)
+    merger = EventMerger(np.array([10, 11]), distance=1, max_wait=11000)
+    finished, groups, max_pending = merge_stream(stream, merger)
+    assert len(finished) > 20
+    assert len(groups) > 10 and merger.timeouts > 0
+    assert max_pending <= 4
+    # каждая тревога выдана ровно один раз
+    assert sum(len(group) for group in groups) == len(finished)
+    assert not merger.pending
+
+def test_merger_groups_simultaneous_neighbours():
+    """
+    Одно короткое воздействие на соседних каналах - одна группа,
+    далекий канал - отдельно
+    """
+    rng = np.random.default_rng(1)
+    stream = 8000 + rng.normal(0, 10, (30_000, 3))
+    stream[10_000:12_000, :2] += rng.normal(0, 300, (2000, 2))
+    stream[10_500:11_000, 2] += rng.normal(0, 300, 500)
+    merger = EventMerger(np.array([10, 11, 20]), distance=1, max_wait=11000)
+    finished, groups, _ = merge_stream(stream, merger)
+    assert len(finished) == 3
+    assert sorted(sorted(int(c) for c, _ in group) for group in groups) == [[0, 1], [2]]
+    assert merger.timeouts == 0
+
+def test_held_alarm_does_not_share_prefix(tmp_path):
+    """
+    Закончившаяся тревога канала ждет соседа в EventMerger, а на канале
+    уже идет новая тревога: ее предварительная классификация начинается
+    с чистого prefix (скользящие статистики в нем - статистики этой тревоги)
+    """
+    model_path = str(tmp_path / "model.pkl")
+    joblib.dump(train(5, 0), model_path)
+    engine = MultiMainloop(model_path, None, channels=[10, 11], threshold=3, verbose=False,
+                           inference_queue_size=0, provisional_interval=2000, merge_distance=1)
+    rng = np.random.default_rng(2)
+    stream = 8000 + rng.normal(0, 10, (40_000, 12))
+    stream[10_000:13_000, 10] += rng.normal(0, 300, 3000)
+    stream[17_000:20_000, 10] += rng.normal(0, 300, 3000) # первая тревога канала еще ждет
+    stream[11_000:30_000, 11] += rng.normal(0, 300, 19_000)
+    rolling = TimePreprocessing(std_window=32, mean_window=128, normilize=False)
+    predict = engine.classifier.predict
+    calls = []
+    def checked_predict(signal, prefix=None):
+        result = predict(signal, prefix)
+        if prefix is not None:
+            expected = rolling.transform(np.asarray(signal, dtype=np.float64))
+            np.testing.assert_allclose(prefix["std"], expected.columns["signal_std"], rtol=1e-9)
+            calls.append(len(signal))
+        return result
+    engine.classifier.predict = checked_predict
+    for i in range(0, len(stream), 1000):
+        engine.receive(stream[i:i + 1000])
+        idle = np.flatnonzero(~engine.cropper.alarm_flag)
+        assert all(engine.prefixes[c] is None for c in idle)
+    assert len(calls) > 3
+    engine.classifier.close()
@@ -0,0 +1,24 @@
+import warnings
+import numpy as np
+import pytest
+from preprocessing import TimePreprocessing
+
+@pytest.mark.parametrize("normilize", [False, True])
+def test_transform_prefix_matches_transform(normilize):
+    """
+    Набор тревоги по кускам (предварительная классификация): transform_prefix
+    дает те же ряды, что transform всего сигнала; начало тревоги постоянное
+    (размах 0 - NaN без предупреждений numpy, как в transform)
+    """
+    rng = np.random.default_rng(0)
+    signal = np.r_[np.full(300, 8000.0), 8000 + np.cumsum(rng.normal(0, 20, 4000))]
+    step = TimePreprocessing(std_window=32, mean_window=128, normilize=normilize)
+    cache = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for end in (100, 300, 1000, 1001, 2500, len(signal)):
+            prefix = step.transform_prefix(signal[:end], cache)
+            expected = step.transform(signal[:end])
+            for name in ("signal_raw", "signal_std", "signal_mean"):
+                np.testing.assert_allclose(prefix.columns[name], expected.columns[name],
+                                           rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=f"{end} {name}")
@@ -0,0 +1,16 @@
+import os
+import pytest
+from conftest import ROOT
+
+SHARED = sorted(set(os.listdir(os.path.join(ROOT, "stable_version")))
+                & set(os.listdir(os.path.join(ROOT, "mp_version"))))
+
+@pytest.mark.parametrize("name", [name for name in SHARED if name.endswith(".py")])
+def test_copies_identical(name):
+    """
+    Общие модули stable_version и mp_version - одинаковые копии
+    (тесты проверяют копии из mp_version)
+    """
+    with open(os.path.join(ROOT, "stable_version", name), "rb") as stable, \
+         open(os.path.join(ROOT, "mp_version", name), "rb") as mp:
+        assert stable.read() == mp.read(), f"{name} differs between stable_version and mp_version"